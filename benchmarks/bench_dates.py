@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the syslog date to UNIX timestamp conversion.
+
+Compares the former `strptime` based conversion with the hand-written parser
+uncached and cached, replaying a stream where many messages share the same
+date string.
+
+    $ python benchmarks/bench_dates.py
+"""
+
+from __future__ import print_function
+
+import datetime
+import timeit
+
+from syslogng_kafka import util
+
+# 100 messages per second over 10 seconds.
+DATES = ['Jun 22 12:49:%02d' % (i // 100) for i in range(1000)]
+
+
+def legacy_date_str_to_timestamp(date_str):
+    """ `date_str_to_timestamp` as of 0.1.11. """
+    date = datetime.datetime.now()
+    msg = datetime.datetime.strptime(date_str, '%b %d %H:%M:%S')
+    date = date.replace(
+        year=date.year, month=msg.month, day=msg.day,
+        hour=msg.hour, minute=msg.minute, second=msg.second)
+    return date.strftime("%s")
+
+
+def run(func):
+    for date_str in DATES:
+        func(date_str)
+
+
+def bench(func, number=20, repeat=5):
+    """ Best time per date in microseconds. """
+    best = min(timeit.repeat(lambda: run(func), number=number, repeat=repeat))
+    return best / number / len(DATES) * 1e6
+
+
+def main():
+    for date_str in set(DATES):
+        assert legacy_date_str_to_timestamp(date_str) == \
+            util.date_str_to_timestamp(date_str)
+    results = [(name, bench(func)) for name, func in (
+        ('legacy', legacy_date_str_to_timestamp),
+        ('uncached', util._date_str_to_timestamp),
+        ('cached', util.date_str_to_timestamp))]
+    legacy = results[0][1]
+    for name, elapsed in results:
+        print("%-10s %6.2f us  speedup x%.2f" % (name, elapsed,
+                                                 legacy / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""End-to-end benchmark of `KafkaDestination` in the syslog-ng host emulator.
+
+Every scenario runs the destination through `init()`, `open()`, `send()`,
+`close()` and `deinit()` w/ a stub producer and reports messages per second,
+p50/p99 latency of `send()`, bytes produced per message, peak memory and
+blocks left allocated by the destination.
+
+    $ python benchmarks/bench_destination.py
+"""
+
+from __future__ import print_function
+
+from emulator import corpus
+from emulator import measure
+
+MESSAGES = 10000
+
+# `init()` configures the logger: only errors are logged during the runs
+BASE = {'hosts': '127.0.0.1', 'topic': 'syslog', 'log_level': 'ERROR'}
+
+# (name, corpus, options)
+SCENARIOS = (
+    ('firewall', 'firewall', {}),
+    ('nat', 'nat', {}),
+    ('generic', 'generic', {}),
+    ('mixed', 'mixed', {}),
+    ('mixed-filtered', 'mixed', {'programs': 'firewall,nat'}),
+    ('mixed-json', 'mixed', {'serializer': 'json'}),
+    ('mixed-key', 'mixed', {'msg_key': 'HOST'}),
+    ('mixed-batch', 'mixed', {'batch_lines': '500'}),
+    ('mixed-partition', 'mixed', {'partition_by': 'HOST'}),
+    ('mixed-routes', 'mixed', {
+        'routes': "[('PROGRAM', 'firewall', 'firewall'), "
+                  "('PROGRAM', 'nat', 'nat'), ('HOST', '10.1.*', 'lan')]"}),
+)
+
+COLUMNS = (('msg_per_s', 'msg/s', '%10.0f'), ('p50_us', 'p50 us', '%8.2f'),
+           ('p99_us', 'p99 us', '%8.2f'), ('bytes_per_msg', 'B/msg', '%7.1f'),
+           ('peak_kib_per_1k', 'KiB/1k', '%8.1f'),
+           ('retained_blocks', 'retained', '%9d'))
+
+
+def run(messages=MESSAGES, number=3):
+    """ Metrics by scenario name. """
+    corpora = {}
+    results = []
+    for name, corpus_name, options in SCENARIOS:
+        if corpus_name not in corpora:
+            corpora[corpus_name] = corpus(corpus_name, messages)
+        conf = dict(BASE)
+        conf.update(options)
+        results.append((name, measure(conf, corpora[corpus_name],
+                                      number=number)))
+    return results
+
+
+def report(results):
+    print('%-16s' % 'scenario' + ''.join(
+        ' %*s' % (len(fmt % 0), title) for _, title, fmt in COLUMNS))
+    for name, metrics in results:
+        print('%-16s' % name + ''.join(
+            ' ' + (fmt % metrics[key] if key in metrics else
+                   '%*s' % (len(fmt % 0), '-'))
+            for key, _, fmt in COLUMNS))
+
+
+def main():
+    report(run())
+
+
+if __name__ == '__main__':
+    main()
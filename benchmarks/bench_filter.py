@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the program filter w/ hundreds of entries.
+
+Compares the former linear scan of the `programs` list with `ProgramFilter`
+on exact names and on wildcard patterns.
+
+    $ python benchmarks/bench_filter.py
+"""
+
+from __future__ import print_function
+
+import random
+import timeit
+
+from syslogng_kafka.filters import ProgramFilter
+
+ENTRIES = 500
+
+PROGRAMS = ['program%03d' % i for i in range(ENTRIES)]
+
+# message stream: 80% of the messages match the filter, mostly late entries.
+random.seed(42)
+STREAM = [random.choice(PROGRAMS[ENTRIES // 2:]) if random.random() < 0.8
+          else 'other%d' % random.randint(0, 20) for _ in range(1000)]
+
+
+def run(accept):
+    for program in STREAM:
+        accept(program)
+
+
+def bench(accept, number=20, repeat=5):
+    """ Best time per message in microseconds. """
+    best = min(timeit.repeat(lambda: run(accept), number=number,
+                             repeat=repeat))
+    return best / number / len(STREAM) * 1e6
+
+
+def main():
+    legacy = PROGRAMS
+
+    def legacy_accept(program):
+        return program in legacy
+
+    patterns = ['program%02d*' % i for i in range(ENTRIES // 10)]
+    cases = (
+        ('legacy list', legacy_accept),
+        ('exact', ProgramFilter(PROGRAMS)),
+        ('wildcards', ProgramFilter(patterns)),
+        ('exclude', ProgramFilter(patterns, ['program0*'])),
+    )
+    for program in STREAM:
+        assert legacy_accept(program) == cases[1][1](program)
+    results = [(name, bench(accept)) for name, accept in cases]
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print("%-12s %6.3f us  speedup x%.2f" % (name, elapsed,
+                                                 baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the overhead of the stage timings of `send()`.
+
+Runs `KafkaDestination.send()` w/ a producer doing nothing, w/o
+instrumentation and w/ 1 in 100 and every message timed, then prints the
+stage timings of the later.
+
+    $ python benchmarks/bench_instrument.py
+"""
+
+from __future__ import print_function
+
+import logging
+import timeit
+
+from syslogng_kafka.kafkadriver import KafkaDestination
+from syslogng_kafka.log import LOG
+
+from bench_parsers import FIREWALL_MSG
+
+MESSAGES = 10000
+
+
+class LogMessage(object):
+    """ Read-only syslog-ng message. """
+
+    def __init__(self, program, message):
+        self.FACILITY = u'user'
+        self.PRIORITY = u'notice'
+        self.HOST = u'10.11.12.102'
+        self.PROGRAM = program
+        self.DATE = 'Jun 22 12:49:16'
+        self.MESSAGE = message
+
+
+class NullProducer(object):
+    def produce(self, topic, value, **kwargs):
+        pass
+
+    def poll(self, timeout):
+        return 0
+
+    def flush(self, timeout=None):
+        return 0
+
+
+STREAM = [LogMessage(u'firewall', FIREWALL_MSG)] * MESSAGES
+
+
+def destination(**options):
+    conf = {'hosts': '127.0.0.1', 'topic': 'syslog', 'programs': 'firewall',
+            'log_level': 'WARNING', 'log_async': 'False'}
+    conf.update(options)
+    dest = KafkaDestination()
+    assert dest.init(conf)
+    dest._kafka_producer = NullProducer()
+    return dest
+
+
+def bench(dest, number=5, repeat=3):
+    """ Best time per message in microseconds. """
+
+    def run():
+        send = dest.send
+        for msg in STREAM:
+            send(msg)
+
+    best = min(timeit.repeat(run, number=number, repeat=repeat))
+    return best / number / MESSAGES * 1e6
+
+
+def main():
+    cases = (
+        ('off', destination()),
+        ('1/100', destination(instrument_sample='100')),
+        ('1/1', destination(instrument_sample='1')),
+    )
+    results = [(name, bench(dest)) for name, dest in cases]
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print("%-6s %6.3f us  overhead %+.1f%%"
+              % (name, elapsed, (elapsed / baseline - 1) * 100))
+    LOG.setLevel(logging.INFO)
+    cases[1][1]._timer.dump()
+
+
+if __name__ == '__main__':
+    main()
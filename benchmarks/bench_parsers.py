@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the firewall and nat message parsers.
+
+Compares the table-driven `KeyValueParser` used by `syslogng_kafka.util` with
+the former chain of `startswith()` checks.
+
+    $ python benchmarks/bench_parsers.py
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from syslogng_kafka.util import parse_firewall_msg
+from syslogng_kafka.util import parse_nat_msg
+
+FIREWALL_MSG = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DROP_131073IN=vNic_0 ' \
+               'OUT= MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 ' \
+               'SRC=10.11.254.108 DST=10.11.12.181 LEN=84 TOS=0x00 ' \
+               'PREC=0x00 TTL=64 ID=54643 PROTO=ICMP TYPE=8 CODE=0 ID=65299 ' \
+               'SEQ=10047 MARK=0x1'
+
+NAT_MSG = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DNAT_IN=vNic_0 OUT= ' \
+          'MAC=00:50:56:01:35:27:00:a7:42:53:c5:c2:08:00 SRC=173.8.227.70 ' \
+          'DST=209.143.151.73 LEN=52 TOS=0x00 PREC=0x00 TTL=122 ID=7082 DF ' \
+          'PROTO=TCP SPT=54740 DPT=3389 WINDOW=8192 RES=0x00 SYN URGP=0 '
+
+
+def legacy_parse_firewall_msg(msg):
+    """ `parse_firewall_msg` as of 0.1.11. """
+    words = msg.split(' ')
+    action = 'allow'
+    src = dest = source_port = destination_port = -1
+    len_ = tos = proc = ttl = id_ = mark = seq = code = -1
+    proto = mac = out = ''
+    for w in words:
+        if w.startswith('DROP'):
+            action = 'drop'
+        elif w.startswith('SRC='):
+            src = w.split('=')[1]
+        elif w.startswith('DST='):
+            dest = w.split('=')[1]
+        elif w.startswith('PROTO='):
+            proto = w.split('=')[1]
+        elif w.startswith('SPT='):
+            source_port = w.split('=')[1]
+        elif w.startswith('DPT='):
+            destination_port = w.split('=')[1]
+        elif w.startswith('MAC='):
+            mac = w.split('=')[1]
+        elif w.startswith('OUT='):
+            out = w.split('=')[1]
+        elif w.startswith('LEN='):
+            len_ = w.split('=')[1]
+        elif w.startswith('TOS='):
+            tos = w.split('=')[1]
+        elif w.startswith('PREC='):
+            proc = w.split('=')[1]
+        elif w.startswith('TTL='):
+            ttl = w.split('=')[1]
+        elif w.startswith('ID='):
+            id_ = w.split('=')[1]
+        elif w.startswith('MARK='):
+            mark = w.split('=')[1]
+        elif w.startswith('SEQ='):
+            seq = w.split('=')[1]
+        elif w.startswith('CODE='):
+            code = w.split('=')[1]
+    return {'action': action, 'src_ip': src, 'dest_ip': dest, 'proto': proto,
+            'source_port': source_port, 'destination_port': destination_port,
+            'mac_address': mac, 'out': out, 'len': len_, 'tos': tos,
+            'proc': proc, 'ttl': ttl, 'id': id_, 'mark': mark, 'seq': seq,
+            'code': code}
+
+
+def legacy_parse_nat_msg(msg):
+    """ `parse_nat_msg` as of 0.1.11. """
+    dnat_in = out = mac = proto = res = ''
+    src = dest = len_ = tos = proc = ttl = id_ = -1
+    spt = dpt = window = urgp = -1
+    for w in msg.split(' '):
+        if w.startswith('DNAT_IN='):
+            dnat_in = w.split('=')[1]
+        elif w.startswith('OUT='):
+            out = w.split('=')[1]
+        elif w.startswith('MAC='):
+            mac = w.split('=')[1]
+        elif w.startswith('SRC='):
+            src = w.split('=')[1]
+        elif w.startswith('DST='):
+            dest = w.split('=')[1]
+        elif w.startswith('LEN='):
+            len_ = w.split('=')[1]
+        elif w.startswith('TOS='):
+            tos = w.split('=')[1]
+        elif w.startswith('PREC='):
+            proc = w.split('=')[1]
+        elif w.startswith('TTL='):
+            ttl = w.split('=')[1]
+        elif w.startswith('ID='):
+            id_ = w.split('=')[1]
+        elif w.startswith('PROTO='):
+            proto = w.split('=')[1]
+        elif w.startswith('SPT='):
+            spt = w.split('=')[1]
+        elif w.startswith('DPT='):
+            dpt = w.split('=')[1]
+        elif w.startswith('WINDOW='):
+            window = w.split('=')[1]
+        elif w.startswith('RES='):
+            res = w.split('=')[1]
+        elif w.startswith('URGP='):
+            urgp = w.split('=')[1]
+    return {'dnat_in': dnat_in, 'out': out, 'mac_address': mac,
+            'src_ip': src, 'dest_ip': dest, 'len': len_, 'tos': tos,
+            'proc': proc, 'ttl': ttl, 'id': id_, 'proto': proto, 'spt': spt,
+            'dpt': dpt, 'window': window, 'res': res, 'urgp': urgp}
+
+
+CASES = (
+    ('firewall', legacy_parse_firewall_msg, parse_firewall_msg,
+     FIREWALL_MSG),
+    ('nat', legacy_parse_nat_msg, parse_nat_msg, NAT_MSG),
+)
+
+
+def bench(func, msg, number, repeat=5):
+    """ Best time per call in microseconds. """
+    best = min(timeit.repeat(lambda: func(msg), number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def main(number=100000):
+    for name, legacy, current, msg in CASES:
+        assert legacy(msg) == current(msg), name
+        before = bench(legacy, msg, number)
+        after = bench(current, msg, number)
+        print("%-10s legacy %6.2f us  current %6.2f us  speedup x%.2f"
+              % (name, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
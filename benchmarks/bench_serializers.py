@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the message serializers.
+
+Encodes parsed `firewall` and `nat` messages with every serializer that can
+be built with the libraries installed, their MESSAGE being a dictionary or a
+`FirewallEvent` and `NatEvent` record.
+
+    $ python benchmarks/bench_serializers.py
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from syslogng_kafka.serializers import SERIALIZERS
+from syslogng_kafka.serializers import get_serializer
+from syslogng_kafka.util import parse_firewall_event
+from syslogng_kafka.util import parse_firewall_msg
+from syslogng_kafka.util import parse_nat_event
+from syslogng_kafka.util import parse_nat_msg
+
+from bench_parsers import FIREWALL_MSG
+from bench_parsers import NAT_MSG
+
+PAYLOADS = (
+    ('firewall', {'FACILITY': u'user', 'PRIORITY': u'notice',
+                  'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+                  'DATE': '1498135756',
+                  'MESSAGE': parse_firewall_msg(FIREWALL_MSG)}),
+    ('nat', {'FACILITY': u'user', 'PRIORITY': u'notice',
+             'HOST': u'10.11.12.102', 'PROGRAM': u'nat',
+             'DATE': '1498135756', 'MESSAGE': parse_nat_msg(NAT_MSG)}),
+    ('firewall-event', {'FACILITY': u'user', 'PRIORITY': u'notice',
+                        'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+                        'DATE': '1498135756',
+                        'MESSAGE': parse_firewall_event(FIREWALL_MSG)}),
+    ('nat-event', {'FACILITY': u'user', 'PRIORITY': u'notice',
+                   'HOST': u'10.11.12.102', 'PROGRAM': u'nat',
+                   'DATE': '1498135756', 'MESSAGE': parse_nat_event(NAT_MSG)}),
+)
+
+
+def bench(encode, msg, number=50000, repeat=5):
+    """ Best time per call in microseconds. """
+    best = min(timeit.repeat(lambda: encode(msg), number=number,
+                             repeat=repeat))
+    return best / number * 1e6
+
+
+def main():
+    for payload_name, msg in PAYLOADS:
+        baseline = None
+        for name in sorted(SERIALIZERS, key=lambda n: n != 'repr'):
+            try:
+                encode = get_serializer(name)
+            except ImportError as e:
+                print("%-14s %-10s skipped: %s" % (payload_name, name, e))
+                continue
+            elapsed = bench(encode, msg)
+            baseline = baseline or elapsed
+            print("%-14s %-10s %6.2f us  %4d bytes  speedup x%.2f"
+                  % (payload_name, name, elapsed, len(encode(msg)),
+                     baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
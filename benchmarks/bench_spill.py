@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the disk-backed spill queue.
+
+Measures the spill and replay throughput of `SpillQueue` in a temporary
+directory, compared w/ the former behaviour of sleeping 5 seconds per message
+refused by the producer.
+
+    $ python benchmarks/bench_spill.py
+"""
+
+from __future__ import print_function
+
+import shutil
+import tempfile
+import time
+
+from syslogng_kafka.spill import SpillQueue
+
+from bench_parsers import FIREWALL_MSG
+
+MESSAGES = 100000
+
+BATCH = 1000
+
+# seconds the former backpressure slept per message
+LEGACY_SLEEP = 5
+
+
+def spill(queue, value):
+    start = time.time()
+    for _ in range(MESSAGES):
+        queue.append(u'syslog', value, key=u'10.11.12.53')
+    return time.time() - start
+
+
+def replay(queue):
+    start = time.time()
+    replayed = 0
+    while True:
+        records = queue.peek(BATCH)
+        if not records:
+            break
+        queue.commit(len(records))
+        replayed += len(records)
+    assert replayed == MESSAGES
+    return time.time() - start
+
+
+def main():
+    value = repr({'PROGRAM': u'firewall',
+                  'MESSAGE': FIREWALL_MSG}).encode('utf-8')
+    directory = tempfile.mkdtemp()
+    try:
+        queue = SpillQueue(directory, max_bytes=1024 * 1024 * 1024,
+                           segment_bytes=16 * 1024 * 1024)
+        results = (('spill', spill(queue, value)),
+                   ('replay', replay(queue)))
+        queue.close()
+    finally:
+        shutil.rmtree(directory)
+    print("%d messages of %d bytes, legacy backpressure: %d s per message"
+          % (MESSAGES, len(value), LEGACY_SLEEP))
+    for name, elapsed in results:
+        print("%-8s %8.0f msg/s  %6.2f MB/s"
+              % (name, MESSAGES / elapsed,
+                 MESSAGES * len(value) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
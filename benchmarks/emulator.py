@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""syslog-ng host emulator driving `KafkaDestination` through its lifecycle.
+
+Messages are `LogMessage`-like objects generated from firewall, nat and
+generic corpora and handed to `send()` between `init()`/`open()` and
+`close()`/`deinit()` as syslog-ng does, `flush()` being called in batch mode.
+The Kafka `Producer` is replaced by an in-process `StubProducer` counting the
+messages and bytes it is given.
+"""
+
+from __future__ import print_function
+
+import gc
+import random
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from syslogng_kafka import kafkadriver
+from syslogng_kafka.instrument import clock_ns
+from syslogng_kafka.kafkadriver import KafkaDestination
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+          'Oct', 'Nov', 'Dec')
+
+FIREWALL_TEMPLATE = '[%(uuid)s]: %(action)s_131073IN=vNic_0 OUT= ' \
+                    'MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 ' \
+                    'SRC=%(src)s DST=%(dst)s LEN=%(len)d TOS=0x00 ' \
+                    'PREC=0x00 TTL=%(ttl)d ID=%(id)d PROTO=%(proto)s ' \
+                    'SPT=%(spt)d DPT=%(dpt)d WINDOW=29200 RES=0x00 SYN ' \
+                    'URGP=0 MARK=0x1'
+
+NAT_TEMPLATE = '[%(uuid)s]: DNAT_IN=vNic_0 OUT= ' \
+               'MAC=00:50:56:01:35:27:00:a7:42:53:c5:c2:08:00 SRC=%(src)s ' \
+               'DST=%(dst)s LEN=%(len)d TOS=0x00 PREC=0x00 TTL=%(ttl)d ' \
+               'ID=%(id)d DF PROTO=%(proto)s SPT=%(spt)d DPT=%(dpt)d ' \
+               'WINDOW=8192 RES=0x00 SYN URGP=0 '
+
+GENERIC_MESSAGES = (
+    ('sshd', 'Accepted publickey for deploy from %(src)s port %(spt)d ssh2'),
+    ('sshd', 'Connection closed by %(src)s port %(spt)d [preauth]'),
+    ('CRON', '(root) CMD (/usr/local/bin/backup.sh > /dev/null 2>&1)'),
+    ('kernel', 'TCP: request_sock_TCP: Possible SYN flooding on port '
+               '%(dpt)d. Sending cookies.'),
+    ('systemd', 'Started Session %(id)d of user deploy.'),
+)
+
+UUIDS = ('69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147',
+         '0b4c6f0e-1e8a-4d8b-9b0e-2f3a4c5d6e7f',
+         'a2d3e4f5-6789-4abc-8def-0123456789ab')
+
+
+def _fields(rnd):
+    return {'uuid': rnd.choice(UUIDS),
+            'action': rnd.choice(('DROP', 'ACCEPT')),
+            'src': '10.11.%d.%d' % (rnd.randint(0, 254), rnd.randint(1, 254)),
+            'dst': '209.143.151.%d' % rnd.randint(1, 254),
+            'len': rnd.randint(40, 1500), 'ttl': rnd.choice((64, 122, 128)),
+            'id': rnd.randint(1, 65535),
+            'proto': rnd.choice(('TCP', 'UDP', 'ICMP')),
+            'spt': rnd.randint(1024, 65535),
+            'dpt': rnd.choice((22, 53, 80, 138, 443, 3389))}
+
+
+class LogMessage(object):
+    """ Read-only message as handed by syslog-ng to `send()`.
+    """
+
+    __slots__ = ('FACILITY', 'PRIORITY', 'HOST', 'PROGRAM', 'DATE',
+                 'MESSAGE')
+
+    def __init__(self, program, message, date, host=u'10.11.12.102',
+                 facility=u'user', priority=u'notice'):
+        self.FACILITY = facility
+        self.PRIORITY = priority
+        self.HOST = host
+        self.PROGRAM = program
+        self.DATE = date
+        self.MESSAGE = message
+
+
+def firewall(rnd, date):
+    return LogMessage(u'firewall', FIREWALL_TEMPLATE % _fields(rnd), date)
+
+
+def nat(rnd, date):
+    return LogMessage(u'nat', NAT_TEMPLATE % _fields(rnd), date)
+
+
+def generic(rnd, date):
+    program, template = rnd.choice(GENERIC_MESSAGES)
+    return LogMessage(program, template % _fields(rnd), date,
+                      priority=rnd.choice((u'info', u'notice', u'warning')))
+
+
+# corpus name: ((generator, weight), ...)
+CORPORA = {
+    'firewall': ((firewall, 1),),
+    'nat': ((nat, 1),),
+    'generic': ((generic, 1),),
+    'mixed': ((firewall, 4), (nat, 3), (generic, 3)),
+}
+
+
+def corpus(name, count, rate=100, seed=42):
+    """ Messages of a corpus, `rate` messages per second sharing a date.
+
+    :param name: key of `CORPORA`
+    :param count: number of messages
+    :param rate: messages per second of the generated dates
+    :param seed: random seed, the same seed generates the same messages
+    :return: list of `LogMessage`
+    """
+    rnd = random.Random(seed)
+    generators = [g for g, weight in CORPORA[name] for _ in range(weight)]
+    month = MONTHS[rnd.randint(0, 11)]
+    messages = []
+    for i in range(count):
+        second = i // rate
+        date = '%s %2d %02d:%02d:%02d' % (month, 1 + second // 86400 % 28,
+                                          second // 3600 % 24,
+                                          second // 60 % 60, second % 60)
+        messages.append(rnd.choice(generators)(rnd, date))
+    return messages
+
+
+class _TopicMetadata(object):
+    __slots__ = ('partitions', 'error')
+
+    def __init__(self, partitions):
+        self.partitions = dict((i, None) for i in range(partitions))
+        self.error = None
+
+
+class _ClusterMetadata(object):
+    __slots__ = ('topics',)
+
+    def __init__(self, topics):
+        self.topics = topics
+
+
+class StubProducer(object):
+    """ In-process stand-in of `confluent_kafka.Producer`.
+    """
+
+    # partitions of every topic in the cluster metadata
+    partitions = 12
+
+    def __init__(self, **conf):
+        self.conf = conf
+        self.messages = 0
+        self.bytes = 0
+        self.polls = 0
+        self.flushes = 0
+
+    def __len__(self):
+        return 0
+
+    def produce(self, topic, value=None, key=None, partition=None, **kwargs):
+        self.messages += 1
+        self.bytes += len(value)
+
+    def poll(self, timeout=None):
+        self.polls += 1
+        return 0
+
+    def flush(self, timeout=None):
+        self.flushes += 1
+        return 0
+
+    def list_topics(self, topic=None, timeout=-1):
+        return _ClusterMetadata({topic: _TopicMetadata(self.partitions)})
+
+
+class Host(object):
+    """ Emulates the syslog-ng Python destination driver.
+    """
+
+    def __init__(self, options):
+        """
+        :param options: destination options as strings, as in the syslog-ng
+        configuration.
+        """
+        self.options = options
+
+    def __enter__(self):
+        self._producer_class = kafkadriver.Producer
+        kafkadriver.Producer = StubProducer
+        self.dest = KafkaDestination()
+        if not self.dest.init(dict(self.options)):
+            self.__exit__()
+            raise ValueError("init() failed w/ %s" % self.options)
+        self.dest.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.dest.is_opened():
+                self.dest.close()
+            self.dest.deinit()
+        finally:
+            kafkadriver.Producer = self._producer_class
+
+    @property
+    def producer(self):
+        return self.dest._kafka_producer
+
+    def deliver(self, messages):
+        """ Hand the messages to the destination the way syslog-ng does.
+
+        :return: number of messages refused by `send()`
+        """
+        send = self.dest.send
+        refused = 0
+        for msg in messages:
+            if not send(msg):
+                refused += 1
+        if self.dest.batch_lines:
+            self.dest.flush()
+        return refused
+
+
+def measure(options, messages, number=3):
+    """ Throughput, per-call latency and memory of a destination.
+
+    :param options: destination options
+    :param messages: messages to send
+    :param number: rounds of the throughput measure, the best is kept
+    :return: dict of metrics
+    """
+    count = len(messages)
+    with Host(options) as host:
+        # warm-up, also fills the caches as in a long running process.
+        host.deliver(messages)
+        producer = host.producer
+        before = producer.messages, producer.bytes
+        best = min(timeit.repeat(lambda: host.deliver(messages),
+                                 number=1, repeat=number))
+        produced = (producer.messages - before[0]) // number
+        produced_bytes = (producer.bytes - before[1]) // number
+
+        send = host.dest.send
+        latencies = []
+        for msg in messages:
+            start = clock_ns()
+            send(msg)
+            latencies.append(clock_ns() - start)
+        if host.dest.batch_lines:
+            host.dest.flush()
+    latencies.sort()
+
+    result = {'msg_per_s': count / best,
+              'produced': produced,
+              'bytes_per_msg': produced_bytes / float(produced or 1),
+              'p50_us': latencies[count // 2] / 1e3,
+              'p99_us': latencies[int(count * 0.99)] / 1e3}
+    result.update(memory(options, messages))
+    return result
+
+
+def memory(options, messages):
+    """ Peak memory and blocks still allocated after a full lifecycle.
+
+    :return: dict of metrics, empty if `tracemalloc` is not available
+    """
+    if tracemalloc is None:
+        return {}
+    # module level caches, e.g. of the dates, are filled once for all.
+    with Host(options) as host:
+        host.deliver(messages)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.take_snapshot()
+        with Host(options) as host:
+            host.deliver(messages)
+            peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        end = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in
+                   end.compare_to(start, 'lineno')
+                   if 'syslogng_kafka' in stat.traceback[0].filename)
+    return {'peak_kib_per_1k': peak / 1024.0 / len(messages) * 1000,
+            'retained_blocks': max(retained, 0)}
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Run the benchmark suite and optionally check it against a baseline.
+
+Runs the end-to-end scenarios of `bench_destination.py` and the parser and
+date micro-benchmarks, then prints every metric:
+
+    $ python benchmarks/run.py
+    $ python benchmarks/run.py --quick --save benchmarks/baseline.json
+    $ python benchmarks/run.py --quick --check benchmarks/baseline.json
+
+`--check` exits w/ status 1 when a metric regressed by more than
+`--tolerance`. Only the metrics which do not depend on the machine are
+checked unless `--strict` is given, which is meant for a baseline saved on
+the same machine.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import bench_dates  # NOQA
+import bench_destination  # NOQA
+import bench_parsers  # NOQA
+import emulator  # NOQA
+from syslogng_kafka import util  # NOQA
+
+# metric suffix: (higher is better, machine independent, minimum tolerance)
+RULES = {
+    'msg_per_s': (True, False, 0),
+    'produced': (True, True, 0),
+    # ratios of timings of a few microseconds are noisy
+    'speedup': (True, True, 0.5),
+    'p50_us': (False, False, 0),
+    'p99_us': (False, False, 0),
+    'bytes_per_msg': (False, True, 0),
+    'peak_kib_per_1k': (False, True, 0),
+    'retained_blocks': (False, True, 0),
+}
+
+# metrics measured w/ `tracemalloc`, not available on Python 2
+MEMORY_METRICS = ('peak_kib_per_1k', 'retained_blocks')
+
+# blocks the destination may retain on top of the tolerance
+RETAINED_BLOCKS_SLACK = 10
+
+
+def micro(number):
+    """ Speedups of the parsers and dates vs their former implementation.
+    """
+    results = {}
+    for name, legacy, current, msg in bench_parsers.CASES:
+        before = bench_parsers.bench(legacy, msg, number)
+        after = bench_parsers.bench(current, msg, number)
+        results['parsers.%s.speedup' % name] = before / after
+    rounds = max(number // 5000, 1)
+    legacy = bench_dates.bench(bench_dates.legacy_date_str_to_timestamp,
+                               number=rounds)
+    for name, func in (('uncached', util._date_str_to_timestamp),
+                       ('cached', util.date_str_to_timestamp)):
+        results['dates.%s.speedup' % name] = legacy / bench_dates.bench(
+            func, number=rounds)
+    return results
+
+
+def run(quick=False):
+    """ Every metric of the suite by dotted name. """
+    results = {}
+    for name, metrics in bench_destination.run(
+            messages=2000 if quick else bench_destination.MESSAGES,
+            number=2 if quick else 3):
+        for key, value in metrics.items():
+            results['destination.%s.%s' % (name, key)] = value
+    results.update(micro(10000 if quick else 100000))
+    return results
+
+
+def check(results, baseline, tolerance, strict=False):
+    """ Regressions of `results` vs `baseline`.
+
+    :return: list of messages, empty if there is no regression
+    """
+    regressions = []
+    for name in sorted(baseline):
+        suffix = name.rsplit('.', 1)[1]
+        higher, portable, minimum = RULES[suffix]
+        if not (portable or strict):
+            continue
+        allowed = max(tolerance, minimum)
+        if name not in results:
+            if suffix not in MEMORY_METRICS or \
+                    emulator.tracemalloc is not None:
+                regressions.append('%s: missing' % name)
+            continue
+        expected, value = baseline[name], results[name]
+        if higher:
+            bad = value < expected * (1 - allowed)
+        else:
+            limit = expected * (1 + allowed)
+            if name.endswith('retained_blocks'):
+                limit += RETAINED_BLOCKS_SLACK
+            bad = value > limit
+        if bad:
+            regressions.append('%s: %.2f vs baseline %.2f'
+                               % (name, value, expected))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer messages and rounds, e.g. in CI')
+    parser.add_argument('--save', metavar='PATH',
+                        help='save the results as a baseline')
+    parser.add_argument('--check', metavar='PATH',
+                        help='compare the results w/ a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression (default 0.25)')
+    parser.add_argument('--strict', action='store_true',
+                        help='also check throughput and latencies')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    for name in sorted(results):
+        print('%-48s %12.2f' % (name, results[name]))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.tolerance, args.strict)
+        if regressions:
+            print('\nRegressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('\nNo regression vs %s' % args.check)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
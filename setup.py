@@ -29,6 +29,11 @@ setup(
     package_dir={'syslogng_kafka': 'syslogng_kafka'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        'fastjson': ['ujson'],
+        'msgpack': ['msgpack'],
+        'avro': ['fastavro'],
+    },
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords='syslogng kafka',
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""Windowed suppression of repeated parsed messages.
+
+During a scan a firewall logs the same DROP, i.e. the same source,
+destination, protocol and port, hundreds of times a second. A
+`Deduplicator` keys the parsed messages of its programs on a tuple of fields
+and holds the first message of a key for `window` seconds, counting its
+copies instead of producing them. When the window ends the first message is
+produced once w/ `count`, `first_seen` and `last_seen` fields, the times
+being UNIX timestamps in milliseconds.
+
+The table of held messages is bounded: a new key evicts the oldest one,
+produced before the end of its window. Held messages are produced when the
+destination is closed.
+
+There is no timer: the destination produces the messages whose window ended
+from `send()` and `flush()` only. W/o batching, or w/ syslog-ng < 3.18 which
+never calls `flush()`, a quiet source holds them until its next message.
+"""
+
+from collections import Counter
+from collections import OrderedDict
+from time import time
+
+# default `dedup_programs`
+DEFAULT_DEDUP_PROGRAMS = ('firewall',)
+
+# default `dedup_window` in milliseconds
+DEFAULT_DEDUP_WINDOW = 1000
+
+# default `dedup_max_keys`: maximum number of held messages
+DEFAULT_DEDUP_MAX_KEYS = 10000
+
+# fields added to the produced messages
+DEDUP_FIELDS = ('count', 'first_seen', 'last_seen')
+
+
+class Deduplicator(object):
+    """ Table of the held messages by key, in the order of their first copy.
+
+    `counters` holds the copies suppressed, the messages produced at the end
+    of their window and the ones evicted before.
+    """
+
+    def __init__(self, fields, programs=DEFAULT_DEDUP_PROGRAMS,
+                 window=DEFAULT_DEDUP_WINDOW / 1000.0,
+                 max_keys=DEFAULT_DEDUP_MAX_KEYS):
+        """
+        :param fields: fields of the parsed messages making the key
+        :param programs: programs whose messages are deduplicated
+        :param window: seconds a message is held
+        :param max_keys: maximum number of held messages
+        :raise ValueError: if an argument is invalid
+        """
+        self.fields = tuple(fields)
+        if not self.fields:
+            raise ValueError("No field to deduplicate messages on")
+        if window <= 0 or max_keys < 1:
+            raise ValueError("The window and the maximum number of keys must "
+                             "be positive")
+        self.programs = frozenset(programs)
+        self.window = window
+        self.max_keys = max_keys
+        self.counters = Counter()
+        # key: [message, count, first seen, last seen]
+        self._held = OrderedDict()
+        # messages whose window ended or evicted, to be produced
+        self._ready = []
+
+    def __len__(self):
+        """ Number of held messages. """
+        return len(self._held)
+
+    def _key(self, msg):
+        parsed = msg['MESSAGE']
+        try:
+            return (msg['PROGRAM'],) + tuple(
+                parsed[field] for field in self.fields)
+        except (KeyError, TypeError):
+            # not parsed or w/o the fields
+            return None
+
+    def __call__(self, msg, now=None):
+        """ Hold a message or count it as a copy of a held one.
+
+        :param msg: message dictionary w/ a parsed MESSAGE
+        :param now: time of the message, the current time by default
+        :return: the message if it is not deduplicated, None if it is held
+        """
+        if msg['PROGRAM'] not in self.programs:
+            return msg
+        key = self._key(msg)
+        if key is None:
+            return msg
+        if now is None:
+            now = time()
+        held = self._held.get(key)
+        if held is not None:
+            held[1] += 1
+            held[3] = now
+            self.counters['suppressed'] += 1
+            return None
+        if len(self._held) >= self.max_keys:
+            _, oldest = self._held.popitem(last=False)
+            self._ready.append(self._aggregate(oldest))
+            self.counters['evicted'] += 1
+        self._held[key] = [msg, 1, now, now]
+        return None
+
+    @staticmethod
+    def _aggregate(held):
+        msg, count, first_seen, last_seen = held
+        msg['count'] = count
+        msg['first_seen'] = int(first_seen * 1000)
+        msg['last_seen'] = int(last_seen * 1000)
+        return msg
+
+    def expired(self, now=None):
+        """ Pop the messages whose window ended and the evicted ones.
+
+        :param now: the current time by default
+        :return: list of messages w/ their `DEDUP_FIELDS`
+        """
+        held = self._held
+        if not held and not self._ready:
+            return []
+        if now is None:
+            now = time()
+        deadline = now - self.window
+        ready, self._ready = self._ready, []
+        while held:
+            key = next(iter(held))
+            if held[key][2] > deadline:
+                break
+            ready.append(self._aggregate(held.pop(key)))
+            self.counters['produced'] += 1
+        return ready
+
+    def hold_back(self, messages):
+        """ Give back messages returned by `expired()` which could not be
+        produced, returned first by the next call.
+        """
+        self._ready[:0] = messages
+
+    def drain(self):
+        """ Pop every held message, e.g. on close.
+
+        :return: list of messages w/ their `DEDUP_FIELDS`
+        """
+        ready, self._ready = self._ready, []
+        while self._held:
+            ready.append(self._aggregate(self._held.popitem(last=False)[1]))
+            self.counters['produced'] += 1
+        return ready
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""Aggregated delivery reports of the producer.
+
+Delivery reports are folded into counters logged in a summary line every
+interval instead of a log line per message. Payloads of delivered messages
+are only logged for a few samples per interval and failures are logged a few
+times per error code and interval, the others being counted as suppressed.
+"""
+
+import threading
+from collections import Counter
+from time import time
+
+from .log import LOG
+
+# default `delivery_report_interval` in milliseconds
+DEFAULT_DELIVERY_REPORT_INTERVAL = 60000
+
+# default `delivery_samples`: payloads of delivered messages logged per
+# interval in verbose mode
+DEFAULT_DELIVERY_SAMPLES = 10
+
+# default `delivery_error_logs`: failures logged per error code and interval
+DEFAULT_DELIVERY_ERROR_LOGS = 5
+
+# logged bytes of a payload
+PAYLOAD_LOG_BYTES = 256
+
+
+def _payload(msg):
+    value = msg.value()
+    if value is not None and len(value) > PAYLOAD_LOG_BYTES:
+        return "%r... (%d bytes)" % (value[:PAYLOAD_LOG_BYTES], len(value))
+    return repr(value)
+
+
+def _error_code(err):
+    # `confluent_kafka.KafkaError` w/ an error name, the error string else.
+    try:
+        return err.name()
+    except AttributeError:
+        return err.str()
+
+
+class DeliveryReporter(object):
+    """ `on_delivery` callback of the producer counting delivery reports.
+
+    `counters` holds the totals since the creation of the reporter:
+    delivered, delivered_bytes, failed, failed_bytes and suppressed error
+    logs. `errors` holds the failures by error code. The successful
+    deliveries are only counted if the producer reports them, i.e. w/o
+    `delivery.report.only.error`.
+
+    The reports may come from the threads polling the producer, e.g. the
+    `SpillDrainer`, as well as from syslog-ng's thread.
+    """
+
+    def __init__(self, interval=DEFAULT_DELIVERY_REPORT_INTERVAL,
+                 samples=DEFAULT_DELIVERY_SAMPLES,
+                 error_logs=DEFAULT_DELIVERY_ERROR_LOGS, successes=True):
+        """
+        :param interval: milliseconds between two summaries
+        :param samples: payloads of delivered messages logged per interval
+        :param error_logs: failures logged per error code and interval
+        :param successes: whether the producer reports the successful
+        deliveries. The summaries leave them out otherwise.
+        """
+        self.interval = interval / 1000.0
+        self.samples = samples
+        self.error_logs = error_logs
+        self.successes = successes
+        self.counters = Counter()
+        self.errors = Counter()
+        self._window = Counter()
+        self._window_errors = Counter()
+        self._last_report = time()
+        self._lock = threading.Lock()
+
+    def __call__(self, err, msg):
+        if msg is None:
+            return
+        value = msg.value()
+        size = len(value) if value is not None else 0
+        code = None if err is None else _error_code(err)
+        with self._lock:
+            window = self._window
+            if err is None:
+                window['delivered'] += 1
+                window['delivered_bytes'] += size
+                log = window['delivered'] <= self.samples
+            else:
+                window['failed'] += 1
+                window['failed_bytes'] += size
+                self._window_errors[code] += 1
+                log = self._window_errors[code] <= self.error_logs
+                if not log:
+                    window['suppressed'] += 1
+        if log and err is None:
+            LOG.debug("Message produced: %s" % _payload(msg))
+        elif log:
+            try:
+                LOG.error("Failed to deliver message: %s: %s"
+                          % (_payload(msg), err.str()))
+            except UnicodeDecodeError:
+                LOG.error("Failed to deliver message: %s: %s"
+                          % (_payload(msg), repr(err)))
+        self.maybe_report()
+
+    def maybe_report(self):
+        """ Log a summary if `interval` elapsed since the last one.
+
+        Called by the destination as well, so that the summaries do not wait
+        for the next delivery report.
+        """
+        if time() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        """ Log a summary of the delivery reports since the last one and add
+        them to the totals.
+        """
+        with self._lock:
+            self._last_report = time()
+            window, errors = self._window, self._window_errors
+            if not window:
+                return
+            self._window, self._window_errors = Counter(), Counter()
+            self.counters.update(window)
+            self.errors.update(errors)
+        parts = []
+        if self.successes:
+            parts.append("%d delivered (%d bytes)" % (
+                window['delivered'], window['delivered_bytes']))
+        if window['failed']:
+            parts.append("%d failed (%d bytes) %s" % (
+                window['failed'], window['failed_bytes'],
+                ', '.join('%s=%d' % item for item in sorted(errors.items()))))
+            if window['suppressed']:
+                parts.append("%d error logs suppressed" % window['suppressed'])
+            LOG.warning("Delivery report: %s" % ', '.join(parts))
+        elif parts:
+            LOG.info("Delivery report: %s" % ', '.join(parts))
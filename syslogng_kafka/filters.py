@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Filter of syslog messages by program name.
+"""
+
+import re
+
+# maximum number of program names `ProgramFilter` remembers its decision for
+DECISION_CACHE_SIZE = 10000
+
+
+def _compile_patterns(patterns):
+    """ Compile `*` and `?` wildcard patterns into a single regular expression.
+
+    :return: the `match` method of the expression or None w/o patterns.
+    """
+    if not patterns:
+        return None
+    translated = []
+    for pattern in patterns:
+        translated.append(''.join(
+            '.*' if c == '*' else '.' if c == '?' else re.escape(c)
+            for c in pattern))
+    return re.compile(r'(?:%s)\Z' % '|'.join(translated), re.DOTALL).match
+
+
+class _Matcher(object):
+    """ Exact program names plus wildcard patterns.
+    """
+
+    def __init__(self, programs):
+        exact = set()
+        patterns = []
+        for program in programs:
+            if '*' in program or '?' in program:
+                patterns.append(program)
+            else:
+                exact.add(program)
+        self.exact = frozenset(exact)
+        self.match = _compile_patterns(patterns)
+
+    def __call__(self, program):
+        if program in self.exact:
+            return True
+        return self.match is not None and self.match(program) is not None
+
+
+class ProgramFilter(object):
+    """ Include and exclude lists of program names.
+
+    Names may contain `*` and `?` wildcards, e.g. `firewall*` or `kernel/*`.
+    The decision for a program is cached so that filtering is a dictionary
+    lookup in the long run.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        """
+        :param include: optional program names to keep, every program by
+        default.
+        :param exclude: optional program names to drop, applied after
+        `include`.
+        """
+        self.include = None if include is None else _Matcher(include)
+        self.exclude = None if not exclude else _Matcher(exclude)
+        self._decisions = {}
+
+    def _decide(self, program):
+        if self.include is not None and not self.include(program):
+            return False
+        if self.exclude is not None and self.exclude(program):
+            return False
+        return True
+
+    def __call__(self, program):
+        """
+        :param program: syslog program name
+        :return: True if messages from `program` are kept
+        """
+        try:
+            return self._decisions[program]
+        except KeyError:
+            pass
+        decision = self._decide(program)
+        if len(self._decisions) >= DECISION_CACHE_SIZE:
+            self._decisions.clear()
+        self._decisions[program] = decision
+        return decision
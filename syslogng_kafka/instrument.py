@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Sampled per-stage timing of `KafkaDestination.send()`.
+
+1 in `sample_every` messages is timed stage by stage: building the message
+dictionary, every step of the send plan, the serialization, `produce()` and
+`poll()`. Latencies go to log2 bucket histograms dumped to the log
+periodically and on `close()`. Messages not sampled only pay a countdown.
+"""
+
+from collections import OrderedDict
+from time import time
+
+from .log import LOG
+
+try:
+    from time import perf_counter_ns as clock_ns
+except ImportError:  # pragma: no cover
+    try:
+        from time import perf_counter
+    except ImportError:
+        perf_counter = time
+
+    def clock_ns():
+        """ Monotonic clock in nanoseconds. """
+        return int(perf_counter() * 1e9)
+
+# default `instrument_interval` in milliseconds
+DEFAULT_INSTRUMENT_INTERVAL = 60000
+
+# number of log2 buckets of a histogram, up to 2^39ns ~ 9 minutes
+BUCKETS = 40
+
+
+class Histogram(object):
+    """ Latency histogram in nanoseconds w/ log2 buckets.
+
+    Bucket `i` counts the latencies in [2^(i-1), 2^i[ so that percentiles are
+    estimated within a factor 2.
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.buckets[min(max(ns, 0).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """ Upper bound in nanoseconds of the `q` percentile, 0 < q <= 100.
+        """
+        if not self.count:
+            return 0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(1 << i, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else 0.0
+
+
+class StageTimer(object):
+    """ Histograms by stage of the sampled messages.
+    """
+
+    def __init__(self, sample_every, interval=DEFAULT_INSTRUMENT_INTERVAL):
+        """
+        :param sample_every: time 1 in `sample_every` messages
+        :param interval: milliseconds between two dumps to the log
+        """
+        if sample_every < 1:
+            raise ValueError("Sampling rate must be a positive integer.")
+        self.sample_every = sample_every
+        self.interval = interval / 1000.0
+        self.stages = OrderedDict()
+        self._countdown = sample_every
+        self._last_dump = time()
+
+    def sample(self):
+        """ True if the current message is to be timed.
+        """
+        self._countdown -= 1
+        if self._countdown:
+            return False
+        self._countdown = self.sample_every
+        return True
+
+    def record(self, stage, ns):
+        """ Add a latency in nanoseconds to the histogram of `stage`.
+        """
+        try:
+            histogram = self.stages[stage]
+        except KeyError:
+            histogram = self.stages[stage] = Histogram()
+        histogram.add(ns)
+
+    def maybe_dump(self):
+        """ Dump the histograms if `interval` elapsed since the last dump.
+        """
+        if time() - self._last_dump >= self.interval:
+            self.dump()
+
+    def dump(self):
+        """ Log and reset the histograms.
+        """
+        self._last_dump = time()
+        if not self.stages:
+            return
+        LOG.info("Stage timings of 1 in %d messages:" % self.sample_every)
+        for stage, h in self.stages.items():
+            LOG.info("  %-10s n=%d avg=%.1fus p50<%.1fus p90<%.1fus "
+                     "p99<%.1fus max=%.1fus"
+                     % (stage, h.count, h.mean / 1e3, h.percentile(50) / 1e3,
+                        h.percentile(90) / 1e3, h.percentile(99) / 1e3,
+                        h.max / 1e3))
+        self.stages = OrderedDict()
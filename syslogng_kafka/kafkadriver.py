@@ -7,20 +7,90 @@ from __future__ import print_function
 
 import ast
 import json
+from collections import Counter
 from time import sleep
+from time import time
 
 from confluent_kafka import KafkaException
 from confluent_kafka import Producer
 
+from .dedup import DEFAULT_DEDUP_MAX_KEYS
+from .dedup import DEFAULT_DEDUP_PROGRAMS
+from .dedup import DEFAULT_DEDUP_WINDOW
+from .dedup import Deduplicator
+from .delivery import DEFAULT_DELIVERY_ERROR_LOGS
+from .delivery import DEFAULT_DELIVERY_REPORT_INTERVAL
+from .delivery import DEFAULT_DELIVERY_SAMPLES
+from .delivery import DeliveryReporter
+from .instrument import DEFAULT_INSTRUMENT_INTERVAL
+from .instrument import StageTimer
+from .instrument import clock_ns
+from .log import DEFAULT_LOG_LEVEL
+from .log import DEFAULT_LOG_QUEUE_SIZE
+from .log import DEFAULT_LOG_TARGET
 from .log import LOG
-from .util import date_str_to_timestamp
-from .util import parse_firewall_msg
-from .util import parse_nat_msg
+from .log import configure_logging
+from .metrics import DEFAULT_METRICS_ADDRESS
+from .metrics import DEFAULT_STATS_INTERVAL_MS
+from .metrics import MetricsRegistry
+from .metrics import MetricsServer
+from .serializers import DEFAULT_SERIALIZER
+from .spill import DEFAULT_SPILL_MAX_BYTES
+from .spill import DEFAULT_SPILL_SEGMENT_BYTES
+from .spill import SpillDrainer
+from .spill import SpillQueue
+from .spill import retriable_delivery
+from .serializers import get_serializer
+from .parsers import build_parsers
+from .partitioner import DEFAULT_PARTITION_REFRESH_INTERVAL
+from .partitioner import DEFAULT_PARTITION_VNODES
+from .partitioner import PartitionRefresher
+from .partitioner import Partitioner
+from .plan import compile_send_plan
+from .pool import POOL
+from .ratelimit import DEFAULT_RATELIMIT_KEYS
+from .ratelimit import DEFAULT_RATELIMIT_MAX_KEYS
+from .ratelimit import DEFAULT_RATELIMIT_SAMPLE
+from .ratelimit import RateLimiter
+from .routing import Router
+from .tuning import DEFAULT_AUTOTUNE_INTERVALS
+from .tuning import AutoTuner
+from .tuning import parse_bounds
 from .util import parse_str_list
+from .worker import DEFAULT_WORKER_RING_BYTES
+from .worker import WorkerPool
 
 # this is the default broker version fallback defined by `librdkafka`
 DEFAULT_BROKER_VERSION_FALLBACK = '0.9.0.1'
 
+# default `batch_timeout` in milliseconds, same as syslog-ng `batch-timeout()`
+DEFAULT_BATCH_TIMEOUT = 1000
+
+# syslog-ng >= 3.18 `send()` and `flush()` return values. Older versions only
+# check the truth value of what `send()` returns.
+ERROR = 1
+SUCCESS = 3
+QUEUED = 4
+
+# outcomes of `KafkaDestination._produce()`
+_PRODUCED, _DROPPED, _HELD, _SPILLED = range(4)
+
+# first producer poll timeout in seconds of the adaptive backpressure
+BACKPRESSURE_MIN_WAIT = 0.001
+
+# default `backpressure_max_wait` in milliseconds
+DEFAULT_BACKPRESSURE_MAX_WAIT = 5000
+
+# options of the destination only, not handed to its workers: the rate
+# limits are applied before the messages are handed.
+WORKER_OPTIONS = ('workers', 'worker_ring_bytes', 'ratelimit_rate',
+                  'ratelimit_burst', 'ratelimit_keys', 'ratelimit_max_keys',
+                  'ratelimit_sample')
+
+# seconds the producer replaced by the auto-tuner is given to deliver its
+# messages, polled over the next sends
+PRODUCER_REPLACE_TIMEOUT = 30
+
 
 class KafkaDestination(object):
     """ syslog-ng Apache Kafka destination.
@@ -28,19 +98,69 @@ class KafkaDestination(object):
 
     _kafka_producer = None
 
-    _conf = dict()
-
     def __init__(self):
+        self._conf = dict()
         self.hosts = None
         self.topic = None
         self.msg_key = None
         self.partition = None
+        self.partition_by = None
+        self._partitioner = None
+        self._partition_refresher = None
+        self.partition_refresh_interval = (
+            DEFAULT_PARTITION_REFRESH_INTERVAL / 1000.0)
+        self.routes = None
+        self._router = None
         self.programs = None
+        self.exclude_programs = None
         self.group_id = None
         self.broker_version = None
         self.verbose = False
+        self.delivery_reporter = None
         self.display_stats = False
+        self.stats_interval_ms = None
+        self.metrics_port = None
+        self.metrics_address = DEFAULT_METRICS_ADDRESS
+        self.metrics_file = None
+        self.metrics = None
+        self._metrics_server = None
+        self.shared_producer = False
+        self.autotune = None
+        self._tuner = None
+        self._retune = False
+        # (producer, deadline, statistics name) of the producers replaced by
+        # the auto-tuner
+        self._retired = []
+        # `name` of the statistics of the current producer, once seen
+        self._stats_name = None
         self.producer_config = None
+        self.serializer = DEFAULT_SERIALIZER
+        self._serialize = None
+        self.parsers = None
+        self.dedup_fields = None
+        self._dedup = None
+        self._rate_limiter = None
+        self._plan = None
+        self._program_filter = None
+        self.backpressure = 'sleep'
+        self.backpressure_max_wait = DEFAULT_BACKPRESSURE_MAX_WAIT / 1000.0
+        self.backpressure_drop = False
+        self.backpressure_counters = Counter()
+        self.spill_dir = None
+        self._spill_queue = None
+        self._spill_drainer = None
+        self.instrument_sample = 0
+        self._timer = None
+        self.batch_lines = 0
+        self.batch_timeout = DEFAULT_BATCH_TIMEOUT / 1000.0
+        self._batch = []
+        self._batch_started = None
+        # syslog-ng >= 3.18 calls `flush()` and retries failed batches itself
+        self._rewinds_batches = False
+        self.workers = 0
+        self.worker_ring_bytes = DEFAULT_WORKER_RING_BYTES
+        self._worker_args = None
+        self._workers = None
 
     def init(self, args):
         """ This method is called at initialization time.
@@ -48,6 +168,41 @@ class KafkaDestination(object):
         Should return False if initialization fails.
         """
 
+        # logging of all the destinations, see `syslogng_kafka.log`.
+        try:
+            configure_logging(
+                level=args.get('log_level', DEFAULT_LOG_LEVEL),
+                target=args.get('log_target', DEFAULT_LOG_TARGET),
+                async_=ast.literal_eval(args.get('log_async', 'True')),
+                queue_size=int(args.get('log_queue_size',
+                                        DEFAULT_LOG_QUEUE_SIZE)))
+        except (ValueError, SyntaxError, IOError, OSError) as e:
+            LOG.error("Bad logging options: %s" % e)
+            return False
+
+        # rate limits by program and/or host, see `syslogng_kafka.ratelimit`.
+        if 'ratelimit_rate' in args:
+            try:
+                self._rate_limiter = RateLimiter(
+                    float(args['ratelimit_rate']),
+                    burst=float(args['ratelimit_burst'])
+                    if 'ratelimit_burst' in args else None,
+                    keys=parse_str_list(args['ratelimit_keys'])
+                    if 'ratelimit_keys' in args else DEFAULT_RATELIMIT_KEYS,
+                    max_keys=int(args.get('ratelimit_max_keys',
+                                          DEFAULT_RATELIMIT_MAX_KEYS)),
+                    sample=int(args.get('ratelimit_sample',
+                                        DEFAULT_RATELIMIT_SAMPLE)))
+            except ValueError as e:
+                LOG.error("Bad rate limit options: %s" % e)
+                return False
+            LOG.info("Messages limited to %s/s w/ bursts of %s by %s"
+                     % (self._rate_limiter.rate, self._rate_limiter.burst,
+                        ', '.join(self._rate_limiter.keys)))
+
+        if 'workers' in args:
+            return self._init_workers(args)
+
         if 'producer_config' in args:
             try:
                 self.producer_config = ast.literal_eval(args['producer_config'])
@@ -69,13 +224,54 @@ class KafkaDestination(object):
             LOG.info("Message key used will be %s" % self.msg_key)
 
         if 'partition' in args:
-            self.partition = args['partition']
+            try:
+                self.partition = int(args['partition'])
+            except ValueError:
+                LOG.error("Partition %s is not an int." % args['partition'])
+                return False
             LOG.info("Partition to produce to %s" % self.partition)
 
+        # topics by program, host, facility or priority, `topic` being the
+        # default. See `syslogng_kafka.routing`.
+        if 'routes' in args:
+            try:
+                self.routes = ast.literal_eval(args['routes'])
+                self._router = Router(self.routes, self.topic)
+            except (ValueError, SyntaxError, TypeError) as e:
+                LOG.error("Given routes %s are not valid: %s"
+                          % (args['routes'], e))
+                return False
+            LOG.info("Topics routed by %s: %s"
+                     % (', '.join(self._router.fields), self.routes))
+
+        # consistent-hash partitioning, see `syslogng_kafka.partitioner`.
+        if 'partition_by' in args:
+            if self.partition is not None:
+                LOG.error("`partition` and `partition_by` are exclusive.")
+                return False
+            self.partition_by = args['partition_by']
+            try:
+                self._partitioner = Partitioner(
+                    self.partition_by, self.topic,
+                    vnodes=int(args.get('partition_vnodes',
+                                        DEFAULT_PARTITION_VNODES)))
+                self.partition_refresh_interval = int(args.get(
+                    'partition_refresh_interval',
+                    DEFAULT_PARTITION_REFRESH_INTERVAL)) / 1000.0
+            except ValueError:
+                LOG.error("`partition_vnodes` and `partition_refresh_interval` "
+                          "must be integers.")
+                return False
+            LOG.info("Partitions by consistent hashing of %s"
+                     % self.partition_by)
+
         # optional `programs` parameter to filter out messages
         if 'programs' in args:
             self.programs = parse_str_list(args['programs'])
             LOG.info("Programs to filter against %s" % self.programs)
+        if 'exclude_programs' in args:
+            self.exclude_programs = parse_str_list(args['exclude_programs'])
+            LOG.info("Programs to filter out %s" % self.exclude_programs)
 
         if 'group_id' in args:
             self.group_id = args['group_id']
@@ -98,10 +294,7 @@ class KafkaDestination(object):
             LOG.warn("Default broker version fallback %s "
                      "will be applied here." % DEFAULT_BROKER_VERSION_FALLBACK)
 
-        self._conf['on_delivery'] = delivery_callback
         if 'verbose' in args:
-            # provide a global `on_delivery` callback in the `Producer()` config
-            # dict better for memory consumptions vs per message callback.
             self.verbose = ast.literal_eval(args['verbose'])
         if not self.verbose:
             # only interested in delivery failures here. We do provide a
@@ -113,6 +306,39 @@ class KafkaDestination(object):
                      "in your destination options to see successfully "
                      "processed messages in your logs.")
 
+        # aggregated delivery reports, see `syslogng_kafka.delivery`.
+        try:
+            self.delivery_reporter = DeliveryReporter(
+                interval=int(args.get('delivery_report_interval',
+                                      DEFAULT_DELIVERY_REPORT_INTERVAL)),
+                samples=int(args.get('delivery_samples',
+                                     DEFAULT_DELIVERY_SAMPLES))
+                if self.verbose else 0,
+                error_logs=int(args.get('delivery_error_logs',
+                                        DEFAULT_DELIVERY_ERROR_LOGS)),
+                successes=self.verbose)
+        except ValueError as e:
+            LOG.error("Bad delivery report option: %s" % e)
+            return False
+        # producer shared w/ the destinations of the same configuration,
+        # see `syslogng_kafka.pool`.
+        if 'shared_producer' in args:
+            try:
+                self.shared_producer = ast.literal_eval(
+                    args['shared_producer'])
+            except (ValueError, SyntaxError):
+                LOG.error("`shared_producer` must be a boolean.")
+                return False
+        if self.shared_producer:
+            # the delivery callback is passed to every produce call instead.
+            LOG.info("Producer shared w/ the destinations of the same "
+                     "configuration.")
+        else:
+            # provide a global `on_delivery` callback in the `Producer()`
+            # config dict better for memory consumptions vs per message
+            # callback.
+            self._conf['on_delivery'] = self.delivery_reporter
+
         # display broker stats?
         if 'display_stats' in args:
             self.display_stats = ast.literal_eval(args['display_stats'])
@@ -120,18 +346,262 @@ class KafkaDestination(object):
             self._conf['stats_cb'] = stats_callback
             LOG.info("Broker statistics will be displayed.")
 
+        # producer metrics, see `syslogng_kafka.metrics`.
+        try:
+            if 'stats_interval_ms' in args:
+                self.stats_interval_ms = int(args['stats_interval_ms'])
+            if 'metrics_port' in args:
+                self.metrics_port = int(args['metrics_port'])
+        except ValueError:
+            LOG.error("`stats_interval_ms` and `metrics_port` must be "
+                      "integers.")
+            return False
+        self.metrics_address = args.get('metrics_address',
+                                        DEFAULT_METRICS_ADDRESS)
+        self.metrics_file = args.get('metrics_file')
+        if self.metrics_port is not None or self.metrics_file:
+            self.metrics = MetricsRegistry(self.metrics_file)
+
+        # producer profile picked from the statistics, see
+        # `syslogng_kafka.tuning`.
+        if 'autotune' in args:
+            self.autotune = args['autotune']
+            try:
+                lowest, highest = parse_bounds(self.autotune)
+                self._tuner = AutoTuner(
+                    lowest, highest,
+                    intervals=int(args.get('autotune_intervals',
+                                           DEFAULT_AUTOTUNE_INTERVALS)))
+            except ValueError as e:
+                LOG.error("Bad `autotune` or `autotune_intervals`: %s" % e)
+                return False
+            if self.shared_producer:
+                LOG.error("`autotune` cannot recreate a shared producer.")
+                return False
+            LOG.info("Auto-tuning between profiles %s and %s, starting w/ %s"
+                     % (lowest, highest, self._tuner.profile))
+
+        if self.metrics is not None or self._tuner is not None:
+            self._conf['stats_cb'] = self._on_stats
+            if self.stats_interval_ms is None:
+                self.stats_interval_ms = DEFAULT_STATS_INTERVAL_MS
+        if self.stats_interval_ms is not None:
+            self._conf['statistics.interval.ms'] = self.stats_interval_ms
+            LOG.info("Broker statistics every %sms" % self.stats_interval_ms)
+
+        self.serializer = args.get('serializer', DEFAULT_SERIALIZER)
+        try:
+            self._serialize = get_serializer(self.serializer)
+        except (ValueError, ImportError) as e:
+            LOG.error("Cannot use serializer %s: %s" % (self.serializer, e))
+            return False
+        LOG.info("Messages will be serialized w/ %s" % self.serializer)
+
+        # what to do when the producer queue is full.
+        if 'backpressure' in args:
+            self.backpressure = args['backpressure']
+            if self.backpressure not in ('sleep', 'adaptive'):
+                LOG.error("`backpressure` must be `sleep` or `adaptive`.")
+                return False
+            try:
+                if 'backpressure_max_wait' in args:
+                    self.backpressure_max_wait = int(
+                        args['backpressure_max_wait']) / 1000.0
+                if 'backpressure_drop' in args:
+                    self.backpressure_drop = ast.literal_eval(
+                        args['backpressure_drop'])
+            except (ValueError, SyntaxError):
+                LOG.error("`backpressure_max_wait` must be an integer and "
+                          "`backpressure_drop` a boolean.")
+                return False
+            LOG.info("Backpressure mode %s w/ max_wait=%ss and drop=%s"
+                     % (self.backpressure, self.backpressure_max_wait,
+                        self.backpressure_drop))
+
+        # disk-backed spill queue of the messages the producer cannot accept.
+        if 'spill_dir' in args:
+            self.spill_dir = args['spill_dir']
+            try:
+                self._spill_queue = SpillQueue(
+                    self.spill_dir,
+                    max_bytes=int(args.get('spill_max_bytes',
+                                           DEFAULT_SPILL_MAX_BYTES)),
+                    segment_bytes=int(args.get('spill_segment_bytes',
+                                               DEFAULT_SPILL_SEGMENT_BYTES)))
+            except (IOError, OSError, ValueError) as e:
+                LOG.error("Cannot open spill queue %s: %s"
+                          % (self.spill_dir, e))
+                return False
+            LOG.info("Messages the producer cannot accept will be spilled "
+                     "to %s" % self.spill_dir)
+            # spilled messages are removed from the disk once delivered: the
+            # successful deliveries must be reported too.
+            self._conf.pop('delivery.report.only.error', None)
+            self.delivery_reporter.successes = True
+            # the brokers being down, messages fail on delivery.
+            if not self.shared_producer:
+                self._conf['on_delivery'] = self._on_delivery
+
+        # batch mode: accumulate messages and produce them from `flush()`.
+        if 'batch_lines' in args:
+            try:
+                self.batch_lines = int(args['batch_lines'])
+                if 'batch_timeout' in args:
+                    self.batch_timeout = int(args['batch_timeout']) / 1000.0
+            except ValueError:
+                LOG.error("`batch_lines` and `batch_timeout` must be integers.")
+                return False
+            LOG.info("Batch mode w/ batch_lines=%s and batch_timeout=%ss"
+                     % (self.batch_lines, self.batch_timeout))
+
+        # sampled stage timings, see `syslogng_kafka.instrument`.
+        if 'instrument_sample' in args:
+            try:
+                self.instrument_sample = int(args['instrument_sample'])
+                if self.instrument_sample:
+                    self._timer = StageTimer(
+                        self.instrument_sample,
+                        int(args.get('instrument_interval',
+                                     DEFAULT_INSTRUMENT_INTERVAL)))
+            except ValueError as e:
+                LOG.error("Bad `instrument_sample` or `instrument_interval`: "
+                          "%s" % e)
+                return False
+            LOG.info("Timing 1 in %s messages" % self.instrument_sample)
+
+        # parsers by program, see `syslogng_kafka.parsers`.
+        try:
+            kv_parsers = None
+            if 'kv_parsers' in args:
+                kv_parsers = ast.literal_eval(args['kv_parsers'])
+            self.parsers = build_parsers(kv_parsers)
+        except (ValueError, SyntaxError, AttributeError) as e:
+            LOG.error("Given kv_parsers %s are not valid: %s"
+                      % (args['kv_parsers'], e))
+            return False
+        LOG.info("Programs w/ a parser %s" % sorted(self.parsers))
+
+        # windowed duplicate suppression, see `syslogng_kafka.dedup`.
+        if 'dedup_fields' in args:
+            self.dedup_fields = parse_str_list(args['dedup_fields'])
+            if self.serializer == 'avro':
+                LOG.error("`dedup_fields` cannot be used w/ the avro "
+                          "serializer: its schema has no count.")
+                return False
+            try:
+                self._dedup = Deduplicator(
+                    self.dedup_fields,
+                    programs=parse_str_list(args['dedup_programs'])
+                    if 'dedup_programs' in args else DEFAULT_DEDUP_PROGRAMS,
+                    window=int(args.get('dedup_window',
+                                        DEFAULT_DEDUP_WINDOW)) / 1000.0,
+                    max_keys=int(args.get('dedup_max_keys',
+                                          DEFAULT_DEDUP_MAX_KEYS)))
+            except ValueError as e:
+                LOG.error("Bad deduplication options: %s" % e)
+                return False
+            LOG.info("Messages of %s deduplicated on %s over %ss"
+                     % (sorted(self._dedup.programs), self.dedup_fields,
+                        self._dedup.window))
+
+        self._plan = compile_send_plan(
+            self._serialize, programs=self.programs,
+            exclude_programs=self.exclude_programs, parsers=self.parsers,
+            msg_key=self.msg_key, partition=self.partition,
+            router=self._router, partitioner=self._partitioner,
+            on_delivery=self._delivery_callback() if self.shared_producer
+            else None, deduplicator=self._dedup)
+        self._program_filter = self._plan.program_filter
+
+        if self.metrics_port is not None:
+            try:
+                self._metrics_server = MetricsServer(
+                    self.metrics, self.metrics_port, self.metrics_address)
+            except (IOError, OSError) as e:
+                LOG.error("Cannot serve metrics on %s:%s: %s"
+                          % (self.metrics_address, self.metrics_port, e))
+                return False
+            self._metrics_server.start()
+            LOG.info("Metrics served at http://%s:%s/metrics"
+                     % (self.metrics_address, self._metrics_server.port))
+
         LOG.info(
             "Initialization of Kafka Python driver w/ args=%s" % self._conf)
         return True
 
+    def _init_workers(self, args):
+        """ Initialization in worker mode, see `syslogng_kafka.worker`.
+
+        The options of the workers are checked by initializing a destination
+        w/ them here.
+        """
+        try:
+            self.workers = int(args['workers'])
+            self.worker_ring_bytes = int(args.get('worker_ring_bytes',
+                                                  DEFAULT_WORKER_RING_BYTES))
+        except ValueError:
+            LOG.error("`workers` and `worker_ring_bytes` must be integers.")
+            return False
+        if self.workers < 1:
+            LOG.error("`workers` must be at least 1.")
+            return False
+        if 'batch_lines' in args:
+            # a batch failing in a worker could not be retried by syslog-ng.
+            LOG.error("`batch_lines` cannot be used w/ `workers`.")
+            return False
+        if self.workers > 1 and ('spill_dir' in args or
+                                 'metrics_port' in args):
+            LOG.error("`spill_dir` and `metrics_port` cannot be shared by "
+                      "several workers.")
+            return False
+        self._worker_args = dict((key, value) for key, value in args.items()
+                                 if key not in WORKER_OPTIONS)
+        probe = type(self)()
+        try:
+            if not probe.init(self._worker_args):
+                return False
+        finally:
+            probe.deinit()
+        self.hosts = probe.hosts
+        self.topic = probe.topic
+        # messages filtered out are not handed to the workers.
+        self._program_filter = probe._program_filter
+        LOG.info("Messages handed to %d workers w/ a ring buffer of %d bytes "
+                 "each" % (self.workers, self.worker_ring_bytes))
+        return True
+
     def open(self):
         """ Open a connection to the Kafka service.
 
         Should return False if initialization fails.
         """
+        if self.workers:
+            try:
+                self._workers = WorkerPool(type(self), self._worker_args,
+                                           self.workers,
+                                           self.worker_ring_bytes)
+            except (ValueError, EnvironmentError) as e:
+                LOG.error("Cannot create the worker ring buffers: %s" % e)
+                return False
+            self._workers.start()
+            return True
         LOG.info("Opening connection to the remote Kafka services at %s"
                  % self.hosts)
-        self._kafka_producer = Producer(**self._conf)
+        if self.shared_producer:
+            self._kafka_producer = POOL.acquire(self._producer_conf(),
+                                                factory=Producer)
+        else:
+            self._kafka_producer = Producer(**self._producer_conf())
+        if self._spill_queue is not None:
+            self._spill_drainer = SpillDrainer(
+                self._spill_queue, self._kafka_producer,
+                on_delivery=self.delivery_reporter)
+            self._spill_drainer.start()
+        if self._partitioner is not None:
+            self._partition_refresher = PartitionRefresher(
+                self._partitioner, self._kafka_producer,
+                interval=self.partition_refresh_interval)
+            self._partition_refresher.start()
         return True
 
     def is_opened(self):
@@ -139,32 +609,221 @@ class KafkaDestination(object):
 
         Should return False if target is not open.
         """
-        return self._kafka_producer is not None
+        return self._kafka_producer is not None or self._workers is not None
 
     def close(self):
         """ Close the connection to the Kafka service.
         """
         LOG.debug("KafkaDestination.close()....")
+        if self._rate_limiter is not None and self._rate_limiter.counters:
+            LOG.info("Rate limit counters: %s, top keys: %s"
+                     % (dict(self._rate_limiter.counters),
+                        self._rate_limiter.top()))
+        if self._workers is not None:
+            # the workers drain their ring and flush their producer.
+            self._workers.stop()
+            if self._workers.counters:
+                LOG.info("Worker counters: %s" % dict(self._workers.counters))
+            self._workers = None
+            return True
+        if self._spill_drainer is not None:
+            self._spill_drainer.stop()
+            self._spill_drainer = None
+        if self._partition_refresher is not None:
+            self._partition_refresher.stop()
+            self._partition_refresher = None
         if self._kafka_producer is not None:
-            LOG.debug("Flushing producer w/ a timeout of 30 seconds...")
-            self._kafka_producer.flush(30)
+            if self._dedup is not None:
+                self._produce_deduplicated(drain=True)
+                LOG.info("Deduplication counters: %s"
+                         % dict(self._dedup.counters))
+            self._flush()
+            if self.shared_producer:
+                # flushed by its last user only
+                self._release_producer()
+            else:
+                LOG.debug("Flushing producer w/ a timeout of 30 seconds...")
+                self._kafka_producer.flush(30)
+            if self._retired:
+                self._poll_retired(timeout=PRODUCER_REPLACE_TIMEOUT)
+        if self.delivery_reporter is not None:
+            self.delivery_reporter.report()
+        if self.backpressure_counters:
+            LOG.info("Backpressure counters: %s"
+                     % dict(self.backpressure_counters))
+        if self._timer is not None:
+            self._timer.dump()
         return True
 
-    # noinspection PyMethodMayBeStatic
     def deinit(self):
         """ This method is called at deinitialization time.
         """
         LOG.debug("KafkaDestination.deinit()....")
+        if self._kafka_producer is not None and self.shared_producer:
+            self._release_producer()
         if self._kafka_producer:
             self._kafka_producer = None
+        if self._spill_queue is not None:
+            LOG.info("Spill queue counters: %s"
+                     % dict(self._spill_queue.counters))
+            self._spill_queue.close()
+            self._spill_queue = None
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
         return True
 
+    def _release_producer(self):
+        """ Give the shared producer back to the pool.
+        """
+        POOL.release(self._kafka_producer,
+                     stats_cb=self._conf.get('stats_cb'))
+        self._kafka_producer = None
+
+    def _producer_conf(self):
+        """ Configuration of the producer w/ the auto-tuned settings.
+        """
+        if self._tuner is None:
+            return self._conf
+        conf = dict(self._conf)
+        conf.update(self._tuner.settings)
+        return conf
+
+    def _delivery_callback(self):
+        """ `on_delivery` callback of the produced messages. """
+        if self._spill_queue is not None:
+            return self._on_delivery
+        return self.delivery_reporter
+
+    def _on_delivery(self, err, msg):
+        """ `on_delivery` callback spilling the messages whose delivery
+        failed w/ an error worth retrying, e.g. timed out w/ the brokers down.
+
+        Replayed messages have a callback of their own, see `SpillDrainer`.
+        """
+        self.delivery_reporter(err, msg)
+        queue = self._spill_queue
+        if err is None or msg is None or queue is None or \
+                not retriable_delivery(err):
+            return
+        partition = None
+        if self.partition is not None or self._partitioner is not None:
+            # picked by the destination, not by librdkafka
+            partition = msg.partition()
+        try:
+            queue.append(msg.topic(), msg.value(), key=msg.key(),
+                         partition=partition)
+        except (IOError, OSError, ValueError) as e:
+            LOG.error("Cannot spill undelivered message: %s" % e)
+
+    def _on_stats(self, json_str):
+        """ `stats_cb` feeding the metrics registry and the auto-tuner.
+        """
+        stats = json.loads(json_str)
+        name = stats.get('name')
+        if self._retired and name is not None and name in [
+                retired[2] for retired in self._retired]:
+            # a replaced producer delivering its messages
+            return
+        self._stats_name = name
+        if self.metrics is not None:
+            counters = {'backpressure': self.backpressure_counters}
+            if self.delivery_reporter is not None:
+                counters['delivery'] = self.delivery_reporter.counters
+                counters['delivery_error'] = self.delivery_reporter.errors
+            if self._spill_queue is not None:
+                counters['spill'] = self._spill_queue.counters
+            self.metrics.update(stats, counters)
+        if self._tuner is not None and self._tuner(stats) is not None:
+            # the producer cannot be replaced from its own callback.
+            self._retune = True
+        if self.display_stats:
+            _log_stats(stats)
+
+    def flush(self):
+        """ Produce the messages accumulated by `send()` in batch mode.
+
+        Called by syslog-ng >= 3.18 when `batch-lines()` or `batch-timeout()`
+        is reached. Older versions never call it: the destination then flushes
+        itself from `send()` and `close()`.
+
+        :return: SUCCESS if at least part of the batch was handed to the
+        producer, ERROR if the whole batch failed and can be retried.
+        """
+        self._rewinds_batches = True
+        if self._dedup is not None and self._kafka_producer is not None:
+            # windows ended w/o a message since
+            self._produce_deduplicated()
+        if not self._batch and self.delivery_reporter is not None:
+            self.delivery_reporter.maybe_report()
+        return self._flush()
+
+    def _flush(self):
+        """ Produce the batch, see `flush()`.
+
+        A batch held back before any message was produced is kept for the
+        next flush, unless syslog-ng retries it itself.
+        """
+        if not self._batch:
+            return SUCCESS
+        start = clock_ns()
+        batch = self._batch
+        self._batch = []
+        self._batch_started = None
+
+        failed = 0
+        for i, (msg_string, kwargs) in enumerate(batch):
+            result = self._produce(msg_string, kwargs, batch=True)
+            if result == _HELD:
+                if i == 0:
+                    LOG.error("Batch of %d messages held back.", len(batch))
+                    if not self._rewinds_batches:
+                        # only the message of `send()` is retried by
+                        # syslog-ng < 3.18, see `_enqueue()`.
+                        self._batch = batch + self._batch
+                        self._batch_started = time()
+                    # else syslog-ng retries the whole batch.
+                    return ERROR
+                # keep the rest for the next flush to avoid duplicates.
+                LOG.warning("Batch of %d messages: %d held back until next "
+                            "flush.", len(batch), len(batch) - i)
+                self._batch = batch[i:] + self._batch
+                self._batch_started = time()
+                batch = batch[:i]
+                break
+            if result == _DROPPED:
+                failed += 1
+        # a single poll per batch to serve delivery reports.
+        self._poll()
+        if self._timer is not None:
+            self._timer.record('flush', clock_ns() - start)
+            self._timer.maybe_dump()
+
+        if failed:
+            LOG.error("Batch of %d messages: %d produced, %d failed.",
+                      len(batch), len(batch) - failed, failed)
+            if failed == len(batch):
+                return ERROR
+        elif self.verbose:
+            LOG.debug("Batch of %d messages produced.", len(batch))
+        return SUCCESS
+
     def send(self, ro_msg):
         """ Send a message to the target service
 
         It should return True to indicate success, False will suspend the
         destination for a period specified by the time-reopen() option.
 
+        In batch mode the message is only queued and QUEUED is returned, the
+        batch being produced by `flush()`. False is returned if the flush it
+        triggers fails, see `_enqueue()`.
+
+        In worker mode the message is only copied to the ring buffer of a
+        worker process, see `syslogng_kafka.worker`.
+
+        Messages over the rate limit of their key are dropped first, see
+        `syslogng_kafka.ratelimit`.
+
         :return: True or False
         """
 
@@ -172,94 +831,388 @@ class KafkaDestination(object):
         if not ro_msg:
             return True
 
+        # only the key fields are fetched from the messages over the limit.
+        limiter = self._rate_limiter
+        if limiter is not None and not limiter(ro_msg):
+            return True
+
+        if self._workers is not None:
+            if self._program_filter is not None and \
+                    self._filtered_out(ro_msg):
+                return True
+            msg = self._message_dict(ro_msg)
+            if msg is None:
+                return False
+            # suspend the destination if the workers are behind.
+            return self._workers.put(msg)
+
+        return self._send(ro_msg)
+
+    def send_message(self, msg):
+        """ Send a message dictionary `send()` handed to a worker process,
+        see `syslogng_kafka.worker`.
+
+        :return: same as `send()`
+        """
+        if not msg:
+            return True
+        return self._send(msg, decoded=True)
+
+    def _send(self, ro_msg, decoded=False):
+        """ Filter, parse, serialize and produce a message, see `send()`.
+
+        :param decoded: `ro_msg` is a message dictionary decoded by a worker
+        process, not `value-pairs`.
+        """
+        if self._dedup is not None:
+            self._produce_deduplicated()
+
+        if self._program_filter is not None and not decoded and \
+                self._filtered_out(ro_msg):
+            return True
+
+        timer = self._timer
+        if timer is not None and timer.sample():
+            return self._send_sampled(ro_msg, timer, decoded)
+
+        msg = ro_msg if decoded else self._message_dict(ro_msg)
+        if msg is None:
+            return False
+
+        prepared = self._plan(msg)
+        if prepared is None:
+            # filtered out: notify of success
+            return True
+
+        if self.batch_lines:
+            return self._enqueue(prepared)
+
+        result = self._produce(*prepared)
+        if result == _PRODUCED:
+            # `poll()` doesn't do any sleeping at all if you give it 0, all
+            # it does is grab a mutex, check a queue, and release the mutex.
+            # It is okay to call poll(0) after each produce call, the
+            # performance impact is negligible, if any.
+            self._poll()
+        elif result == _HELD:
+            # suspend the destination, syslog-ng retries the message after
+            # `time-reopen()`.
+            return False
+        return True
+
+    def _filtered_out(self, ro_msg):
+        """ True if the program filter rejects a syslog-ng `LogMessage`,
+        only its PROGRAM being fetched. Message dictionaries are left to the
+        filter step of the plan.
+        """
+        if isinstance(ro_msg, dict):
+            return False
+        try:
+            return not self._program_filter(ro_msg.PROGRAM)
+        except AttributeError:
+            # reported by `_message_dict()`
+            return False
+
+    def _send_sampled(self, ro_msg, timer, decoded=False):
+        """ `send()` timing every stage, see `syslogng_kafka.instrument`.
+        """
+        record = timer.record
+        begin = start = clock_ns()
+        msg = ro_msg if decoded else self._message_dict(ro_msg)
+        if msg is None:
+            return False
+        end = clock_ns()
+        record('message', end - start)
+
+        prepared = self._plan.timed(msg, record)
+        if prepared is None:
+            return True
+        if self.batch_lines:
+            return self._enqueue(prepared)
+
+        start = clock_ns()
+        result = self._produce(*prepared)
+        end = clock_ns()
+        record('produce', end - start)
+        if result == _PRODUCED:
+            self._poll()
+            start, end = end, clock_ns()
+            record('poll', end - start)
+        record('send', end - begin)
+        timer.maybe_dump()
+        return result != _HELD
+
+    def _message_dict(self, ro_msg):
+        """ The message dictionary of a syslog-ng `LogMessage` or
+        `value-pairs` dict, None if syslog-ng is not supported.
+        """
         # no syslog-ng `values-pair` here we dealing with `LogMessage`
         if type(ro_msg) != dict:
             # syslog-ng `LogMessage` is read-only
             # goal is rfc5424 we cannot use values-pair because of memory leaks
             try:
-                msg = {'FACILITY': ro_msg.FACILITY, 'PRIORITY': ro_msg.PRIORITY,
-                       'HOST': ro_msg.HOST, 'PROGRAM': ro_msg.PROGRAM,
-                       'DATE': ro_msg.DATE, 'MESSAGE': ro_msg.MESSAGE}
+                return {'FACILITY': ro_msg.FACILITY,
+                        'PRIORITY': ro_msg.PRIORITY,
+                        'HOST': ro_msg.HOST, 'PROGRAM': ro_msg.PROGRAM,
+                        'DATE': ro_msg.DATE, 'MESSAGE': ro_msg.MESSAGE}
             except AttributeError:
                 LOG.error("Your version of syslog-ng is not supported. "
                           "Please use syslog-ng 3.7.x")
-                return False
-        else:
-            LOG.warn("You are using `values-pair` if you are using "
-                     "syslog-ng <= 3.11 it is known to be leaking...")
-            msg = ro_msg
+                return None
+        LOG.warn("You are using `values-pair` if you are using "
+                 "syslog-ng <= 3.11 it is known to be leaking...")
+        return ro_msg
+
+    def _produce_deduplicated(self, drain=False):
+        """ Produce the messages the deduplicator held whose window ended.
+
+        :param drain: produce every held message, e.g. on close
+        """
+        dedup = self._dedup
+        messages = dedup.drain() if drain else dedup.expired()
+        if not messages:
+            return
+        plan = self._plan
+        for i, msg in enumerate(messages):
+            prepared = plan.finish(msg)
+            if self.batch_lines:
+                self._enqueue(prepared, retried=False)
+            elif self._produce(*prepared) == _HELD:
+                if drain:
+                    LOG.error("%d deduplicated messages held back on close "
+                              "are lost." % (len(messages) - i))
+                else:
+                    # retried on the next message
+                    dedup.hold_back(messages[i:])
+                break
+        if not self.batch_lines:
+            self._poll()
+
+    def _enqueue(self, prepared, retried=True):
+        """ Add a prepared message to the batch, see `flush()`.
+
+        :param retried: syslog-ng retries the message when the destination
+        is suspended, i.e. it comes from `send()`.
+        :return: QUEUED, the result of the flush or False if it failed and
+        the destination should be suspended.
+        """
+        now = time()
+        if self._batch_started is None:
+            self._batch_started = now
+        self._batch.append(prepared)
+        # syslog-ng < 3.18 does not call `flush()`.
+        if len(self._batch) >= self.batch_lines or (
+                now - self._batch_started >= self.batch_timeout):
+            result = self._flush()
+            if result != ERROR or self._rewinds_batches:
+                return result
+            # syslog-ng < 3.18 only checks the truth value of the result,
+            # ERROR being true: suspend the destination. The message is
+            # retried by syslog-ng, the rest of a held batch being kept.
+            if retried and self._batch and self._batch[-1] is prepared:
+                self._batch.pop()
+            return False
+        return QUEUED
+
+    def _poll(self):
+        """ Serve the producer callbacks and apply the profile picked by the
+        auto-tuner, if any.
+        """
+        self._kafka_producer.poll(0)
+        if self.delivery_reporter is not None:
+            self.delivery_reporter.maybe_report()
+        if self._retired:
+            self._poll_retired()
+        if self._retune:
+            self._retune = False
+            self._replace_producer()
+
+    def _poll_retired(self, timeout=0):
+        """ Serve the callbacks of the replaced producers and forget those
+        w/ all their messages delivered or past their deadline.
+
+        :param timeout: seconds to wait for the delivery of their messages,
+        bounded by their deadline
+        """
+        now = time()
+        retired = []
+        for producer, deadline, name in self._retired:
+            if timeout:
+                remaining = producer.flush(max(min(timeout, deadline - now),
+                                               0))
+            else:
+                producer.poll(0)
+                remaining = len(producer)
+            if not remaining:
+                continue
+            if timeout or now >= deadline:
+                LOG.error("Auto-tuning: %d messages of the previous producer "
+                          "not delivered after %ss", remaining,
+                          PRODUCER_REPLACE_TIMEOUT)
+                continue
+            retired.append((producer, deadline, name))
+        self._retired = retired
+
+    def _replace_producer(self):
+        """ Replace the producer by one w/ the current auto-tuned settings.
+
+        The previous producer keeps delivering its messages in the
+        background and is polled over the next sends, see `_poll_retired()`.
+        Its statistics are ignored meanwhile.
+        """
+        previous = self._kafka_producer
+        LOG.info("Auto-tuning: recreating the producer w/ %s"
+                 % self._tuner.settings)
         try:
+            producer = Producer(**self._producer_conf())
+        except KafkaException as e:
+            LOG.error("Auto-tuning: cannot recreate the producer, keeping "
+                      "the previous one: %s" % e)
+            return
+        self._retired.append((previous, time() + PRODUCER_REPLACE_TIMEOUT,
+                              self._stats_name))
+        self._stats_name = None
+        self._tuner.reset()
+        self._kafka_producer = producer
+        if self._spill_drainer is not None:
+            self._spill_drainer.producer = producer
+        if self._partition_refresher is not None:
+            self._partition_refresher.producer = producer
 
-            # check if we do have a program filter defined.
-            msg_program = msg['PROGRAM']
-            if self.programs is not None:
-                if msg_program not in self.programs:
-                    # notify of success
-                    return True
-            if msg_program == 'firewall':
-                firewall_msg = msg['MESSAGE']
-                msg['MESSAGE'] = parse_firewall_msg(firewall_msg)
-            elif msg_program == 'nat':
-                nat_msg = msg['MESSAGE']
-                msg['MESSAGE'] = parse_nat_msg(nat_msg)
-            # convert date string to UNIX timestamp
-            msg_date = msg['DATE']
-            if msg_date is not None:
-                msg['DATE'] = date_str_to_timestamp(msg_date)
-
-            msg_string = str(msg)
-
-            kwargs = {}
-            if self.msg_key and self.msg_key in msg.keys():
-                kwargs['key'] = msg[self.msg_key]
-            if self.partition:
-                try:
-                    kwargs['partition'] = int(self.partition)
-                except ValueError:
-                    LOG.warning(
-                        "Ignore partition=%s because it is not an int."
-                        % self.partition)
-
-            self._kafka_producer.produce(self.topic, msg_string, **kwargs)
+    def _produce(self, msg_string, kwargs, batch=False):
+        """ Hand a serialized message to the producer.
 
-            # `poll()` doesn't do any sleeping at all if you give it 0, all
-            # it does is grab a mutex, check a queue, and release the mutex.
-            # It is okay to call poll(0) after each produce call, the
-            # performance impact is negligible, if any.
-            self._kafka_producer.poll(0)
+        :param batch: the message is part of a batch, see `flush()`: a full
+        producer queue is waited for once and holds the rest of the batch
+        back instead of discarding messages after a wait each.
+        :return: _PRODUCED if the message was accepted by the producer,
+        _SPILLED if it was written to the spill queue, _DROPPED if it was
+        discarded and _HELD if it should be retried later.
+        """
+        counters = self.backpressure_counters
+        topic = self.topic
+        if 'topic' in kwargs:
+            # routed message, see `syslogng_kafka.routing`.
+            kwargs = dict(kwargs)
+            topic = kwargs.pop('topic')
+        try:
+            self._kafka_producer.produce(topic, msg_string, **kwargs)
+            return _PRODUCED
         except BufferError:
+            counters['queue_full'] += 1
+            if self.backpressure == 'adaptive':
+                if self._backpressure(topic, msg_string, kwargs):
+                    return _PRODUCED
+                if self._spill_queue is not None:
+                    return self._spill(topic, msg_string, kwargs)
+                return self._backpressure_exhausted(batch)
+            if self._spill_queue is not None:
+                return self._spill(topic, msg_string, kwargs)
+            if batch:
+                LOG.error("Producer queue is full. Holding the batch back. "
+                          "%d messages waiting to be delivered.",
+                          len(self._kafka_producer))
+                sleep(5)
+                counters['held'] += 1
+                return _HELD
             LOG.error("Producer queue is full. This message will be discarded. "
                       "%d messages waiting to be delivered.",
                       len(self._kafka_producer))
             # do not return False here as the destination would be closed
             # and we would have to restart syslog-ng
             sleep(5)
-            return True
-        except (KafkaException, UnicodeEncodeError) as e:
+        except KafkaException as e:
+            counters['errors'] += 1
             LOG.error("An error occurred while trying to send messages...   "
                       "See details: %s" % e, exc_info=True)
-            sleep(5)
-            # do not return False here as the destination would be closed
-            # and we would have to restart syslog-ng
-            return True
+            error = e.args[0] if e.args else None
+            retriable = getattr(error, 'retriable', lambda: False)()
+            # a message rejected for good, e.g. too large, is not spilled:
+            # it would be rejected again on replay.
+            if retriable and self._spill_queue is not None:
+                return self._spill(topic, msg_string, kwargs)
+            if self.backpressure == 'adaptive':
+                if retriable:
+                    counters['held'] += 1
+                    return _HELD
+            elif not batch:
+                sleep(5)
+        except UnicodeEncodeError as e:
+            counters['errors'] += 1
+            LOG.error("An error occurred while trying to send messages...   "
+                      "See details: %s" % e, exc_info=True)
+            if self.backpressure != 'adaptive' and not batch:
+                sleep(5)
+        counters['dropped'] += 1
+        return _DROPPED
 
-        return True
+    def _backpressure(self, topic, msg_string, kwargs):
+        """ Wait for the producer queue to drain and retry.
+
+        The producer is polled to serve delivery reports w/ a timeout doubling
+        after every attempt until `backpressure_max_wait` is reached.
+
+        :return: True if the message was eventually accepted.
+        """
+        producer = self._kafka_producer
+        counters = self.backpressure_counters
+        timeout = BACKPRESSURE_MIN_WAIT
+        waited = 0.0
+        while waited < self.backpressure_max_wait:
+            timeout = min(timeout, self.backpressure_max_wait - waited)
+            producer.poll(timeout)
+            counters['polls'] += 1
+            waited += timeout
+            timeout *= 2
+            try:
+                producer.produce(topic, msg_string, **kwargs)
+                counters['retried'] += 1
+                return True
+            except BufferError:
+                pass
+        return False
 
+    def _backpressure_exhausted(self, batch=False):
+        """ Drop or hold back a message the producer still does not accept
+        after `backpressure_max_wait`.
 
-def delivery_callback(err, msg):
-    if err is not None:
+        :param batch: the message is part of a batch: the rest of the batch
+        is held back even w/ `backpressure_drop` so that it is not waited for
+        again message by message.
+        """
+        if self.backpressure_drop and not batch:
+            self.backpressure_counters['dropped'] += 1
+            LOG.error("Producer queue still full after %ss. This message "
+                      "will be discarded. %d messages waiting to be "
+                      "delivered.", self.backpressure_max_wait,
+                      len(self._kafka_producer))
+            return _DROPPED
+        self.backpressure_counters['held'] += 1
+        LOG.warning("Producer queue still full after %ss. Holding messages "
+                    "back. %d messages waiting to be delivered.",
+                    self.backpressure_max_wait, len(self._kafka_producer))
+        return _HELD
+
+    def _spill(self, topic, msg_string, kwargs):
+        """ Write a message the producer cannot accept to the spill queue.
+        """
         try:
-            LOG.error("Failed to deliver message: {0}: {1}"
-                      .format(msg.value(), err.str()))
-        except UnicodeDecodeError:
-            LOG.error("Failed to deliver message: {0}: {1}"
-                      .format(msg.value(), repr(err)))
-    elif msg is not None:
-        LOG.debug("Message produced: {0}".format(msg.value()))
+            self._spill_queue.append(topic, msg_string,
+                                     key=kwargs.get('key'),
+                                     partition=kwargs.get('partition'))
+        except (IOError, OSError, ValueError) as e:
+            LOG.error("Cannot spill message: %s" % e)
+            self.backpressure_counters['dropped'] += 1
+            return _DROPPED
+        self.backpressure_counters['spilled'] += 1
+        return _SPILLED
 
 
 def stats_callback(json_str):
-    producer_metrics = json.loads(json_str)
+    _log_stats(json.loads(json_str))
+
+
+def _log_stats(producer_metrics):
     LOG.info("Message count: %s" % producer_metrics['msg_cnt'])
     for broker in producer_metrics['brokers']:
         LOG.info(producer_metrics['brokers'][broker]['throttle'])
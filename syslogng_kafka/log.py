@@ -1,12 +1,40 @@
 # -*- coding: utf-8 -*-
 
-"""A library that provides a custom logger for the `KafkaDestination` object."""
+"""A library that provides a custom logger for the `KafkaDestination` object.
 
+The logger writes synchronously to stdout until `configure_logging()` is
+called. It then hands the records to a bounded queue emptied by a background
+thread which formats and writes them, so that logging never blocks the
+thread calling `send()`. Repeated identical messages are suppressed and
+counted, records are dropped and counted when the queue is full.
+"""
+
+import atexit
 import logging
+import logging.handlers
 import sys
+import threading
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
 
 from syslog_rfc5424_formatter import RFC5424Formatter
 
+# default `log_level`
+DEFAULT_LOG_LEVEL = 'DEBUG'
+
+# default `log_target`
+DEFAULT_LOG_TARGET = 'stdout'
+
+# default `log_queue_size`
+DEFAULT_LOG_QUEUE_SIZE = 10000
+
+# seconds w/o a new record after which the repeat count of the last message
+# is written
+REPEAT_FLUSH_INTERVAL = 1.0
+
 LOG = logging.getLogger('syslogng_kafka')
 LOG.setLevel(logging.DEBUG)
 
@@ -17,3 +45,158 @@ formatter = RFC5424Formatter()
 ch.setFormatter(formatter)
 
 LOG.addHandler(ch)
+
+
+class AsyncHandler(logging.Handler):
+    """ Handler queueing records for a writer thread handing them to
+    `target`.
+    """
+
+    def __init__(self, target, queue_size=DEFAULT_LOG_QUEUE_SIZE):
+        """
+        :param target: the `logging.Handler` formatting and writing records
+        :param queue_size: maximum number of records waiting to be written
+        """
+        super(AsyncHandler, self).__init__()
+        self.target = target
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.suppressed = 0
+        self._last = None
+        self._repeats = 0
+        self._thread = threading.Thread(target=self._run,
+                                        name='syslogng_kafka-log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=REPEAT_FLUSH_INTERVAL)
+            except queue.Empty:
+                self._write_repeats()
+                continue
+            if record is None:
+                self._write_repeats()
+                return
+            if isinstance(record, threading.Event):
+                self._write_repeats()
+                record.set()
+                continue
+            self._write(record)
+
+    def _write(self, record):
+        try:
+            key = (record.levelno, record.getMessage())
+        except Exception:
+            self.target.handleError(record)
+            return
+        if self._last is not None and key == self._last[0]:
+            self._repeats += 1
+            self.suppressed += 1
+            return
+        self._write_repeats()
+        self._last = key, record
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.target.handle(logging.makeLogRecord(dict(
+                record.__dict__, levelno=logging.WARNING,
+                levelname='WARNING', exc_info=None, exc_text=None, args=None,
+                msg="%d log records dropped: log queue full" % dropped)))
+        self.target.handle(record)
+
+    def _write_repeats(self):
+        if not self._repeats:
+            return
+        record = self._last[1]
+        self.target.handle(logging.makeLogRecord(dict(
+            record.__dict__, exc_info=None, exc_text=None, args=None,
+            msg="Last message repeated %d times" % self._repeats)))
+        self._repeats = 0
+        self._last = None
+
+    def flush(self, timeout=5.0):
+        """ Wait for the queued records to be written.
+        """
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+        self.target.flush()
+
+    def close(self):
+        """ Write the queued records and stop the writer thread.
+        """
+        if self._thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self._thread.join()
+        self.target.close()
+        super(AsyncHandler, self).close()
+
+
+def _target_handler(target):
+    if target == 'stdout':
+        return logging.StreamHandler(sys.__stdout__)
+    if target == 'stderr':
+        return logging.StreamHandler(sys.__stderr__)
+    if target == 'syslog':
+        return logging.handlers.SysLogHandler('/dev/log')
+    return logging.handlers.WatchedFileHandler(target)
+
+
+_config = None
+
+
+def configure_logging(level=DEFAULT_LOG_LEVEL, target=DEFAULT_LOG_TARGET,
+                      async_=True, queue_size=DEFAULT_LOG_QUEUE_SIZE):
+    """ Replace the handler of `LOG`. Nothing is done if the configuration
+    did not change.
+
+    :param level: name of the minimum level logged, e.g. INFO
+    :param target: stdout, stderr, syslog or the path of a file
+    :param async_: if True, records are written by a background thread
+    :param queue_size: maximum number of records waiting to be written
+    :raise ValueError: if the level is unknown
+    :raise IOError: if the file cannot be opened
+    """
+    global ch, _config
+    levelno = logging.getLevelName(level.upper())
+    if not isinstance(levelno, int):
+        raise ValueError("Unknown log level %s" % level)
+    config = (levelno, target, async_, queue_size)
+    if config == _config:
+        return
+    handler = _target_handler(target)
+    handler.setFormatter(formatter)
+    if async_:
+        handler = AsyncHandler(handler, queue_size)
+    LOG.setLevel(levelno)
+    LOG.addHandler(handler)
+    LOG.removeHandler(ch)
+    ch.close()
+    ch, _config = handler, config
+
+
+def after_fork():
+    """ Make the next `configure_logging()` call replace the handler in a
+    forked process, the writer thread of the parent not running there.
+    """
+    global _config
+    _config = None
+
+
+@atexit.register
+def _close():
+    if isinstance(ch, AsyncHandler):
+        ch.close()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""Producer metrics built from the librdkafka statistics.
+
+The statistics emitted every `statistics.interval.ms` are reduced to a set of
+gauges and counters kept in a `MetricsRegistry` and exposed in the Prometheus
+text format by a local HTTP endpoint (`MetricsServer`) and / or a file
+rewritten at each update.
+
+See https://github.com/edenhill/librdkafka/blob/master/STATISTICS.md
+"""
+
+import os
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+
+from .log import LOG
+
+# default `stats_interval_ms` when metrics are exported
+DEFAULT_STATS_INTERVAL_MS = 15000
+
+# default `metrics_address` the HTTP endpoint listens on
+DEFAULT_METRICS_ADDRESS = '127.0.0.1'
+
+PREFIX = 'syslogng_kafka_'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# (statistics field, metric name, type, help) of the top-level statistics
+GLOBAL_METRICS = (
+    ('msg_cnt', 'queue_messages', 'gauge',
+     'Messages in the producer queue.'),
+    ('msg_size', 'queue_bytes', 'gauge',
+     'Size in bytes of the messages in the producer queue.'),
+    ('msg_max', 'queue_max_messages', 'gauge',
+     'Maximum number of messages of the producer queue.'),
+    ('msg_size_max', 'queue_max_bytes', 'gauge',
+     'Maximum size in bytes of the producer queue.'),
+    ('txmsgs', 'tx_messages_total', 'counter',
+     'Messages transmitted to the brokers.'),
+    ('txmsg_bytes', 'tx_message_bytes_total', 'counter',
+     'Size in bytes of the messages transmitted to the brokers.'),
+    ('tx', 'tx_requests_total', 'counter',
+     'Requests sent to the brokers.'),
+    ('time', 'stats_timestamp_seconds', 'gauge',
+     'Time of the last statistics.'),
+)
+
+# (statistics field, metric name, type, help) of each broker
+BROKER_METRICS = (
+    ('txerrs', 'broker_tx_errors_total', 'counter',
+     'Transmission errors.'),
+    ('txretries', 'broker_tx_retries_total', 'counter',
+     'Request retries.'),
+    ('outbuf_cnt', 'broker_outbuf_requests', 'gauge',
+     'Requests awaiting transmission.'),
+    ('waitresp_cnt', 'broker_waitresp_requests', 'gauge',
+     'Requests in-flight awaiting a response.'),
+)
+
+# (statistics window, metric name, help) of each broker, in microseconds
+BROKER_WINDOWS = (
+    ('rtt', 'broker_rtt_seconds', 'Broker round-trip time.'),
+    ('int_latency', 'broker_int_latency_seconds',
+     'Time messages spend in the producer queue.'),
+)
+
+# (window field, quantile label)
+QUANTILES = (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99'))
+
+# (statistics field, metric name, type, help) of each partition
+PARTITION_METRICS = (
+    ('msgq_cnt', 'partition_queue_messages', 'gauge',
+     'Messages in the partition queue.'),
+    ('msgq_bytes', 'partition_queue_bytes', 'gauge',
+     'Size in bytes of the messages in the partition queue.'),
+    ('xmit_msgq_cnt', 'partition_xmit_queue_messages', 'gauge',
+     'Messages ready to be transmitted.'),
+    ('msgs_inflight', 'partition_inflight_messages', 'gauge',
+     'Messages in-flight to the broker.'),
+    ('txmsgs', 'partition_tx_messages_total', 'counter',
+     'Messages transmitted.'),
+)
+
+# fields summed up in `partition_lag_messages`
+PARTITION_LAG = ('msgq_cnt', 'xmit_msgq_cnt', 'msgs_inflight')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+class MetricsRegistry(object):
+    """ In-memory metrics, replaced as a whole at each update.
+
+    Metrics are families of samples by labels:
+
+        {name: (type, help, {((label, value), ...): value})}
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: file rewritten w/ the metrics at each update.
+        """
+        self.path = path
+        self._families = {}
+
+    def _family(self, families, name, kind, doc):
+        return families.setdefault(PREFIX + name, (kind, doc, {}))[2]
+
+    def update(self, stats, counters=None):
+        """ Replace the metrics w/ the given statistics.
+
+        :param stats: librdkafka statistics as a dict
+        :param counters: optional {name: {event: value}} counters of the
+        destination itself, exported as `<name>_events_total`.
+        """
+        families = {}
+        for field, name, kind, doc in GLOBAL_METRICS:
+            if field in stats:
+                self._family(families, name, kind, doc)[()] = stats[field]
+
+        txerrs = txretries = 0
+        for broker in stats.get('brokers', {}).values():
+            labels = (('broker', broker.get('name', '')),)
+            for field, name, kind, doc in BROKER_METRICS:
+                if field in broker:
+                    self._family(families, name, kind, doc)[labels] = \
+                        broker[field]
+            txerrs += broker.get('txerrs', 0)
+            txretries += broker.get('txretries', 0)
+            for window, name, doc in BROKER_WINDOWS:
+                values = broker.get(window)
+                if not values:
+                    continue
+                samples = self._family(families, name, 'gauge', doc)
+                for field, quantile in QUANTILES:
+                    if field in values:
+                        samples[labels + (('quantile', quantile),)] = \
+                            values[field] / 1e6
+                if 'avg' in values:
+                    self._family(families, name + '_avg', 'gauge', doc)[
+                        labels] = values['avg'] / 1e6
+        self._family(families, 'tx_errors_total', 'counter',
+                     'Transmission errors of all brokers.')[()] = txerrs
+        self._family(families, 'tx_retries_total', 'counter',
+                     'Request retries of all brokers.')[()] = txretries
+
+        for topic, topic_stats in stats.get('topics', {}).items():
+            for partition, p_stats in topic_stats.get(
+                    'partitions', {}).items():
+                # -1 is the internal unassigned partition
+                if str(partition) == '-1':
+                    continue
+                labels = (('topic', topic), ('partition', str(partition)))
+                for field, name, kind, doc in PARTITION_METRICS:
+                    if field in p_stats:
+                        self._family(families, name, kind, doc)[labels] = \
+                            p_stats[field]
+                self._family(
+                    families, 'partition_lag_messages', 'gauge',
+                    'Messages produced but not yet acknowledged.')[labels] = \
+                    sum(p_stats.get(field, 0) for field in PARTITION_LAG)
+
+        for name, events in (counters or {}).items():
+            samples = self._family(families, name + '_events_total',
+                                   'counter', 'Destination %s events.'
+                                   % name.replace('_', ' '))
+            for event, value in events.items():
+                samples[(('event', event),)] = value
+
+        self._families = families
+        if self.path:
+            self.write(self.path)
+
+    def get(self, name, **labels):
+        """ Value of a sample, None if unknown.
+        """
+        family = self._families.get(PREFIX + name)
+        if family is None:
+            return None
+        for sample_labels, value in family[2].items():
+            if dict(sample_labels) == labels:
+                return value
+        return None
+
+    def render(self):
+        """ Metrics in the Prometheus text exposition format.
+        """
+        families = self._families
+        lines = []
+        for name in sorted(families):
+            kind, doc, samples = families[name]
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels in sorted(samples):
+                if labels:
+                    lines.append('%s{%s} %s' % (
+                        name, ','.join('%s="%s"' % (k, _escape(v))
+                                       for k, v in labels),
+                        repr(float(samples[labels]))))
+                else:
+                    lines.append('%s %s' % (name,
+                                            repr(float(samples[labels]))))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """ Atomically rewrite `path` w/ the metrics.
+        """
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.render())
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            LOG.error("Cannot write metrics to %s: %s" % (path, e))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOG.debug("Metrics endpoint: " + format % args)
+
+
+class MetricsServer(threading.Thread):
+    """ Local HTTP endpoint serving the metrics of a registry at `/metrics`.
+    """
+
+    def __init__(self, registry, port, address=DEFAULT_METRICS_ADDRESS):
+        """
+        :param registry: the `MetricsRegistry` to serve
+        :param port: port to listen on, 0 for any free port
+        :param address: address to listen on
+        """
+        super(MetricsServer, self).__init__(name='syslogng_kafka-metrics')
+        self.daemon = True
+        self.httpd = HTTPServer((address, port), _MetricsHandler)
+        self.httpd.registry = registry
+
+    @property
+    def port(self):
+        return self.httpd.server_port
+
+    def run(self):
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def stop(self):
+        """ Stop serving and release the socket. """
+        if self.is_alive():
+            self.httpd.shutdown()
+        self.httpd.server_close()
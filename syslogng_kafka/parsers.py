@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""Registry of the parsers of syslog messages by program.
+
+The parsers of a destination are looked up once at initialization time from:
+
+    - the builtin parsers of `PARSERS`,
+    - the `syslogng_kafka.parsers` entry points of the installed packages,
+      the entry point name being the program name,
+    - the key=value parsers declared by the `kv_parsers` destination option.
+
+A parser is a callable taking the syslog message string and returning its
+parsed form.
+"""
+
+from .log import LOG
+from .util import KeyValueParser
+from .util import parse_firewall_event
+from .util import parse_nat_event
+
+# entry point group of the parser plugins
+ENTRY_POINT_GROUP = 'syslogng_kafka.parsers'
+
+# builtin parsers, returning `syslogng_kafka.records.Record` events
+PARSERS = {
+    'firewall': parse_firewall_event,
+    'nat': parse_nat_event,
+}
+
+
+def register_parser(program, parser):
+    """ Register the parser of a program for the destinations initialized from
+    now on.
+
+    :param program: syslog program name
+    :param parser: callable taking the message string
+    """
+    PARSERS[program] = parser
+
+
+def _to_hex_int(value):
+    return int(value, 16)
+
+
+# converters of the `kv_parsers` field types
+TYPES = {
+    'str': None,
+    'int': int,
+    'hex': _to_hex_int,
+    'float': float,
+}
+
+
+class TypedKeyValueParser(KeyValueParser):
+    """ `KeyValueParser` converting the values of its typed fields.
+
+    A value which cannot be converted leaves the field to its default.
+    """
+
+    def __init__(self, fields, flags=()):
+        """
+        :param fields: sequence of (token key, output field, default value)
+        or (token key, output field, default value, type) tuples, type being
+        a key of `TYPES`.
+        :param flags: see `KeyValueParser`.
+        """
+        super(TypedKeyValueParser, self).__init__(
+            [field[:3] for field in fields], flags)
+        self.defaults = dict(self.template)
+        self.converters = {}
+        for field in fields:
+            if len(field) > 3 and TYPES[field[3]] is not None:
+                self.converters[field[1]] = TYPES[field[3]]
+
+    def __call__(self, msg):
+        d = super(TypedKeyValueParser, self).__call__(msg)
+        defaults = self.defaults
+        for field, convert in self.converters.items():
+            value = d[field]
+            if value is defaults[field]:
+                # not in the message
+                continue
+            try:
+                d[field] = convert(value)
+            except (TypeError, ValueError):
+                d[field] = defaults[field]
+        return d
+
+
+def kv_parser(config):
+    """ Build a key=value parser from its configuration.
+
+    :param config: dictionary w/ a `fields` sequence of (token key, output
+    field, default value[, type]) tuples and an optional `flags` sequence of
+    (token prefix, output field, value) tuples.
+    :return: a `TypedKeyValueParser`
+    :raise ValueError: if the configuration is invalid
+    """
+    try:
+        fields = [tuple(field) for field in config['fields']]
+        flags = [tuple(flag) for flag in config.get('flags', ())]
+        for field in fields:
+            if len(field) not in (3, 4) or (
+                    len(field) == 4 and field[3] not in TYPES):
+                raise ValueError("Invalid field %r" % (field,))
+        for flag in flags:
+            if len(flag) != 3:
+                raise ValueError("Invalid flag %r" % (flag,))
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid key=value parser %r" % (config,))
+    return TypedKeyValueParser(fields, flags)
+
+
+def _iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # pragma: no cover
+        import pkg_resources
+        return pkg_resources.iter_entry_points(group)
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    return eps.get(group, ())  # pragma: no cover
+
+
+def load_entry_point_parsers(group=ENTRY_POINT_GROUP):
+    """ Load the parser plugins.
+
+    Plugins which cannot be loaded are logged and skipped.
+
+    :return: dictionary of program name to parser
+    """
+    parsers = {}
+    for entry_point in _iter_entry_points(group):
+        try:
+            parsers[entry_point.name] = entry_point.load()
+        except Exception as e:
+            LOG.error("Cannot load parser plugin %s: %s"
+                      % (entry_point.name, e))
+    return parsers
+
+
+def build_parsers(kv_parsers=None):
+    """ Look up the parsers of a destination.
+
+    :param kv_parsers: optional dictionary of program name to `kv_parser()`
+    configuration.
+    :return: dictionary of program name to parser
+    :raise ValueError: if a key=value parser configuration is invalid
+    """
+    parsers = dict(PARSERS)
+    parsers.update(load_entry_point_parsers())
+    for program, config in (kv_parsers or {}).items():
+        parsers[program] = kv_parser(config)
+    return parsers
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""Consistent-hash partitioning of syslog messages.
+
+The partition of a message is given by the value of a message field, e.g.
+HOST, on a hash ring w/ `vnodes` points per partition. Adding partitions to
+a topic only moves the values the new points take over instead of
+reshuffling everything like a hash modulo the partition count.
+
+The partition counts of the topics are fetched from the cluster metadata by
+a background thread every `interval`, never on `send()`.
+"""
+
+import bisect
+import hashlib
+import threading
+
+from confluent_kafka import KafkaException
+
+from .log import LOG
+from .records import Record
+
+# default `partition_vnodes`: points per partition on the hash ring
+DEFAULT_PARTITION_VNODES = 64
+
+# default `partition_refresh_interval` in milliseconds
+DEFAULT_PARTITION_REFRESH_INTERVAL = 60000
+
+# seconds to wait for the cluster metadata
+METADATA_TIMEOUT = 10
+
+# minimum seconds between two metadata requests
+METADATA_RETRY_INTERVAL = 1.0
+
+# maximum number of (topic, value) pairs `Partitioner` remembers the
+# partition of
+PARTITION_CACHE_SIZE = 10000
+
+
+def _hash(value):
+    if not isinstance(value, bytes):
+        if not isinstance(value, type(u'')):
+            value = str(value)
+        value = value.encode('utf-8')
+    return int(hashlib.md5(value).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """ Consistent-hash ring of the partitions of a topic.
+    """
+
+    def __init__(self, partitions, vnodes=DEFAULT_PARTITION_VNODES):
+        """
+        :param partitions: number of partitions of the topic
+        :param vnodes: points per partition on the ring
+        """
+        self.partitions = partitions
+        points = sorted((_hash('%d-%d' % (partition, vnode)), partition)
+                        for partition in range(partitions)
+                        for vnode in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [partition for _, partition in points]
+
+    def __call__(self, value):
+        """
+        :param value: value hashed: bytes, text or anything `str()` accepts
+        :return: the partition of the value
+        """
+        i = bisect.bisect(self._hashes, _hash(value))
+        if i == len(self._hashes):
+            i = 0
+        return self._owners[i]
+
+
+class Partitioner(object):
+    """ Partition of a message by consistent hashing of one of its fields.
+
+    The partition is cached by topic and value so that partitioning is a
+    dictionary lookup in the long run. Messages w/o the field or produced to
+    a topic whose partition count is not known yet get no partition: the
+    producer partitioner is used. The field is looked up in the message, then
+    in its parsed MESSAGE.
+    """
+
+    def __init__(self, field, topic, vnodes=DEFAULT_PARTITION_VNODES):
+        """
+        :param field: message field hashed, e.g. HOST or a field of the
+        parsed MESSAGE
+        :param topic: topic of the messages w/o a routed topic
+        :param vnodes: points per partition on the hash rings
+        """
+        self.field = field
+        self.topic = topic
+        self.vnodes = vnodes
+        # topics whose partition count is refreshed
+        self.topics = set([topic])
+        # set when a topic w/o partition count shows up
+        self.wanted = threading.Event()
+        self.wanted.set()
+        self._rings = {}
+        self._partitions = {}
+
+    def __call__(self, msg, topic=None):
+        """
+        :param msg: message dictionary
+        :param topic: topic of the message, `topic` by default
+        :return: the partition of the message or None
+        """
+        field = self.field
+        if field in msg:
+            value = msg[field]
+        else:
+            # extracted by the parsers
+            parsed = msg.get('MESSAGE')
+            if not isinstance(parsed, (dict, Record)) or field not in parsed:
+                return None
+            value = parsed[field]
+        if topic is None:
+            topic = self.topic
+        key = topic, value
+        try:
+            return self._partitions[key]
+        except KeyError:
+            pass
+        ring = self._rings.get(topic)
+        if ring is None:
+            self.topics.add(topic)
+            self.wanted.set()
+            return None
+        partition = ring(key[1])
+        partitions = self._partitions
+        if len(partitions) >= PARTITION_CACHE_SIZE:
+            partitions.clear()
+        partitions[key] = partition
+        return partition
+
+    def update(self, counts):
+        """ Rebuild the rings of the topics whose partition count changed.
+
+        :param counts: dictionary of topic to partition count
+        :return: the topics whose ring was rebuilt
+        """
+        rings = dict(self._rings)
+        changed = []
+        for topic, count in counts.items():
+            ring = rings.get(topic)
+            if ring is None or ring.partitions != count:
+                rings[topic] = HashRing(count, self.vnodes)
+                changed.append(topic)
+        if changed:
+            self._rings = rings
+            self._partitions = {}
+        return changed
+
+
+class PartitionRefresher(threading.Thread):
+    """ Background thread feeding a `Partitioner` w/ the partition counts
+    of the cluster metadata.
+    """
+
+    def __init__(self, partitioner, producer,
+                 interval=DEFAULT_PARTITION_REFRESH_INTERVAL / 1000.0,
+                 timeout=METADATA_TIMEOUT):
+        """
+        :param partitioner: the `Partitioner` to feed
+        :param producer: the `confluent_kafka.Producer` to query
+        :param interval: seconds between two refreshes
+        :param timeout: seconds to wait for the cluster metadata
+        """
+        super(PartitionRefresher, self).__init__(
+            name='syslogng_kafka-partitions')
+        self.daemon = True
+        self.partitioner = partitioner
+        self.producer = producer
+        self.interval = interval
+        self.timeout = timeout
+        self._stopped = threading.Event()
+
+    def run(self):
+        wanted = self.partitioner.wanted
+        while not self._stopped.is_set():
+            wanted.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                LOG.error("Partition metadata refresh failed: %s" % e,
+                          exc_info=True)
+            if self._stopped.wait(METADATA_RETRY_INTERVAL):
+                break
+            # new topics are looked up w/o waiting for the next refresh
+            wanted.wait(max(self.interval - METADATA_RETRY_INTERVAL, 0))
+
+    def refresh(self):
+        """ Fetch the partition counts of the topics of the partitioner.
+
+        :return: dictionary of topic to partition count
+        """
+        counts = {}
+        for topic in list(self.partitioner.topics):
+            try:
+                metadata = self.producer.list_topics(topic, self.timeout)
+            except KafkaException as e:
+                LOG.warning("No metadata for topic %s: %s" % (topic, e))
+                continue
+            topic_metadata = metadata.topics.get(topic)
+            if topic_metadata is None or topic_metadata.error is not None \
+                    or not topic_metadata.partitions:
+                LOG.warning("No partitions for topic %s: %s"
+                            % (topic, getattr(topic_metadata, 'error', None)))
+                continue
+            counts[topic] = len(topic_metadata.partitions)
+        for topic in self.partitioner.update(counts):
+            LOG.info("Partitioning topic %s over %d partitions"
+                     % (topic, counts[topic]))
+        return counts
+
+    def stop(self, timeout=None):
+        """ Stop refreshing and wait for the thread to end. """
+        self._stopped.set()
+        self.partitioner.wanted.set()
+        if self.is_alive():
+            self.join(timeout)
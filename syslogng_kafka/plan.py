@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""The per-message work of `KafkaDestination.send()`, compiled once at
+initialization time.
+"""
+
+from .filters import ProgramFilter
+from .instrument import clock_ns
+from .util import date_str_to_timestamp
+
+
+def filter_step(program_filter):
+    """ Drop the messages whose program is rejected by `program_filter`.
+
+    :param program_filter: a `syslogng_kafka.filters.ProgramFilter`
+    """
+
+    def step(msg):
+        if program_filter(msg['PROGRAM']):
+            return msg
+        return None
+
+    return step
+
+
+def parse_step(parsers):
+    """ Replace the message of the programs having a parser by its parsed
+    form.
+
+    :param parsers: dictionary of program name to parser callable
+    """
+    get_parser = dict(parsers).get
+
+    def step(msg):
+        parser = get_parser(msg['PROGRAM'])
+        if parser is not None:
+            msg['MESSAGE'] = parser(msg['MESSAGE'])
+        return msg
+
+    return step
+
+
+def date_step(msg):
+    """ Convert the date string to a UNIX timestamp.
+    """
+    msg_date = msg['DATE']
+    if msg_date is not None:
+        msg['DATE'] = date_str_to_timestamp(msg_date)
+    return msg
+
+
+class SendPlan(object):
+    """ Steps run on every message followed by its serialization.
+
+    Every step is a (name, callable) tuple. The callable takes the message
+    dictionary and returns it, possibly modified, or None to filter the
+    message out.
+    """
+
+    def __init__(self, steps, serialize, msg_key=None, partition=None,
+                 router=None, partitioner=None, on_delivery=None,
+                 program_filter=None):
+        """
+        :param steps: sequence of (name, callable) tuples run in order
+        :param serialize: encoder of the message dictionary to bytes
+        :param msg_key: optional message field used as Kafka message key
+        :param partition: optional partition to produce to
+        :param router: optional `syslogng_kafka.routing.Router` giving the
+        topic of the message, passed as the `topic` produce kwarg.
+        :param partitioner: optional
+        `syslogng_kafka.partitioner.Partitioner` giving the partition of the
+        message.
+        :param on_delivery: optional delivery callback passed to every
+        produce call.
+        :param program_filter: optional
+        `syslogng_kafka.filters.ProgramFilter` of the filter step, exposed to
+        check the program of a message before fetching its other fields.
+        """
+        self.steps = tuple(steps)
+        self.program_filter = program_filter
+        self.serialize = serialize
+        self.msg_key = msg_key
+        self.router = router
+        self.partitioner = partitioner
+        self.kwargs = {}
+        if partition is not None:
+            self.kwargs['partition'] = partition
+        if on_delivery is not None:
+            self.kwargs['on_delivery'] = on_delivery
+
+    def __call__(self, msg):
+        """ Run the plan on a message.
+
+        :param msg: message dictionary
+        :return: a (msg_string, produce kwargs) tuple or None if the message
+        is filtered out.
+        """
+        for _, step in self.steps:
+            msg = step(msg)
+            if msg is None:
+                return None
+        return self.serialize(msg), self._kwargs(msg)
+
+    def finish(self, msg):
+        """ Serialize a message a step held and released later, see
+        `syslogng_kafka.dedup`.
+
+        :param msg: message dictionary which went through every step
+        :return: a (msg_string, produce kwargs) tuple
+        """
+        return self.serialize(msg), self._kwargs(msg)
+
+    def _kwargs(self, msg):
+        """ The produce kwargs of a message.
+        """
+        kwargs = self.kwargs
+        if self.msg_key is not None and self.msg_key in msg:
+            kwargs = dict(kwargs)
+            kwargs['key'] = msg[self.msg_key]
+        topic = None
+        if self.router is not None:
+            if kwargs is self.kwargs:
+                kwargs = dict(kwargs)
+            topic = kwargs['topic'] = self.router(msg)
+        if self.partitioner is not None:
+            partition = self.partitioner(msg, topic)
+            if partition is not None:
+                if kwargs is self.kwargs:
+                    kwargs = dict(kwargs)
+                kwargs['partition'] = partition
+        return kwargs
+
+    def timed(self, msg, record):
+        """ Run the plan on a message timing every step and the
+        serialization.
+
+        :param msg: message dictionary
+        :param record: callable taking a step name and its duration in
+        nanoseconds, see `syslogng_kafka.instrument.StageTimer.record`.
+        :return: same as calling the plan
+        """
+        start = clock_ns()
+        for name, step in self.steps:
+            msg = step(msg)
+            end = clock_ns()
+            record(name, end - start)
+            start = end
+            if msg is None:
+                return None
+        kwargs = self._kwargs(msg)
+        msg_string = self.serialize(msg)
+        record('serialize', clock_ns() - start)
+        return msg_string, kwargs
+
+
+def compile_send_plan(serialize, programs=None, exclude_programs=None,
+                      parsers=None, msg_key=None, partition=None,
+                      router=None, partitioner=None, on_delivery=None,
+                      deduplicator=None):
+    """ Compile the send plan of a destination.
+
+    :param serialize: encoder of the message dictionary to bytes
+    :param programs: optional programs to filter messages against
+    :param exclude_programs: optional programs to filter out
+    :param parsers: optional dictionary of program name to parser callable
+    :param msg_key: optional message field used as Kafka message key
+    :param partition: optional partition to produce to
+    :param router: optional `syslogng_kafka.routing.Router`
+    :param partitioner: optional `syslogng_kafka.partitioner.Partitioner`
+    :param on_delivery: optional per message delivery callback
+    :param deduplicator: optional `syslogng_kafka.dedup.Deduplicator` holding
+    the parsed messages it deduplicates.
+    :return: a `SendPlan`
+    """
+    steps = []
+    program_filter = None
+    if programs is not None or exclude_programs:
+        program_filter = ProgramFilter(programs, exclude_programs)
+        steps.append(('filter', filter_step(program_filter)))
+    if parsers:
+        steps.append(('parse', parse_step(parsers)))
+    steps.append(('date', date_step))
+    if deduplicator is not None:
+        steps.append(('dedup', deduplicator))
+    return SendPlan(steps, serialize, msg_key=msg_key, partition=partition,
+                    router=router, partitioner=partitioner,
+                    on_delivery=on_delivery, program_filter=program_filter)
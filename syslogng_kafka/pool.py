@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""Producers shared by the destinations of a process.
+
+Destinations w/ the same producer configuration, callbacks aside, share one
+`confluent_kafka.Producer`, i.e. one set of librdkafka threads and broker
+connections. The producer is flushed and dropped when the last destination
+using it releases it.
+
+The statistics of a shared producer are handed to the `stats_cb` of every
+destination using it. A delivery callback cannot be told which destination
+a message comes from: destinations pass theirs to `produce()` instead.
+"""
+
+import threading
+
+from confluent_kafka import Producer
+
+from .log import LOG
+
+# callbacks of the producer configuration dispatched to every user
+DISPATCHED_CALLBACKS = ('stats_cb',)
+
+# seconds `release()` waits for the delivery of the messages of the last
+# user
+DEFAULT_RELEASE_TIMEOUT = 30
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def config_key(conf):
+    """ Key of a producer configuration w/o its callbacks.
+
+    :param conf: producer configuration dictionary
+    :return: a hashable key equal for configurations only differing by
+    callbacks or key order.
+    """
+    return _freeze(dict((key, value) for key, value in conf.items()
+                        if key not in DISPATCHED_CALLBACKS))
+
+
+class _Entry(object):
+    """ A pooled producer and its users.
+    """
+
+    def __init__(self):
+        self.producer = None
+        self.users = 0
+        self.stats_callbacks = []
+
+    def on_stats(self, json_str):
+        for callback in list(self.stats_callbacks):
+            callback(json_str)
+
+
+class ProducerPool(object):
+    """ Reference counted producers keyed by their configuration.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def acquire(self, conf, factory=Producer):
+        """ The producer of a configuration, created by the first user.
+
+        :param conf: producer configuration dictionary. Its `stats_cb`
+        receives the statistics of the shared producer.
+        :param factory: callable creating a producer from the configuration
+        :return: the shared producer
+        :raise ValueError: if the configuration has a global `on_delivery`
+        callback.
+        """
+        if 'on_delivery' in conf:
+            raise ValueError("A shared producer cannot have a global "
+                             "`on_delivery` callback")
+        key = config_key(conf)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                shared_conf = dict(conf)
+                shared_conf['stats_cb'] = entry.on_stats
+                entry.producer = factory(**shared_conf)
+                self._entries[key] = entry
+                LOG.info("New shared producer for %s"
+                         % conf.get('bootstrap.servers'))
+            entry.users += 1
+            if conf.get('stats_cb') is not None:
+                entry.stats_callbacks.append(conf['stats_cb'])
+            return entry.producer
+
+    def release(self, producer, stats_cb=None,
+                timeout=DEFAULT_RELEASE_TIMEOUT):
+        """ Give a producer back, flushing it if it was its last user.
+
+        :param producer: a producer returned by `acquire()`
+        :param stats_cb: the `stats_cb` the producer was acquired w/
+        :param timeout: seconds to wait for the delivery of the messages
+        :return: True if the producer was flushed and dropped
+        :raise KeyError: if the producer is not in the pool
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.producer is producer:
+                    break
+            else:
+                raise KeyError("Producer not in the pool")
+            entry.users -= 1
+            if stats_cb is not None and stats_cb in entry.stats_callbacks:
+                entry.stats_callbacks.remove(stats_cb)
+            if entry.users:
+                LOG.debug("Shared producer still used by %d destinations"
+                          % entry.users)
+                return False
+            del self._entries[key]
+        LOG.debug("Flushing shared producer w/ a timeout of %s seconds..."
+                  % timeout)
+        producer.flush(timeout)
+        return True
+
+
+# pool of the destinations of the process
+POOL = ProducerPool()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Token-bucket rate limits by PROGRAM and/or HOST.
+
+One noisy host or program can fill the producer queue and get the messages
+of everyone discarded. A `RateLimiter` gives every key, e.g. a
+(PROGRAM, HOST) tuple, a bucket of `burst` tokens refilled at `rate` tokens
+per second. Every message takes a token; once the bucket of its key is
+empty the messages of the key are dropped, except 1 in `sample` let
+through so that the noisy key still shows downstream.
+
+The key is read from the `LogMessage` before any other field is fetched.
+Buckets are kept in a map bounded by `max_keys`: the least recently seen
+key is forgotten first, so that a high host cardinality cannot exhaust the
+memory.
+"""
+
+from collections import Counter
+from collections import OrderedDict
+from functools import partial
+from operator import attrgetter
+from operator import itemgetter
+from time import time
+
+# fields the messages can be rate limited by
+RATELIMIT_FIELDS = ('PROGRAM', 'HOST')
+
+# default `ratelimit_keys`
+DEFAULT_RATELIMIT_KEYS = RATELIMIT_FIELDS
+
+# default `ratelimit_max_keys`: maximum number of buckets
+DEFAULT_RATELIMIT_MAX_KEYS = 10000
+
+# default `ratelimit_sample`: messages over the limit are all dropped
+DEFAULT_RATELIMIT_SAMPLE = 0
+
+# positions in the bucket lists
+_TOKENS, _UPDATED, _DROPPED, _SAMPLED = range(4)
+
+
+def _move_to_end(buckets, key):
+    # Python 2 `OrderedDict` has no `move_to_end()`
+    buckets[key] = buckets.pop(key)
+
+
+class RateLimiter(object):
+    """ Token buckets by key, in the order of their last message.
+
+    `counters` holds the totals of the messages dropped and sampled over the
+    limits and of the buckets evicted. The counters of every key are given
+    by `get()` and `top()`.
+    """
+
+    def __init__(self, rate, burst=None, keys=DEFAULT_RATELIMIT_KEYS,
+                 max_keys=DEFAULT_RATELIMIT_MAX_KEYS,
+                 sample=DEFAULT_RATELIMIT_SAMPLE):
+        """
+        :param rate: messages per second allowed per key
+        :param burst: messages allowed at once per key, `rate` and at least 1
+        by default
+        :param keys: fields making the key, among `RATELIMIT_FIELDS`
+        :param max_keys: maximum number of buckets
+        :param sample: let 1 in `sample` messages over the limit through,
+        0 to drop them all.
+        :raise ValueError: if an argument is invalid
+        """
+        self.keys = tuple(keys)
+        if not self.keys:
+            raise ValueError("No field to rate limit messages by")
+        unknown = set(self.keys) - set(RATELIMIT_FIELDS)
+        if unknown:
+            raise ValueError("Cannot rate limit messages by %s, use %s"
+                             % (', '.join(sorted(unknown)),
+                                ' and/or '.join(RATELIMIT_FIELDS)))
+        self.rate = float(rate)
+        self.burst = max(self.rate, 1.0) if burst is None else float(burst)
+        if self.rate <= 0 or self.burst < 1:
+            raise ValueError("The rate must be positive and the burst at "
+                             "least 1")
+        if max_keys < 1 or sample < 0:
+            raise ValueError("The maximum number of keys must be positive "
+                             "and the sample not negative")
+        self.max_keys = max_keys
+        self.sample = sample
+        self.counters = Counter()
+        self._attr_key = attrgetter(*self.keys)
+        self._item_key = itemgetter(*self.keys)
+        # key: [tokens, last update, dropped, sampled]
+        self._buckets = OrderedDict()
+        self._touch = getattr(self._buckets, 'move_to_end', None) or \
+            partial(_move_to_end, self._buckets)
+
+    def __len__(self):
+        """ Number of buckets. """
+        return len(self._buckets)
+
+    def __call__(self, msg, now=None):
+        """ Take a token for a message.
+
+        :param msg: syslog-ng `LogMessage` or message dictionary
+        :param now: time of the message, the current time by default
+        :return: False if the message should be dropped
+        """
+        try:
+            if isinstance(msg, dict):
+                key = self._item_key(msg)
+            else:
+                key = self._attr_key(msg)
+        except (AttributeError, KeyError):
+            # w/o the fields: not limited
+            return True
+        return self.allow(key, now)
+
+    def allow(self, key, now=None):
+        """ Take a token from the bucket of a key.
+
+        :param key: value or tuple of values of the `keys` fields
+        :param now: the current time by default
+        :return: False if the bucket is empty and the message not sampled
+        """
+        if now is None:
+            now = time()
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+                self.counters['evicted'] += 1
+            buckets[key] = [self.burst - 1, now, 0, 0]
+            return True
+        # most recently seen last
+        self._touch(key)
+        tokens = bucket[_TOKENS] + (now - bucket[_UPDATED]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[_UPDATED] = now
+        if tokens >= 1:
+            bucket[_TOKENS] = tokens - 1
+            return True
+        bucket[_TOKENS] = tokens
+        sample = self.sample
+        if sample and (bucket[_DROPPED] + bucket[_SAMPLED]) % sample == 0:
+            bucket[_SAMPLED] += 1
+            self.counters['sampled'] += 1
+            return True
+        bucket[_DROPPED] += 1
+        self.counters['dropped'] += 1
+        return False
+
+    def get(self, key):
+        """ The counters of a key.
+
+        :return: a dictionary of the `dropped` and `sampled` messages, None
+        if the key has no bucket.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        return {'dropped': bucket[_DROPPED], 'sampled': bucket[_SAMPLED]}
+
+    def top(self, n=10):
+        """ The keys w/ the most messages over their limit.
+
+        :param n: maximum number of keys
+        :return: list of (key, counters dictionary) tuples
+        """
+        limited = [(key, bucket) for key, bucket in self._buckets.items()
+                   if bucket[_DROPPED] or bucket[_SAMPLED]]
+        limited.sort(key=lambda item: item[1][_DROPPED] + item[1][_SAMPLED],
+                     reverse=True)
+        return [(key, {'dropped': bucket[_DROPPED],
+                       'sampled': bucket[_SAMPLED]})
+                for key, bucket in limited[:n]]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Compact records of parsed syslog events.
+
+A record stores the values of a fixed list of fields in a tuple instead of a
+dictionary, about a third of its size, and reads like the parsed message
+dictionary it replaces: `record['src_ip']`, `items()`, equality w/
+dictionaries and the same `repr()`.
+
+The serializers encode records directly: `repr()` fills a format string
+precompiled for the fields, the typed serializers zip the values w/ their
+schema, `to_dict()` feeds the JSON encoders.
+"""
+
+
+class Record(object):
+    """ Values of the `fields` of a record type, see `record_type()`.
+    """
+
+    __slots__ = ('_values',)
+
+    # field names, in order
+    fields = ()
+    # position of every field
+    _index = {}
+    # `repr()` format of the values, same as the dictionary of the fields
+    _format = '{}'
+
+    # like a dictionary: not hashable
+    __hash__ = None
+
+    def __init__(self, values):
+        """
+        :param values: sequence of the values of `fields`, in order
+        :raise ValueError: if the number of values is not the number of
+        fields.
+        """
+        values = tuple(values)
+        if len(values) != len(self.fields):
+            raise ValueError("%s takes %d values, not %d"
+                             % (type(self).__name__, len(self.fields),
+                                len(values)))
+        self._values = values
+
+    def __getitem__(self, field):
+        return self._values[self._index[field]]
+
+    def __contains__(self, field):
+        return field in self._index
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def get(self, field, default=None):
+        index = self._index.get(field)
+        if index is None:
+            return default
+        return self._values[index]
+
+    def keys(self):
+        return list(self.fields)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return list(zip(self.fields, self._values))
+
+    def to_dict(self):
+        """ The parsed message dictionary of the record. """
+        return dict(zip(self.fields, self._values))
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.fields == other.fields and \
+                self._values == other._values
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __repr__(self):
+        return self._format % self._values
+
+
+def record_type(name, fields):
+    """ Create a record type.
+
+    :param name: class name, e.g. `FirewallEvent`
+    :param fields: field names, in order
+    :return: a `Record` subclass
+    """
+    fields = tuple(fields)
+    return type(name, (Record,), {
+        '__slots__': (),
+        'fields': fields,
+        '_index': dict((field, i) for i, field in enumerate(fields)),
+        '_format': '{%s}' % ', '.join(
+            '%s: %%r' % repr(field).replace('%', '%%') for field in fields),
+    })
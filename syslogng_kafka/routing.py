@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""Routing of syslog messages to topics.
+
+A routing table is an ordered list of (field, pattern, topic) rules, the
+first matching rule giving the topic of a message. Fields are PROGRAM, HOST,
+FACILITY and PRIORITY. Patterns may contain `*` and `?` wildcards.
+"""
+
+from .filters import _compile_patterns
+
+# message fields routes can match
+ROUTE_FIELDS = ('PROGRAM', 'HOST', 'FACILITY', 'PRIORITY')
+
+# maximum number of field values `Router` remembers the topic of
+ROUTE_CACHE_SIZE = 10000
+
+
+class Router(object):
+    """ Topic of a message according to a routing table.
+
+    Routes w/o wildcards are compiled into a dictionary by field, the others
+    into an ordered list of patterns checked after. The topic is cached by
+    the values of the routed fields so that routing is a dictionary lookup
+    in the long run.
+    """
+
+    def __init__(self, routes, default):
+        """
+        :param routes: sequence of (field, pattern, topic) tuples, the first
+        match wins.
+        :param default: topic of the messages no route matches
+        :raise ValueError: if a route is invalid
+        """
+        self.default = default
+        self.topics = []
+        exact = {}
+        patterns = []
+        for field, pattern, topic in routes:
+            if field not in ROUTE_FIELDS:
+                raise ValueError("Cannot route on %s, use one of %s"
+                                 % (field, ', '.join(ROUTE_FIELDS)))
+            if not topic:
+                raise ValueError("Route %s=%s has no topic" % (field, pattern))
+            index = len(self.topics)
+            self.topics.append(topic)
+            if '*' in pattern or '?' in pattern:
+                patterns.append((index, field,
+                                 _compile_patterns([pattern])))
+            else:
+                exact.setdefault(field, {}).setdefault(pattern, index)
+        used = set(exact).union(field for _, field, _ in patterns)
+        self.fields = tuple(field for field in ROUTE_FIELDS if field in used)
+        position = dict((field, i) for i, field in enumerate(self.fields))
+        self._exact = tuple((position[field], values.get)
+                            for field, values in exact.items())
+        self._patterns = tuple((index, position[field], match)
+                               for index, field, match in patterns)
+        self._topics = {}
+
+    def _route(self, values):
+        best = None
+        for i, get in self._exact:
+            index = get(values[i])
+            if index is not None and (best is None or index < best):
+                best = index
+        for index, i, match in self._patterns:
+            if best is not None and index > best:
+                break
+            if values[i] is not None and match(values[i]) is not None:
+                best = index
+                break
+        if best is None:
+            return self.default
+        return self.topics[best]
+
+    def __call__(self, msg):
+        """
+        :param msg: message dictionary. A routed field it lacks, e.g. w/
+        `value-pairs`, matches no route.
+        :return: the topic of the message
+        """
+        values = tuple(msg.get(field) for field in self.fields)
+        try:
+            return self._topics[values]
+        except KeyError:
+            pass
+        topic = self._route(values)
+        if len(self._topics) >= ROUTE_CACHE_SIZE:
+            self._topics.clear()
+        self._topics[values] = topic
+        return topic
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+"""Serializers turning syslog messages into Kafka message payloads.
+
+A serializer is looked up by name in `SERIALIZERS` once at initialization
+time. Its factory returns the encoder called for every message: it takes the
+message dictionary and returns bytes.
+
+A parsed MESSAGE is a dictionary or a `syslogng_kafka.records.Record`,
+encoded w/o converting it to a dictionary where the encoder allows it.
+"""
+
+import json
+import re
+import sys
+from functools import partial
+
+from .dedup import DEDUP_FIELDS
+from .log import LOG
+from .records import Record
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:  # pragma: no cover
+    text_type = unicode  # noqa: F821
+else:
+    text_type = str
+
+# name of the serializer used when none is configured. `repr` is the Python
+# representation of the message dictionary as produced by syslogng_kafka
+# <= 0.1.11.
+DEFAULT_SERIALIZER = 'repr'
+
+
+def repr_serializer():
+    """ Python `repr()` of the message dictionary.
+    """
+    if PY2:
+        return str
+
+    def encode(msg):
+        return str(msg).encode('utf-8')
+
+    return encode
+
+
+def _to_dict(obj):
+    """ `default` of the JSON encoders: the dictionary of a record.
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def json_serializer():
+    """ Compact JSON using the standard library `json` module.
+    """
+    dumps = json.JSONEncoder(separators=(',', ':'), default=_to_dict).encode
+
+    def encode(msg):
+        return dumps(msg).encode('utf-8')
+
+    return encode
+
+
+def fastjson_serializer():
+    """ Compact JSON using the fastest JSON library installed.
+
+    `orjson`, `ujson` and `rapidjson` are tried in that order before falling
+    back on the standard library.
+    """
+    try:
+        import orjson
+        return partial(orjson.dumps, default=_to_dict)
+    except ImportError:
+        pass
+    for name in ('ujson', 'rapidjson'):
+        try:
+            dumps = __import__(name).dumps
+        except ImportError:
+            continue
+
+        def encode(msg, dumps=dumps):
+            if isinstance(msg.get('MESSAGE'), Record):
+                msg = dict(msg, MESSAGE=msg['MESSAGE'].to_dict())
+            return dumps(msg).encode('utf-8')
+
+        return encode
+
+    LOG.warning("No fast JSON library installed, falling back on `json`.")
+    return json_serializer()
+
+
+_LOGFMT_QUOTE = re.compile(u'[\\s="\\\\]').search
+
+
+def _logfmt_items(msg, append):
+    for key, value in msg.items():
+        if isinstance(value, (dict, Record)):
+            _logfmt_items(value, append)
+            continue
+        if not isinstance(value, text_type):
+            value = text_type(value)
+        if not value:
+            value = u'""'
+        elif _LOGFMT_QUOTE(value) is not None:
+            value = u'"%s"' % value.replace(u'\\', u'\\\\').replace(
+                u'"', u'\\"')
+        append(u'%s=%s' % (key, value))
+
+
+def logfmt_serializer():
+    """ Compact `key=value` line, values with spaces or quotes being quoted.
+
+    Nested dictionaries such as parsed `firewall` messages are flattened: their
+    keys are written in place of the key holding them.
+    """
+
+    def encode(msg):
+        items = []
+        _logfmt_items(msg, items.append)
+        return u' '.join(items).encode('utf-8')
+
+    return encode
+
+
+def _to_int(value, base=10):
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value, base)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _to_hex_int(value):
+    return _to_int(value, 16)
+
+
+def _to_text(value):
+    if isinstance(value, text_type):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if value == -1:
+        # default of the fields missing from a parsed message
+        return u''
+    return text_type(value)
+
+
+# converters of the field types of the binary serializers: `hex` fields such
+# as `tos` hold hexadecimal numbers.
+FIELD_TYPES = {
+    'string': (_to_text, 'string'),
+    'int': (_to_int, 'long'),
+    'hex': (_to_hex_int, 'long'),
+}
+
+# field types of the messages parsed by `parse_firewall_msg` and
+# `parse_nat_msg`, in the order of their Avro records and of the fields of
+# `FirewallEvent` and `NatEvent`.
+FIREWALL_FIELDS = (
+    ('action', 'string'), ('src_ip', 'string'), ('dest_ip', 'string'),
+    ('proto', 'string'), ('source_port', 'int'),
+    ('destination_port', 'int'), ('mac_address', 'string'),
+    ('out', 'string'), ('len', 'int'), ('tos', 'hex'), ('proc', 'hex'),
+    ('ttl', 'int'), ('id', 'int'), ('mark', 'hex'), ('seq', 'int'),
+    ('code', 'int'),
+)
+
+NAT_FIELDS = (
+    ('dnat_in', 'string'), ('out', 'string'), ('mac_address', 'string'),
+    ('src_ip', 'string'), ('dest_ip', 'string'), ('len', 'int'),
+    ('tos', 'hex'), ('proc', 'hex'), ('ttl', 'int'), ('id', 'int'),
+    ('proto', 'string'), ('spt', 'int'), ('dpt', 'int'), ('window', 'int'),
+    ('res', 'hex'), ('urgp', 'int'),
+)
+
+# parsed message schemas by program, see `parse_firewall_msg`.
+SCHEMAS = {
+    'firewall': ('FirewallEvent', FIREWALL_FIELDS),
+    'nat': ('NatEvent', NAT_FIELDS),
+}
+
+# syslog fields of every message, `MESSAGE` being a parsed record or a string.
+HEADER_FIELDS = (
+    ('FACILITY', 'string'), ('PRIORITY', 'string'), ('HOST', 'string'),
+    ('PROGRAM', 'string'), ('DATE', 'int'),
+)
+
+
+def _compile_record(fields):
+    converters = tuple((name, FIELD_TYPES[type_][0]) for name, type_ in fields)
+    names = tuple(name for name, _ in fields)
+
+    def convert(record):
+        if isinstance(record, Record) and record.fields == names:
+            # values in the order of the schema
+            return {name: to(value) for (name, to), value
+                    in zip(converters, record.values())}
+        return {name: to(record[name]) for name, to in converters}
+
+    return convert
+
+
+def _compile_typed_message():
+    """ Compile the conversion of a message to its typed fields.
+
+    :return: a callable returning a (record name, typed message) tuple, the
+    record name being None when `MESSAGE` has no schema.
+    """
+    header = tuple((name, FIELD_TYPES[type_][0])
+                   for name, type_ in HEADER_FIELDS)
+    records = dict((program, (record, _compile_record(fields)))
+                   for program, (record, fields) in SCHEMAS.items())
+
+    def convert(msg):
+        typed = {name: None if msg[name] is None else to(msg[name])
+                 for name, to in header}
+        if 'count' in msg:
+            # aggregated by `syslogng_kafka.dedup`
+            for name in DEDUP_FIELDS:
+                typed[name] = msg[name]
+        message = msg['MESSAGE']
+        if isinstance(message, (dict, Record)):
+            try:
+                record, convert_record = records[msg['PROGRAM']]
+            except KeyError:
+                # parsed w/o schema: left as is
+                typed['MESSAGE'] = (message.to_dict()
+                                    if isinstance(message, Record)
+                                    else message)
+                return None, typed
+            typed['MESSAGE'] = convert_record(message)
+            return record, typed
+        typed['MESSAGE'] = None if message is None else _to_text(message)
+        return None, typed
+
+    return convert
+
+
+def avro_schema():
+    """ Avro schema of the messages.
+
+    :return: the schema as a Python dictionary
+    """
+    records = []
+    for record, fields in sorted(SCHEMAS.values()):
+        records.append({
+            'type': 'record', 'name': record,
+            'fields': [{'name': name, 'type': FIELD_TYPES[type_][1]}
+                       for name, type_ in fields]})
+    fields = [{'name': name, 'type': ['null', FIELD_TYPES[type_][1]]}
+              for name, type_ in HEADER_FIELDS]
+    fields.append({'name': 'MESSAGE', 'type': ['null', 'string'] + records})
+    return {'type': 'record', 'name': 'SyslogMessage',
+            'namespace': 'syslogng_kafka', 'fields': fields}
+
+
+def msgpack_serializer():
+    """ MessagePack map, numeric fields of parsed messages being integers.
+
+    Needs the `msgpack` library.
+    """
+    import msgpack
+
+    pack = msgpack.Packer(use_bin_type=True).pack
+    convert = _compile_typed_message()
+
+    def encode(msg):
+        return pack(convert(msg)[1])
+
+    return encode
+
+
+def avro_serializer():
+    """ Schemaless Avro record of `avro_schema()`.
+
+    The schema is not embedded in the payload, consumers must know it.
+    Parsed messages w/o schema are written as JSON strings. Needs the
+    `fastavro` library.
+    """
+    from io import BytesIO
+
+    from fastavro import parse_schema
+    from fastavro import schemaless_writer
+
+    schema = parse_schema(avro_schema())
+    convert = _compile_typed_message()
+    buf = BytesIO()
+
+    def encode(msg):
+        record, typed = convert(msg)
+        if record is not None:
+            typed['MESSAGE'] = ('syslogng_kafka.' + record, typed['MESSAGE'])
+        elif isinstance(typed['MESSAGE'], dict):
+            typed['MESSAGE'] = json.dumps(typed['MESSAGE'])
+        buf.seek(0)
+        buf.truncate()
+        schemaless_writer(buf, schema, typed)
+        return buf.getvalue()
+
+    return encode
+
+
+SERIALIZERS = {
+    'repr': repr_serializer,
+    'json': json_serializer,
+    'fastjson': fastjson_serializer,
+    'logfmt': logfmt_serializer,
+    'msgpack': msgpack_serializer,
+    'avro': avro_serializer,
+}
+
+
+def get_serializer(name):
+    """ Build the encoder of a registered serializer.
+
+    :param name: serializer name, a key of `SERIALIZERS`.
+    :return: a callable encoding a message dictionary to bytes
+    :raise ValueError: if the serializer is unknown
+    :raise ImportError: if a library the serializer needs is not installed
+    """
+    try:
+        factory = SERIALIZERS[name]
+    except KeyError:
+        raise ValueError("Unknown serializer %s, use one of %s"
+                         % (name, ', '.join(sorted(SERIALIZERS))))
+    return factory()
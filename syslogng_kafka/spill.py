@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+
+"""Disk-backed spill queue of the messages the producer cannot accept.
+
+Messages are appended to memory-mapped segment files of a directory:
+
+    spill-<sequence>.log   preallocated segments of records
+    spill.offset           read position, replaced atomically
+
+A record is a header followed by the topic, the key and the value:
+
+    body length (uint32), crc32 of the body (uint32), partition (int32, -1 for
+    none), topic length (uint16), key length (int32, -1 for none)
+
+A zero body length marks the end of the records of a segment. On opening, the
+records written after the read position are found again by checking their
+crc32, so that a crash loses neither the read position nor the records
+fully written.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+
+from confluent_kafka import KafkaException
+
+from .log import LOG
+
+# default maximum size in bytes of the spill directory
+DEFAULT_SPILL_MAX_BYTES = 1024 * 1024 * 1024
+
+# default size in bytes of a segment file
+DEFAULT_SPILL_SEGMENT_BYTES = 64 * 1024 * 1024
+
+HEADER = struct.Struct('>IIiHi')
+
+OFFSET_FILE = 'spill.offset'
+
+_SEGMENT_FORMAT = 'spill-%016d.log'
+
+# delivery errors of a replayed record which a retry cannot fix: the record
+# is dropped.
+PERMANENT_DELIVERY_ERRORS = frozenset([
+    'MSG_SIZE_TOO_LARGE', 'INVALID_MSG', 'INVALID_MSG_SIZE',
+    'RECORD_LIST_TOO_LARGE', 'INVALID_RECORD'])
+
+# delivery errors of a message worth spilling to replay it later: the
+# brokers could not be reached in time. `KafkaError.retriable()` is not set
+# for the errors of delivery reports.
+RETRIABLE_DELIVERY_ERRORS = frozenset([
+    '_MSG_TIMED_OUT', '_TIMED_OUT', '_TRANSPORT', '_ALL_BROKERS_DOWN',
+    'REQUEST_TIMED_OUT', 'NETWORK_EXCEPTION', 'LEADER_NOT_AVAILABLE',
+    'NOT_LEADER_FOR_PARTITION', 'NOT_ENOUGH_REPLICAS',
+    'NOT_ENOUGH_REPLICAS_AFTER_APPEND'])
+
+# seconds the producer is polled for at once while waiting for the delivery
+# reports of replayed records
+DELIVERY_POLL_INTERVAL = 0.1
+
+
+def _retriable(exc):
+    # `confluent_kafka.KafkaException` of a `KafkaError` worth retrying
+    error = exc.args[0] if exc.args else None
+    return getattr(error, 'retriable', lambda: False)()
+
+
+def retriable_delivery(err):
+    """ Whether a message whose delivery failed w/ `err` is worth
+    replaying.
+
+    :param err: `confluent_kafka.KafkaError` of a delivery report
+    """
+    try:
+        if err.retriable():
+            return True
+        return err.name() in RETRIABLE_DELIVERY_ERRORS
+    except AttributeError:
+        return False
+
+
+def _segment_seq(name):
+    if name.startswith('spill-') and name.endswith('.log'):
+        try:
+            return int(name[6:-4])
+        except ValueError:
+            pass
+    return None
+
+
+class _Segment(object):
+    """ A memory-mapped segment file.
+    """
+
+    def __init__(self, path, size=None):
+        self.path = path
+        mode = 'r+b' if size is None else 'w+b'
+        with open(path, mode) as f:
+            if size is not None:
+                f.truncate(size)
+            self.size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), self.size)
+
+    def read(self, position):
+        """ Read the record at `position`.
+
+        :return: a ((topic, value, key, partition), next position) tuple or
+        None if there is no valid record at `position`.
+        """
+        end = position + HEADER.size
+        if end > self.size:
+            return None
+        length, crc, partition, topic_len, key_len = HEADER.unpack(
+            self.map[position:end])
+        if length == 0 or end + length > self.size:
+            return None
+        body = self.map[end:end + length]
+        if zlib.crc32(body) & 0xffffffff != crc:
+            return None
+        topic = body[:topic_len].decode('utf-8')
+        if key_len < 0:
+            key = None
+            value = body[topic_len:]
+        else:
+            key = body[topic_len:topic_len + key_len]
+            value = body[topic_len + key_len:]
+        return (topic, value, key,
+                None if partition < 0 else partition), end + length
+
+    def write(self, position, header, body):
+        end = position + len(header)
+        self.map[position:end] = header
+        self.map[end:end + len(body)] = body
+
+    def close(self):
+        self.map.close()
+
+
+class SpillQueue(object):
+    """ Segment-rotated append-only log on local disk w/ a crash-safe read
+    position.
+
+    When the directory would exceed `max_bytes`, the oldest segment is
+    evicted w/ its records.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_SPILL_MAX_BYTES,
+                 segment_bytes=DEFAULT_SPILL_SEGMENT_BYTES):
+        """
+        :param directory: spill directory, created if missing.
+        :param max_bytes: maximum size in bytes of the segments.
+        :param segment_bytes: size in bytes of a segment.
+        """
+        if segment_bytes <= HEADER.size:
+            raise ValueError("Segment size must be greater than %d bytes."
+                             % HEADER.size)
+        if max_bytes < 2 * segment_bytes:
+            raise ValueError("Maximum size must hold at least 2 segments.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        # unread records by segment sequence
+        self._records = {}
+        self._segments = {}
+        self._peeked = []
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._recover()
+
+    def __len__(self):
+        """ Number of records waiting to be replayed. """
+        return sum(self._records.values())
+
+    def _path(self, seq):
+        return os.path.join(self.directory, _SEGMENT_FORMAT % seq)
+
+    def _recover(self):
+        seqs = sorted(seq for seq in map(_segment_seq,
+                                         os.listdir(self.directory))
+                      if seq is not None)
+        read_seq, read_pos = seqs[0] if seqs else 0, 0
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                read_seq, read_pos = [int(v) for v in f.read().split()]
+        except (IOError, OSError, ValueError):
+            pass
+        for seq in seqs:
+            if seq < read_seq:
+                os.remove(self._path(seq))
+        seqs = [seq for seq in seqs if seq >= read_seq]
+        if not seqs or seqs[0] != read_seq:
+            read_pos = 0
+            read_seq = seqs[0] if seqs else read_seq
+
+        self.read_seq, self.read_pos = read_seq, read_pos
+        for seq in seqs:
+            segment = self._segments[seq] = _Segment(self._path(seq))
+            position = read_pos if seq == read_seq else 0
+            count = 0
+            record = segment.read(position)
+            while record is not None:
+                count += 1
+                position = record[1]
+                record = segment.read(position)
+            self._records[seq] = count
+            if seq != seqs[-1]:
+                segment.close()
+                del self._segments[seq]
+        if seqs:
+            # wipe what may remain of a torn record.
+            segment = self._segments[seqs[-1]]
+            segment.map[position:] = b'\0' * (segment.size - position)
+            self.write_seq, self.write_pos = seqs[-1], position
+        else:
+            self._new_segment(read_seq)
+        if len(self):
+            LOG.info("Spill queue %s holds %d messages to replay."
+                     % (self.directory, len(self)))
+
+    def _new_segment(self, seq, size=None):
+        self._segments[seq] = _Segment(self._path(seq),
+                                       max(size or 0, self.segment_bytes))
+        self._records[seq] = 0
+        self.write_seq, self.write_pos = seq, 0
+
+    def _segment(self, seq):
+        try:
+            return self._segments[seq]
+        except KeyError:
+            segment = self._segments[seq] = _Segment(self._path(seq))
+            return segment
+
+    def _drop_segment(self, seq):
+        segment = self._segments.pop(seq, None)
+        if segment is not None:
+            segment.close()
+        self._records.pop(seq, None)
+        os.remove(self._path(seq))
+
+    def _evict(self):
+        seq = self.read_seq
+        evicted = self._records.get(seq, 0)
+        self.counters['evicted'] += evicted
+        LOG.warning("Spill queue %s is full: %d oldest messages evicted."
+                    % (self.directory, evicted))
+        self._drop_segment(seq)
+        self._peeked = []
+        self.read_seq, self.read_pos = seq + 1, 0
+        self._save_offset()
+
+    def append(self, topic, value, key=None, partition=None):
+        """ Append a message.
+
+        :param topic: topic to produce to
+        :param value: message payload
+        :param key: optional message key
+        :param partition: optional partition to produce to
+        """
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        if key is not None and not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        topic = topic.encode('utf-8')
+        body = topic + (key or b'') + value
+        header = HEADER.pack(
+            len(body), zlib.crc32(body) & 0xffffffff,
+            -1 if partition is None else partition, len(topic),
+            -1 if key is None else len(key))
+        size = len(header) + len(body)
+        with self._lock:
+            segment = self._segments[self.write_seq]
+            # keep room for the end of records marker
+            if self.write_pos + size + HEADER.size > segment.size:
+                next_seq = self.write_seq + 1
+                if (next_seq - self.read_seq + 1) * self.segment_bytes > \
+                        self.max_bytes:
+                    self._evict()
+                if self.write_seq != self.read_seq:
+                    segment.close()
+                    del self._segments[self.write_seq]
+                self._new_segment(next_seq, size + HEADER.size)
+                segment = self._segments[self.write_seq]
+            segment.write(self.write_pos, header, body)
+            self.write_pos += size
+            self._records[self.write_seq] += 1
+            self.counters['spilled'] += 1
+
+    def peek(self, count):
+        """ Read up to `count` messages from the read position w/o consuming
+        them, see `commit()`.
+
+        :return: list of (topic, value, key, partition) tuples
+        """
+        with self._lock:
+            self._peeked = []
+            seq, position = self.read_seq, self.read_pos
+            while len(self._peeked) < count:
+                record = None
+                if seq in self._records:
+                    record = self._segment(seq).read(position)
+                if record is None:
+                    if seq >= self.write_seq:
+                        break
+                    seq, position = seq + 1, 0
+                    continue
+                position = record[1]
+                self._peeked.append((record[0], seq, position))
+            return [record for record, _, _ in self._peeked]
+
+    def commit(self, count, rejected=0):
+        """ Consume the first `count` messages of the last `peek()`.
+
+        :param rejected: number of these messages which were rejected for
+        good instead of being replayed.
+        """
+        with self._lock:
+            if not count or not self._peeked:
+                return
+            committed = self._peeked[:count]
+            self._peeked = []
+            for _, seq, _ in committed:
+                self._records[seq] -= 1
+            for seq in range(self.read_seq, committed[-1][1]):
+                if seq in self._records:
+                    self._drop_segment(seq)
+            self.read_seq, self.read_pos = committed[-1][1:]
+            rejected = min(rejected, len(committed))
+            self.counters['replayed'] += len(committed) - rejected
+            if rejected:
+                self.counters['rejected'] += rejected
+            self._save_offset()
+
+    def _save_offset(self):
+        path = os.path.join(self.directory, OFFSET_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('%d %d\n' % (self.read_seq, self.read_pos))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+
+    def close(self):
+        """ Release the memory maps. """
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+
+
+class _Replay(object):
+    """ `on_delivery` callback of a batch of replayed records, counting
+    their delivery reports.
+    """
+
+    def __init__(self, on_delivery=None):
+        self.on_delivery = on_delivery
+        self.pending = 0
+        self.failed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        with self._lock:
+            self.pending += count
+
+    def __call__(self, err, msg):
+        with self._lock:
+            self.pending -= 1
+            if err is not None:
+                try:
+                    name = err.name()
+                except AttributeError:
+                    name = None
+                if name in PERMANENT_DELIVERY_ERRORS:
+                    self.rejected += 1
+                else:
+                    self.failed += 1
+        if self.on_delivery is not None:
+            self.on_delivery(err, msg)
+
+
+class SpillDrainer(threading.Thread):
+    """ Background thread replaying the spill queue into the producer.
+
+    Records are replayed a batch at a time and only committed, i.e. removed
+    from the disk, once all of them are delivered. After a failed delivery,
+    and when the thread starts, a single record probes the brokers: batches
+    are replayed again once it is delivered. Replay also waits for the
+    producer queue to hold less than `low_watermark` messages and pauses as
+    soon as the producer refuses a message.
+
+    A record the producer or the brokers reject for good, e.g. too large, is
+    dropped so that it does not block the ones behind it. The records of a
+    batch delivered before a failure are replayed again: delivery is at
+    least once.
+    """
+
+    def __init__(self, queue, producer, interval=1.0, batch=1000,
+                 low_watermark=1000, on_delivery=None,
+                 poll_interval=DELIVERY_POLL_INTERVAL):
+        """
+        :param queue: the `SpillQueue` to replay
+        :param producer: the `confluent_kafka.Producer` to replay into. Its
+        delivery reports must include the successful deliveries.
+        :param interval: seconds between two replay attempts
+        :param batch: maximum number of messages replayed per commit
+        :param low_watermark: producer queue length under which replay
+        starts
+        :param on_delivery: optional callback also given the delivery
+        reports of the replayed records, the per message callback replacing
+        the one of the producer.
+        :param poll_interval: seconds the producer is polled for at once
+        while waiting for the delivery reports of a batch
+        """
+        super(SpillDrainer, self).__init__(name='syslogng_kafka-spill')
+        self.daemon = True
+        self.queue = queue
+        self.producer = producer
+        self.interval = interval
+        self.batch = batch
+        self.low_watermark = low_watermark
+        self.on_delivery = on_delivery
+        self.poll_interval = poll_interval
+        # replay a single record until one is delivered
+        self._probing = True
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as e:
+                LOG.error("Spill queue replay failed: %s" % e, exc_info=True)
+
+    def drain(self):
+        """ Replay until the queue is empty, the producer is full or a
+        delivery fails.
+
+        :return: number of messages replayed and delivered
+        """
+        replayed = 0
+        while len(self.producer) < self.low_watermark:
+            records = self.queue.peek(1 if self._probing else self.batch)
+            if not records:
+                break
+            replay = _Replay(self.on_delivery)
+            done = 0
+            rejected = 0
+            for topic, value, key, partition in records:
+                kwargs = {'on_delivery': replay}
+                if key is not None:
+                    kwargs['key'] = key
+                if partition is not None:
+                    kwargs['partition'] = partition
+                # counted first: the report may be served by another thread
+                replay.add()
+                try:
+                    self.producer.produce(topic, value, **kwargs)
+                except BufferError:
+                    replay.add(-1)
+                    break
+                except KafkaException as e:
+                    replay.add(-1)
+                    if _retriable(e):
+                        break
+                    LOG.error("Spilled message rejected by the producer, "
+                              "dropping it: %s" % e)
+                    rejected = 1
+                    break
+                done += 1
+            if done and not self._wait(replay):
+                if replay.failed:
+                    self.queue.counters['replay_failed'] += 1
+                    LOG.warning("Spilled messages not delivered, probing "
+                                "the brokers w/ a single message.")
+                    self._probing = True
+                break
+            self.queue.commit(done + rejected,
+                              rejected=rejected + replay.rejected)
+            if replay.rejected:
+                LOG.error("%d spilled messages rejected by the brokers, "
+                          "dropped." % replay.rejected)
+            replayed += done - replay.rejected
+            if done:
+                self._probing = False
+            if done < len(records) and not rejected:
+                break
+        return replayed
+
+    def _wait(self, replay):
+        """ Wait for the delivery reports of a batch.
+
+        :return: True if every record was delivered or rejected for good,
+        False if a delivery failed or the thread is stopping.
+        """
+        while True:
+            self.producer.poll(self.poll_interval)
+            if replay.failed:
+                return False
+            if replay.pending <= 0:
+                return True
+            if self._stopped.is_set():
+                return False
+
+    def stop(self, timeout=None):
+        """ Stop replaying and wait for the thread to end. """
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""Auto-tuning of the producer batching from its statistics.
+
+The producer runs w/ one of a few precomputed profiles trading latency for
+throughput. Every statistics interval `AutoTuner` looks at the rate of
+transmitted messages, the fill of the producer queue, the average batch
+size and the broker round-trip time and votes for the next profile up or
+down. A profile change takes `intervals` consecutive votes in the same
+direction so that a burst does not flip the producer back and forth.
+"""
+
+from .log import LOG
+
+# profiles from the lowest latency to the highest throughput
+PROFILE_NAMES = ('latency', 'balanced', 'throughput')
+
+# producer settings of the profiles
+PROFILES = {
+    'latency': {
+        'queue.buffering.max.ms': 5,
+        'batch.num.messages': 1000,
+        'compression.codec': 'none',
+    },
+    'balanced': {
+        'queue.buffering.max.ms': 100,
+        'batch.num.messages': 10000,
+        'compression.codec': 'lz4',
+    },
+    'throughput': {
+        'queue.buffering.max.ms': 1000,
+        'batch.num.messages': 100000,
+        'queue.buffering.max.messages': 500000,
+        'compression.codec': 'lz4',
+    },
+}
+
+# messages per second above which the next profile up is voted for
+PROFILE_MAX_RATES = {'latency': 1000, 'balanced': 20000}
+
+# fraction of the maximum rate of the profile below under which the next
+# profile down is voted for
+STEP_DOWN_RATIO = 0.5
+
+# producer queue fill above which the next profile up is voted for
+QUEUE_FILL_HIGH = 0.5
+
+# producer queue fill under which the next profile down may be voted for
+QUEUE_FILL_LOW = 0.1
+
+# broker round-trip time in milliseconds above which larger batches are
+# kept
+RTT_HIGH = 100
+
+# default `autotune_intervals`
+DEFAULT_AUTOTUNE_INTERVALS = 3
+
+
+def parse_bounds(value):
+    """ Parse the `lowest:highest` profile bounds of the `autotune` option.
+
+    A single profile name pins the producer to that profile.
+
+    :return: a (lowest, highest) tuple
+    :raise ValueError: if a profile is unknown or the bounds are inverted
+    """
+    lowest, _, highest = value.partition(':')
+    lowest = lowest.strip()
+    highest = highest.strip() or lowest
+    for name in (lowest, highest):
+        if name not in PROFILES:
+            raise ValueError("Unknown profile %s, use one of %s"
+                             % (name, ', '.join(PROFILE_NAMES)))
+    if PROFILE_NAMES.index(lowest) > PROFILE_NAMES.index(highest):
+        raise ValueError("Profile %s is above %s" % (lowest, highest))
+    return lowest, highest
+
+
+class AutoTuner(object):
+    """ Picks the producer profile from the producer statistics.
+
+    `profile` is the current profile. Calling the tuner w/ the statistics
+    returns the new profile when it changes, None otherwise.
+    """
+
+    def __init__(self, lowest='latency', highest='throughput',
+                 intervals=DEFAULT_AUTOTUNE_INTERVALS):
+        """
+        :param lowest: lowest latency profile allowed
+        :param highest: highest throughput profile allowed
+        :param intervals: consecutive votes required to change profile
+        """
+        first = PROFILE_NAMES.index(lowest)
+        last = PROFILE_NAMES.index(highest)
+        self.profiles = PROFILE_NAMES[first:last + 1]
+        self.profile = ('balanced' if 'balanced' in self.profiles
+                        else self.profiles[0])
+        self.intervals = intervals
+        self._last = None
+        self._votes = 0
+
+    @property
+    def settings(self):
+        """ Producer settings of the current profile. """
+        return PROFILES[self.profile]
+
+    def reset(self):
+        """ Forget the previous statistics and votes, e.g. when the producer
+        is replaced.
+        """
+        self._last = None
+        self._votes = 0
+
+    def observe(self, stats):
+        """ Observations of a statistics interval.
+
+        The statistics are told apart by the `name` of their producer: `ts`
+        is a process-wide clock that does not start over w/ a new producer.
+
+        :param stats: librdkafka statistics dictionary
+        :return: dictionary of rate (messages per second), fill (of the
+        producer queue), batch (average messages per batch) and rtt (maximum
+        broker p99 in milliseconds), None for the first statistics of a
+        producer.
+        """
+        last, self._last = self._last, (stats.get('name'), stats['ts'],
+                                        stats['txmsgs'])
+        if last is None or last[0] != self._last[0] or \
+                stats['ts'] <= last[1] or stats['txmsgs'] < last[2]:
+            # first statistics or a new producer
+            return None
+        elapsed = (stats['ts'] - last[1]) / 1e6
+        batches = [topic['batchcnt']['avg']
+                   for topic in stats.get('topics', {}).values()
+                   if topic.get('batchcnt', {}).get('cnt')]
+        rtts = [broker['rtt']['p99']
+                for broker in stats.get('brokers', {}).values()
+                if broker.get('rtt', {}).get('cnt')]
+        return {
+            'rate': (stats['txmsgs'] - last[2]) / elapsed,
+            'fill': float(stats['msg_cnt']) / stats['msg_max']
+            if stats.get('msg_max') else 0.0,
+            'batch': sum(batches) / float(len(batches)) if batches else 0.0,
+            'rtt': max(rtts) / 1000.0 if rtts else 0.0,
+        }
+
+    def _vote(self, observed):
+        index = self.profiles.index(self.profile)
+        max_rate = PROFILE_MAX_RATES.get(self.profile)
+        if index + 1 < len(self.profiles) and (
+                observed['fill'] > QUEUE_FILL_HIGH or
+                max_rate is not None and observed['rate'] > max_rate):
+            return 1
+        if index > 0:
+            lower_max_rate = PROFILE_MAX_RATES[self.profiles[index - 1]]
+            if observed['rate'] < lower_max_rate * STEP_DOWN_RATIO and \
+                    observed['fill'] < QUEUE_FILL_LOW and \
+                    observed['rtt'] < RTT_HIGH:
+                return -1
+        return 0
+
+    def __call__(self, stats):
+        """
+        :param stats: librdkafka statistics dictionary
+        :return: the new profile or None
+        """
+        observed = self.observe(stats)
+        if observed is None:
+            return None
+        vote = self._vote(observed)
+        if vote == 0 or (self._votes and (vote > 0) != (self._votes > 0)):
+            self._votes = vote
+        else:
+            self._votes += vote
+        summary = ("rate=%.0f msg/s, queue fill=%.0f%%, batch avg=%.1f, "
+                   "rtt p99=%.1fms" % (observed['rate'], observed['fill'] * 100,
+                                       observed['batch'], observed['rtt']))
+        if abs(self._votes) < self.intervals:
+            LOG.debug("Auto-tuning: keeping profile %s (%s, votes=%d/%d)"
+                      % (self.profile, summary, self._votes, self.intervals))
+            return None
+        previous = self.profile
+        self.profile = self.profiles[
+            self.profiles.index(previous) + (1 if self._votes > 0 else -1)]
+        self._votes = 0
+        LOG.info("Auto-tuning: profile %s -> %s (%s)"
+                 % (previous, self.profile, summary))
+        return self.profile
@@ -4,21 +4,96 @@
 """
 
 import datetime
+import time
+from collections import OrderedDict
+
+from .records import record_type
+
+# maximum number of date strings `date_str_to_timestamp` keeps in its cache
+DATE_CACHE_SIZE = 1024
+
+_MONTHS = dict((m, i + 1) for i, m in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+     'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')))
+
+_date_cache = OrderedDict()
+_date_cache_day = None
+
+
+def _parse_date_str(date_str):
+    """ Parse a '%b %d %H:%M:%S' date string.
+
+    Fast path for the fixed syslog date format. Falls back on `strptime` for
+    anything unusual such as a lower case month.
+
+    :param date_str: string in '%b %d %H:%M:%S' format.
+    :return: a (month, day, hour, minute, second) tuple
+    """
+    try:
+        month, day, hms = date_str.split()
+        hour, minute, second = hms.split(':')
+        return (_MONTHS[month], int(day), int(hour), int(minute),
+                int(second))
+    except (KeyError, ValueError):
+        msg = datetime.datetime.strptime(date_str, '%b %d %H:%M:%S')
+        return msg.month, msg.day, msg.hour, msg.minute, msg.second
+
+
+def _date_str_to_timestamp(date_str, now=None):
+    """ Uncached `date_str_to_timestamp`.
+
+    :param date_str: string in '%b %d %H:%M:%S' format.
+    :param now: `time.struct_time` in local time the year is inferred from,
+    defaults to the current time.
+    :return: a string containing the UNIX timestamp
+    """
+    if now is None:
+        now = time.localtime()
+    month, day, hour, minute, second = _parse_date_str(date_str)
+    year = now.tm_year
+    # syslog dates have no year: a December message received in January is
+    # from last year, a January message received in December (clock skew)
+    # is from next year.
+    if month - now.tm_mon > 6:
+        year -= 1
+    elif now.tm_mon - month > 6:
+        year += 1
+    # validate the day like `strptime` would, `mktime` silently normalizes.
+    datetime.date(year, month, day)
+    return str(int(time.mktime(
+        (year, month, day, hour, minute, second, 0, 0, -1))))
 
 
 def date_str_to_timestamp(date_str):
     """ Convert '%b %d %H:%M:%S' date string format to UNIX timestamp in local
-    time assuming current year.
+    time. The year is the current year except around New Year.
+
+    Results are cached: syslog dates having a one second resolution, most
+    messages share a handful of date strings. The cache is emptied every day
+    so that a date string never maps to a past year.
 
     :param date_str: string in '%b %d %H:%M:%S' format.
     :return: a string containing the UNIX timestamp
     """
-    date = datetime.datetime.now()
-    msg = datetime.datetime.strptime(date_str, '%b %d %H:%M:%S')
-    date = date.replace(
-        year=date.year, month=msg.month, day=msg.day,
-        hour=msg.hour, minute=msg.minute, second=msg.second)
-    return date.strftime("%s")
+    global _date_cache_day
+    try:
+        return _date_cache[date_str]
+    except KeyError:
+        pass
+
+    now = time.localtime()
+    if _date_cache_day != now.tm_yday:
+        _date_cache.clear()
+        _date_cache_day = now.tm_yday
+    ts = _date_str_to_timestamp(date_str, now)
+    # dates mostly come in order: evict the oldest entry.
+    while len(_date_cache) >= DATE_CACHE_SIZE:
+        try:
+            _date_cache.popitem(last=False)
+        except KeyError:
+            break
+    _date_cache[date_str] = ts
+    return ts
 
 
 def parse_str_list(list_str):
@@ -33,6 +108,128 @@ def parse_str_list(list_str):
     return list(filter(None, ''.join(list_str.split()).split(',')))
 
 
+class KeyValueParser(object):
+    """ Single pass parser of space separated `KEY=value` syslog messages.
+
+    Every token is split once at its first `=` and its key dispatched through
+    a precomputed map to the output field. Fields missing from the message
+    keep their default value.
+
+    W/ a `record` type, the values are set by position in a list of the
+    defaults and returned as a record instead of a dictionary.
+    """
+
+    def __init__(self, fields, flags=(), record=None):
+        """
+        :param fields: sequence of (token key, output field, default value)
+        tuples. The output dictionary follows the order of `fields`. A None
+        token key declares a field only set by `flags`.
+        :param flags: sequence of (token prefix, output field, value) tuples
+        setting a field when a token starts with the prefix. Flags are checked
+        before keys.
+        :param record: optional `syslogng_kafka.records.Record` type whose
+        fields are the output fields, in the same order.
+        :raise ValueError: if the fields of `record` are not the output fields
+        """
+        self.template = [(field, default) for _, field, default in fields]
+        self.keys = dict((key, field) for key, field, _ in fields
+                         if key is not None)
+        self.flags = tuple(flags)
+        self.flag_prefixes = tuple(prefix for prefix, _, _ in self.flags)
+        self.record = record
+        if record is not None:
+            if record.fields != tuple(field for field, _ in self.template):
+                raise ValueError("Fields of %s are not the output fields"
+                                 % record.__name__)
+            index = dict((field, i)
+                         for i, (field, _) in enumerate(self.template))
+            self.defaults = [default for _, default in self.template]
+            self.keys = dict((key, index[field])
+                             for key, field in self.keys.items())
+            self.flags = tuple((prefix, index[field], value)
+                               for prefix, field, value in self.flags)
+
+    def __call__(self, msg):
+        """ Parse a message.
+
+        :param msg: syslog message
+        :return: a dictionary of the declared fields or a `record`
+        """
+        record = self.record
+        d = dict(self.template) if record is None else list(self.defaults)
+        keys = self.keys
+        flags = self.flags
+        flag_prefixes = self.flag_prefixes
+        for w in msg.split(' '):
+            if flag_prefixes and w.startswith(flag_prefixes):
+                for prefix, field, value in flags:
+                    if w.startswith(prefix):
+                        d[field] = value
+                        break
+                continue
+            key, sep, value = w.partition('=')
+            if sep and key in keys:
+                if '=' in value:
+                    value = value.split('=', 1)[0]
+                d[keys[key]] = value
+        if record is not None:
+            return record(d)
+        return d
+
+
+_FIREWALL_FIELDS = (
+    (None, 'action', 'allow'),
+    ('SRC', 'src_ip', -1),
+    ('DST', 'dest_ip', -1),
+    ('PROTO', 'proto', ''),
+    ('SPT', 'source_port', -1),
+    ('DPT', 'destination_port', -1),
+    ('MAC', 'mac_address', ''),
+    ('OUT', 'out', ''),
+    ('LEN', 'len', -1),
+    ('TOS', 'tos', -1),
+    ('PREC', 'proc', -1),
+    ('TTL', 'ttl', -1),
+    ('ID', 'id', -1),
+    ('MARK', 'mark', -1),
+    ('SEQ', 'seq', -1),
+    ('CODE', 'code', -1),
+)
+
+_FIREWALL_FLAGS = (('DROP', 'action', 'drop'),)
+
+_NAT_FIELDS = (
+    ('DNAT_IN', 'dnat_in', ''),
+    ('OUT', 'out', ''),
+    ('MAC', 'mac_address', ''),
+    ('SRC', 'src_ip', -1),
+    ('DST', 'dest_ip', -1),
+    ('LEN', 'len', -1),
+    ('TOS', 'tos', -1),
+    ('PREC', 'proc', -1),
+    ('TTL', 'ttl', -1),
+    ('ID', 'id', -1),
+    ('PROTO', 'proto', ''),
+    ('SPT', 'spt', -1),
+    ('DPT', 'dpt', -1),
+    ('WINDOW', 'window', -1),
+    ('RES', 'res', ''),
+    ('URGP', 'urgp', -1),
+)
+
+# records of the parsed firewall and nat messages
+FirewallEvent = record_type('FirewallEvent',
+                            [field for _, field, _ in _FIREWALL_FIELDS])
+
+NatEvent = record_type('NatEvent', [field for _, field, _ in _NAT_FIELDS])
+
+_FIREWALL_PARSER = KeyValueParser(_FIREWALL_FIELDS, _FIREWALL_FLAGS)
+_FIREWALL_EVENT_PARSER = KeyValueParser(_FIREWALL_FIELDS, _FIREWALL_FLAGS,
+                                        record=FirewallEvent)
+_NAT_PARSER = KeyValueParser(_NAT_FIELDS)
+_NAT_EVENT_PARSER = KeyValueParser(_NAT_FIELDS, record=NatEvent)
+
+
 def parse_firewall_msg(msg):
     """ Parse a syslog message from the firewall program into a python
     dictionary.
@@ -40,76 +237,7 @@ def parse_firewall_msg(msg):
     :param msg: firewall msg from syslog
     :return: a dictionary of firewall related key value pairs
     """
-
-    words = msg.split(' ')
-    action = 'allow'
-    src = -1
-    dest = -1
-    proto = ''
-    source_port = -1
-    destination_port = -1
-    mac = ''
-    out = ''
-    len_ = -1
-    tos = -1
-    proc = -1
-    ttl = -1
-    id_ = -1
-    mark = -1
-    seq = -1
-    code = -1
-    for w in words:
-        if w.startswith('DROP'):
-            action = 'drop'
-        elif w.startswith('SRC='):
-            src = w.split('=')[1]
-        elif w.startswith('DST='):
-            dest = w.split('=')[1]
-        elif w.startswith('PROTO='):
-            proto = w.split('=')[1]
-        elif w.startswith('SPT='):
-            source_port = w.split('=')[1]
-        elif w.startswith('DPT='):
-            destination_port = w.split('=')[1]
-        elif w.startswith('MAC='):
-            mac = w.split('=')[1]
-        elif w.startswith('OUT='):
-            out = w.split('=')[1]
-        elif w.startswith('LEN='):
-            len_ = w.split('=')[1]
-        elif w.startswith('TOS='):
-            tos = w.split('=')[1]
-        elif w.startswith('PREC='):
-            proc = w.split('=')[1]
-        elif w.startswith('TTL='):
-            ttl = w.split('=')[1]
-        elif w.startswith('ID='):
-            id_ = w.split('=')[1]
-        elif w.startswith('MARK='):
-            mark = w.split('=')[1]
-        elif w.startswith('SEQ='):
-            seq = w.split('=')[1]
-        elif w.startswith('CODE='):
-            code = w.split('=')[1]
-
-    d = dict()
-    d['action'] = action
-    d['src_ip'] = src
-    d['dest_ip'] = dest
-    d['proto'] = proto
-    d['source_port'] = source_port
-    d['destination_port'] = destination_port
-    d['mac_address'] = mac
-    d['out'] = out
-    d['len'] = len_
-    d['tos'] = tos
-    d['proc'] = proc
-    d['ttl'] = ttl
-    d['id'] = id_
-    d['mark'] = mark
-    d['seq'] = seq
-    d['code'] = code
-    return d
+    return _FIREWALL_PARSER(msg)
 
 
 def parse_nat_msg(msg):
@@ -119,74 +247,24 @@ def parse_nat_msg(msg):
     :param msg: nat msg from syslog
     :return: a dictionary of nat related key value pairs
     """
+    return _NAT_PARSER(msg)
+
+
+def parse_firewall_event(msg):
+    """ Parse a syslog message from the firewall program into a
+    `FirewallEvent`.
+
+    :param msg: firewall msg from syslog
+    :return: a `FirewallEvent`, read like the dictionary of
+    `parse_firewall_msg`.
+    """
+    return _FIREWALL_EVENT_PARSER(msg)
+
+
+def parse_nat_event(msg):
+    """ Parse a syslog message from the nat program into a `NatEvent`.
 
-    dnat_in = ''
-    out = ''
-    mac = ''
-    src = -1
-    dest = -1
-    len_ = -1
-    tos = -1
-    proc = -1
-    ttl = -1
-    id_ = -1
-    proto = ''
-    spt = -1
-    dpt = -1
-    window = -1
-    res = ''
-    urgp = -1
-
-    words = msg.split(' ')
-    for w in words:
-        if w.startswith('DNAT_IN='):
-            dnat_in = w.split('=')[1]
-        elif w.startswith('OUT='):
-            out = w.split('=')[1]
-        elif w.startswith('MAC='):
-            mac = w.split('=')[1]
-        elif w.startswith('SRC='):
-            src = w.split('=')[1]
-        elif w.startswith('DST='):
-            dest = w.split('=')[1]
-        elif w.startswith('LEN='):
-            len_ = w.split('=')[1]
-        elif w.startswith('TOS='):
-            tos = w.split('=')[1]
-        elif w.startswith('PREC='):
-            proc = w.split('=')[1]
-        elif w.startswith('TTL='):
-            ttl = w.split('=')[1]
-        elif w.startswith('ID='):
-            id_ = w.split('=')[1]
-        elif w.startswith('PROTO='):
-            proto = w.split('=')[1]
-        elif w.startswith('SPT='):
-            spt = w.split('=')[1]
-        elif w.startswith('DPT='):
-            dpt = w.split('=')[1]
-        elif w.startswith('WINDOW='):
-            window = w.split('=')[1]
-        elif w.startswith('RES='):
-            res = w.split('=')[1]
-        elif w.startswith('URGP='):
-            urgp = w.split('=')[1]
-
-    d = dict()
-    d['dnat_in'] = dnat_in
-    d['out'] = out
-    d['mac_address'] = mac
-    d['src_ip'] = src
-    d['dest_ip'] = dest
-    d['len'] = len_
-    d['tos'] = tos
-    d['proc'] = proc
-    d['ttl'] = ttl
-    d['id'] = id_
-    d['proto'] = proto
-    d['spt'] = spt
-    d['dpt'] = dpt
-    d['window'] = window
-    d['res'] = res
-    d['urgp'] = urgp
-    return d
+    :param msg: nat msg from syslog
+    :return: a `NatEvent`, read like the dictionary of `parse_nat_msg`.
+    """
+    return _NAT_EVENT_PARSER(msg)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+"""Producer worker processes fed through shared-memory ring buffers.
+
+In worker mode `send()` only copies the fields of the message into a ring
+buffer. Worker processes forked at `open()` read them back and run the
+filter, parse, serialize and produce pipeline of a destination of their
+own, each w/ its own producer and interpreter lock.
+
+Every worker has its own single-producer, single-consumer ring buffer in
+anonymous shared memory: the writing and reading positions are only
+written by one side each so that no lock is needed. A supervisor thread
+restarts the workers that exit or stop beating while messages wait, the
+messages left in the ring being read by the new worker. `stop()` waits for
+the rings to be drained before stopping the workers, which flush their
+producer.
+"""
+
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+from collections import Counter
+from time import sleep
+from time import time
+
+from . import log
+from .log import LOG
+
+# default `worker_ring_bytes`
+DEFAULT_WORKER_RING_BYTES = 8 * 1024 * 1024
+
+# seconds between two checks of the workers by the supervisor
+HEALTH_CHECK_INTERVAL = 1.0
+
+# seconds w/o heartbeat after which a worker w/ waiting messages is
+# restarted
+HEARTBEAT_TIMEOUT = 60.0
+
+# messages a worker handles between two heartbeats
+HEARTBEAT_MESSAGES = 1000
+
+# seconds `WorkerPool.stop()` waits for the rings to be drained
+DRAIN_TIMEOUT = 30
+
+# maximum seconds an idle worker sleeps before looking at its ring again
+IDLE_MAX_SLEEP = 0.01
+
+# seconds a worker waits before retrying a message its destination held
+HELD_RETRY_INTERVAL = 1.0
+
+# workers are forked: the embedded interpreter of syslog-ng cannot be
+# spawned.
+if hasattr(multiprocessing, 'get_context'):
+    _context = multiprocessing.get_context('fork')
+else:  # pragma: no cover
+    _context = multiprocessing
+
+# header: writing position, stop flag, then reading position and heartbeat
+# on their own cache line.
+_HEADER = 128
+_HEAD = 0
+_STOP = 8
+_TAIL = 64
+_BEAT = 72
+
+_COUNTER = struct.Struct('<Q')
+_CLOCK = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+_ALIGN = 8
+# record length of the padding before the end of the ring
+_WRAP = 0xFFFFFFFF
+
+# types of the encoded message values
+_BYTES, _TEXT, _NONE = range(3)
+_FIELD = struct.Struct('<HBI')
+
+
+def encode_message(msg):
+    """ Encode a message dictionary of text, bytes or None values.
+    """
+    parts = []
+    for key, value in msg.items():
+        key = key.encode('utf-8')
+        if value is None:
+            kind, value = _NONE, b''
+        elif isinstance(value, bytes):
+            kind = _BYTES
+        else:
+            kind, value = _TEXT, value.encode('utf-8')
+        parts.append(_FIELD.pack(len(key), kind, len(value)))
+        parts.append(key)
+        parts.append(value)
+    return b''.join(parts)
+
+
+def decode_message(data):
+    """ Decode a message dictionary encoded by `encode_message()`.
+    """
+    msg = {}
+    pos, end, size = 0, len(data), _FIELD.size
+    while pos < end:
+        key_length, kind, length = _FIELD.unpack_from(data, pos)
+        pos += size
+        key = data[pos:pos + key_length].decode('utf-8')
+        pos += key_length
+        value = data[pos:pos + length]
+        pos += length
+        if kind == _TEXT:
+            value = value.decode('utf-8')
+        elif kind == _NONE:
+            value = None
+        msg[key] = value
+    return msg
+
+
+def _aligned(length):
+    return (_LENGTH.size + length + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class RingBuffer(object):
+    """ Single-producer, single-consumer ring buffer of byte strings in
+    anonymous shared memory, shared w/ the processes forked after its
+    creation.
+    """
+
+    def __init__(self, size=DEFAULT_WORKER_RING_BYTES):
+        """
+        :param size: bytes of the ring, rounded up to a multiple of 8
+        """
+        self.capacity = (size + _ALIGN - 1) // _ALIGN * _ALIGN
+        if self.capacity < 4 * _ALIGN:
+            raise ValueError("Ring buffer of %d bytes is too small" % size)
+        self._mmap = mmap.mmap(-1, _HEADER + self.capacity)
+
+    def _read(self, offset, fmt=_COUNTER):
+        return fmt.unpack_from(self._mmap, offset)[0]
+
+    def _write(self, offset, value, fmt=_COUNTER):
+        fmt.pack_into(self._mmap, offset, value)
+
+    def __len__(self):
+        """ Bytes waiting to be read. """
+        return self._read(_HEAD) - self._read(_TAIL)
+
+    @property
+    def stopping(self):
+        """ True once the producer asked the consumer to stop. """
+        return self._read(_STOP) != 0
+
+    def stop(self):
+        self._write(_STOP, 1)
+
+    @property
+    def heartbeat(self):
+        """ Time of the last heartbeat of the consumer. """
+        return self._read(_BEAT, _CLOCK)
+
+    def beat(self):
+        self._write(_BEAT, time(), _CLOCK)
+
+    def put(self, data):
+        """ Append a record, producer side.
+
+        :return: False if the ring is full
+        :raise ValueError: if the record is larger than half the ring, such
+        a record not always fitting before the end of the ring.
+        """
+        capacity = self.capacity
+        size = _aligned(len(data))
+        if size > capacity // 2:
+            raise ValueError("Record of %d bytes too large for a ring of %d "
+                             "bytes" % (len(data), capacity))
+        head = self._read(_HEAD)
+        pos = head % capacity
+        pad = capacity - pos if pos + size > capacity else 0
+        if head + pad + size - self._read(_TAIL) > capacity:
+            return False
+        if pad:
+            self._write(_HEADER + pos, _WRAP, _LENGTH)
+            pos = 0
+        start = _HEADER + pos
+        _LENGTH.pack_into(self._mmap, start, len(data))
+        start += _LENGTH.size
+        self._mmap[start:start + len(data)] = data
+        # published once written
+        self._write(_HEAD, head + pad + size)
+        return True
+
+    def get(self):
+        """ Pop the oldest record, consumer side.
+
+        :return: the record or None if the ring is empty
+        """
+        tail = self._read(_TAIL)
+        if tail == self._read(_HEAD):
+            return None
+        capacity = self.capacity
+        pos = tail % capacity
+        length = self._read(_HEADER + pos, _LENGTH)
+        if length == _WRAP:
+            tail += capacity - pos
+            pos = 0
+            length = self._read(_HEADER, _LENGTH)
+        start = _HEADER + pos + _LENGTH.size
+        data = self._mmap[start:start + length]
+        self._write(_TAIL, tail + _aligned(length))
+        return data
+
+    def close(self):
+        self._mmap.close()
+
+
+def _run_worker(factory, args, ring):
+    """ Main function of a worker process.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    parent = os.getppid()
+    log.after_fork()
+    dest = factory()
+    if not dest.init(args) or not dest.open():
+        LOG.error("Worker %d cannot start its destination" % os.getpid())
+        raise SystemExit(2)
+    ring.beat()
+    handled = 0
+    idle = 0.0
+    try:
+        while True:
+            data = ring.get()
+            if data is None:
+                ring.beat()
+                if ring.stopping or os.getppid() != parent:
+                    break
+                idle = min(idle * 2 or 0.0001, IDLE_MAX_SLEEP)
+                sleep(idle)
+                continue
+            idle = 0.0
+            msg = decode_message(data)
+            while not dest.send_message(msg):
+                # held back by the destination: retry
+                ring.beat()
+                if os.getppid() != parent:
+                    break
+                sleep(HELD_RETRY_INTERVAL)
+            handled += 1
+            if handled % HEARTBEAT_MESSAGES == 0:
+                ring.beat()
+    finally:
+        dest.close()
+        dest.deinit()
+        log.ch.close()
+
+
+class WorkerPool(object):
+    """ Worker processes running a destination each, fed in turn w/ the
+    messages of `put()`.
+
+    `counters` holds the messages refused because the rings were full or
+    discarded for being too large and the restarts of the workers.
+    """
+
+    def __init__(self, factory, args, workers=1,
+                 ring_bytes=DEFAULT_WORKER_RING_BYTES,
+                 interval=HEALTH_CHECK_INTERVAL):
+        """
+        :param factory: class of the destination of the workers
+        :param args: options of the destination of the workers
+        :param workers: number of worker processes
+        :param ring_bytes: bytes of the ring buffer of every worker
+        :param interval: seconds between two checks of the workers
+        """
+        self.factory = factory
+        self.args = args
+        self.interval = interval
+        self.rings = [RingBuffer(ring_bytes) for _ in range(workers)]
+        self.processes = [None] * workers
+        self.counters = Counter()
+        self._next = 0
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def start(self):
+        """ Fork the workers and start supervising them. """
+        for i in range(len(self.rings)):
+            self._spawn(i)
+        self._supervisor = threading.Thread(
+            target=self._supervise, name='syslogng_kafka-workers')
+        self._supervisor.daemon = True
+        self._supervisor.start()
+
+    def _spawn(self, i):
+        # not stuck before it had a chance to start
+        self.rings[i].beat()
+        process = _context.Process(
+            target=_run_worker, args=(self.factory, self.args, self.rings[i]),
+            name='syslogng_kafka-worker-%d' % i)
+        process.daemon = True
+        process.start()
+        self.processes[i] = process
+        LOG.info("Worker %d started w/ pid %s" % (i, process.pid))
+
+    def put(self, msg):
+        """ Hand a message dictionary to the next worker w/ room for it.
+
+        :return: False if every ring is full, True if the message was handed
+        or discarded for being too large.
+        """
+        data = encode_message(msg)
+        rings = self.rings
+        try:
+            for _ in range(len(rings)):
+                ring = rings[self._next]
+                self._next = (self._next + 1) % len(rings)
+                if ring.put(data):
+                    return True
+        except ValueError as e:
+            # would never fit: discarded
+            self.counters['too_large'] += 1
+            LOG.error("%s. This message will be discarded." % e)
+            return True
+        self.counters['ring_full'] += 1
+        return False
+
+    def _supervise(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                LOG.error("Worker supervision failed: %s" % e, exc_info=True)
+
+    def check(self):
+        """ Restart the workers that exited or stopped beating while
+        messages wait in their ring.
+
+        :return: the indexes of the restarted workers
+        """
+        restarted = []
+        for i, process in enumerate(self.processes):
+            ring = self.rings[i]
+            if not process.is_alive():
+                LOG.error("Worker %d (pid %s) exited w/ code %s, restarting "
+                          "it. %d bytes waiting." % (i, process.pid,
+                                                     process.exitcode,
+                                                     len(ring)))
+            elif len(ring) and time() - ring.heartbeat > HEARTBEAT_TIMEOUT:
+                LOG.error("Worker %d (pid %s) stuck for %ss, restarting it. "
+                          "%d bytes waiting." % (i, process.pid,
+                                                 HEARTBEAT_TIMEOUT, len(ring)))
+                process.terminate()
+                process.join(HEALTH_CHECK_INTERVAL)
+            else:
+                continue
+            self.counters['restarts'] += 1
+            self._spawn(i)
+            restarted.append(i)
+        return restarted
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """ Wait for the rings to be drained, stop the workers and wait for
+        them to flush their producer.
+
+        :param timeout: seconds to wait for the rings to be drained
+        """
+        deadline = time() + timeout
+        while any(len(ring) for ring in self.rings) and time() < deadline:
+            sleep(0.01)
+        waiting = sum(len(ring) for ring in self.rings)
+        if waiting:
+            LOG.error("Workers did not drain %d bytes in %ss"
+                      % (waiting, timeout))
+        self._stopped.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for ring in self.rings:
+            ring.stop()
+        for i, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                LOG.error("Worker %d (pid %s) did not stop, terminating it"
+                          % (i, process.pid))
+                process.terminate()
+                process.join()
+        for ring in self.rings:
+            ring.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.dedup` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka.dedup import Deduplicator
+
+
+def message(src_ip=u'10.0.0.1', program=u'firewall'):
+    return {'PROGRAM': program, 'HOST': u'fw1',
+            'MESSAGE': {'action': u'DROP', 'src_ip': src_ip,
+                        'destination_port': u'22'}}
+
+
+class TestDeduplicator(unittest.TestCase):
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, Deduplicator, ())
+        self.assertRaises(ValueError, Deduplicator, ('src_ip',), window=0)
+        self.assertRaises(ValueError, Deduplicator, ('src_ip',), max_keys=0)
+
+    def test_window(self):
+        dedup = Deduplicator(('src_ip', 'destination_port'), window=1.0)
+        for now in (10.0, 10.2, 10.5):
+            self.assertIsNone(dedup(message(), now=now))
+        self.assertIsNone(dedup(message(u'10.0.0.2'), now=10.6))
+        self.assertEqual(2, len(dedup))
+
+        self.assertEqual([], dedup.expired(now=10.9))
+        expired = dedup.expired(now=11.0)
+        self.assertEqual(1, len(expired))
+        self.assertEqual(3, expired[0]['count'])
+        self.assertEqual(10000, expired[0]['first_seen'])
+        self.assertEqual(10500, expired[0]['last_seen'])
+        self.assertEqual(u'10.0.0.1', expired[0]['MESSAGE']['src_ip'])
+
+        # a new window
+        self.assertIsNone(dedup(message(), now=11.1))
+        drained = dedup.drain()
+        self.assertEqual([u'10.0.0.2', u'10.0.0.1'],
+                         [msg['MESSAGE']['src_ip'] for msg in drained])
+        self.assertEqual([1, 1], [msg['count'] for msg in drained])
+        self.assertEqual(0, len(dedup))
+        self.assertEqual({'suppressed': 2, 'produced': 3},
+                         dict(dedup.counters))
+
+    def test_passed(self):
+        dedup = Deduplicator(('src_ip',))
+        msg = message(program=u'sshd')
+        self.assertIs(msg, dedup(msg))
+        # not parsed or w/o the fields
+        msg = dict(message(), MESSAGE=u'hello')
+        self.assertIs(msg, dedup(msg))
+        msg = message()
+        del msg['MESSAGE']['src_ip']
+        self.assertIs(msg, dedup(msg))
+        self.assertEqual(0, len(dedup))
+
+    def test_max_keys(self):
+        dedup = Deduplicator(('src_ip',), window=60, max_keys=2)
+        for i in range(3):
+            self.assertIsNone(dedup(message(u'10.0.0.%d' % i), now=10 + i))
+        self.assertEqual(2, len(dedup))
+        self.assertEqual(1, dedup.counters['evicted'])
+        expired = dedup.expired(now=13)
+        self.assertEqual([u'10.0.0.0'],
+                         [msg['MESSAGE']['src_ip'] for msg in expired])
+
+        # given back when it could not be produced
+        dedup.hold_back(expired)
+        self.assertEqual(expired, dedup.expired(now=13))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
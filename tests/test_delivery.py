@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.delivery` module.
+"""
+
+import sys
+import threading
+import unittest
+
+from mock import MagicMock
+
+from syslogng_kafka import delivery
+from syslogng_kafka.delivery import DeliveryReporter
+from syslogng_kafka.log import LOG
+
+
+class FakeMessage(object):
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+
+class FakeError(object):
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def str(self):
+        return 'Local: %s' % self._name
+
+
+class TestDeliveryReporter(unittest.TestCase):
+    def setUp(self):
+        LOG.debug = MagicMock(name='debug')
+        LOG.info = MagicMock(name='info')
+        LOG.warning = MagicMock(name='warning')
+        LOG.error = MagicMock(name='error')
+
+    def test_counters(self):
+        reporter = DeliveryReporter(samples=0)
+        for _ in range(3):
+            reporter(None, FakeMessage(b'12345'))
+        reporter(None, FakeMessage(None))
+        reporter(FakeError('_MSG_TIMED_OUT'), FakeMessage(b'123'))
+        LOG.debug.assert_not_called()
+        # totals are updated by the summaries
+        self.assertEqual({}, dict(reporter.counters))
+
+        reporter.report()
+        self.assertEqual({'delivered': 4, 'delivered_bytes': 15, 'failed': 1,
+                          'failed_bytes': 3}, dict(reporter.counters))
+        self.assertEqual({'_MSG_TIMED_OUT': 1}, dict(reporter.errors))
+        LOG.warning.assert_called_once_with(
+            "Delivery report: 4 delivered (15 bytes), 1 failed (3 bytes) "
+            "_MSG_TIMED_OUT=1")
+
+        # nothing new: no summary
+        reporter.report()
+        LOG.warning.assert_called_once()
+        LOG.info.assert_not_called()
+
+        reporter(None, FakeMessage(b'1'))
+        reporter.report()
+        LOG.info.assert_called_once_with(
+            "Delivery report: 1 delivered (1 bytes)")
+        self.assertEqual(5, reporter.counters['delivered'])
+
+    def test_samples(self):
+        reporter = DeliveryReporter(samples=2)
+        for i in range(5):
+            reporter(None, FakeMessage(b'%d' % i))
+        self.assertEqual(2, LOG.debug.call_count)
+        reporter.report()
+        reporter(None, FakeMessage(b'x'))
+        self.assertEqual(3, LOG.debug.call_count)
+
+        size = delivery.PAYLOAD_LOG_BYTES
+        reporter.report()
+        reporter(None, FakeMessage(b'x' * (size + 10)))
+        self.assertIn('... (%d bytes)' % (size + 10),
+                      LOG.debug.call_args[0][0])
+
+    def test_error_logs(self):
+        reporter = DeliveryReporter(error_logs=2)
+        for _ in range(5):
+            reporter(FakeError('_MSG_TIMED_OUT'), FakeMessage(b'x'))
+        reporter(FakeError('_TRANSPORT'), FakeMessage(b'x'))
+        self.assertEqual(3, LOG.error.call_count)
+        self.assertIn('Local: _TRANSPORT', LOG.error.call_args[0][0])
+
+        reporter.report()
+        LOG.warning.assert_called_once_with(
+            "Delivery report: 0 delivered (0 bytes), 6 failed (6 bytes) "
+            "_MSG_TIMED_OUT=5, _TRANSPORT=1, 3 error logs suppressed")
+        self.assertEqual(3, reporter.counters['suppressed'])
+
+        # logged again in the next interval
+        reporter(FakeError('_MSG_TIMED_OUT'), FakeMessage(b'x'))
+        self.assertEqual(4, LOG.error.call_count)
+
+    def test_interval(self):
+        reporter = DeliveryReporter(interval=0)
+        reporter(None, FakeMessage(b'x'))
+        LOG.info.assert_called_once()
+        self.assertEqual(1, reporter.counters['delivered'])
+
+    def test_failures_only(self):
+        reporter = DeliveryReporter(interval=1000, successes=False)
+        reporter(FakeError('_MSG_TIMED_OUT'), FakeMessage(b'123'))
+        reporter.maybe_report()
+        LOG.warning.assert_not_called()
+        reporter._last_report -= 1
+        reporter.maybe_report()
+        LOG.warning.assert_called_once_with(
+            "Delivery report: 1 failed (3 bytes) _MSG_TIMED_OUT=1")
+
+    def test_threads(self):
+        reporter = DeliveryReporter(samples=0)
+
+        def deliver():
+            for _ in range(2000):
+                reporter(None, FakeMessage(b'x'))
+                reporter(FakeError('_MSG_TIMED_OUT'), FakeMessage(b'x'))
+
+        # e.g. syslog-ng's thread and the spill drainer
+        threads = [threading.Thread(target=deliver) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            reporter.report()
+        for thread in threads:
+            thread.join()
+        reporter.report()
+        self.assertEqual(8000, reporter.counters['delivered'])
+        self.assertEqual(8000, reporter.counters['failed'])
+        self.assertEqual({'_MSG_TIMED_OUT': 8000}, dict(reporter.errors))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
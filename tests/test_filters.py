@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.filters` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka import filters
+from syslogng_kafka.filters import ProgramFilter
+
+
+class TestProgramFilter(unittest.TestCase):
+    def test_exact(self):
+        f = ProgramFilter(['firewall', 'nat'])
+        self.assertTrue(f('firewall'))
+        self.assertTrue(f('nat'))
+        self.assertFalse(f('firewall2'))
+        self.assertFalse(f(''))
+
+    def test_wildcards(self):
+        f = ProgramFilter(['firewall*', 'kernel/*', 'ds?', 'a.b'])
+        self.assertTrue(f('firewall'))
+        self.assertTrue(f('firewall-edge'))
+        self.assertTrue(f('kernel/iptables'))
+        self.assertFalse(f('kernel'))
+        self.assertTrue(f('ds1'))
+        self.assertFalse(f('ds12'))
+        # regular expression characters are literal
+        self.assertTrue(f('a.b'))
+        self.assertFalse(f('axb'))
+
+    def test_exclude(self):
+        f = ProgramFilter(exclude=['cron', 'systemd*'])
+        self.assertTrue(f('firewall'))
+        self.assertFalse(f('cron'))
+        self.assertFalse(f('systemd-logind'))
+
+        f = ProgramFilter(['firewall*'], ['firewall-debug'])
+        self.assertTrue(f('firewall'))
+        self.assertFalse(f('firewall-debug'))
+        self.assertFalse(f('nat'))
+
+        self.assertTrue(ProgramFilter()('anything'))
+        self.assertFalse(ProgramFilter([])('anything'))
+
+    def test_decision_cache(self):
+        size = filters.DECISION_CACHE_SIZE
+        filters.DECISION_CACHE_SIZE = 2
+        try:
+            f = ProgramFilter(['a*'])
+            for program in ('a1', 'b', 'a2'):
+                f(program)
+            self.assertEqual({'a2': True}, f._decisions)
+            self.assertTrue(f('a1'))
+            self.assertFalse(f('b'))
+        finally:
+            filters.DECISION_CACHE_SIZE = size
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.instrument` module.
+"""
+
+import sys
+import unittest
+
+from mock import MagicMock
+
+from syslogng_kafka.instrument import Histogram
+from syslogng_kafka.instrument import StageTimer
+from syslogng_kafka.instrument import clock_ns
+from syslogng_kafka.log import LOG
+
+
+class TestInstrument(unittest.TestCase):
+    def test_clock_ns(self):
+        start = clock_ns()
+        self.assertTrue(clock_ns() >= start)
+
+    def test_histogram(self):
+        h = Histogram()
+        self.assertEqual(0, h.percentile(99))
+        self.assertEqual(0.0, h.mean)
+        for ns in [100] * 90 + [5000] * 9 + [70000]:
+            h.add(ns)
+        self.assertEqual(100, h.count)
+        self.assertEqual(70000, h.max)
+        self.assertEqual(1240.0, h.mean)
+        # upper bounds of the log2 buckets
+        self.assertEqual(128, h.percentile(50))
+        self.assertEqual(128, h.percentile(90))
+        self.assertEqual(8192, h.percentile(99))
+        self.assertEqual(70000, h.percentile(100))
+
+    def test_sample(self):
+        timer = StageTimer(3)
+        self.assertEqual([False, False, True] * 2,
+                         [timer.sample() for _ in range(6)])
+        self.assertTrue(StageTimer(1).sample())
+        self.assertRaises(ValueError, StageTimer, 0)
+
+    def test_dump(self):
+        timer = StageTimer(10, interval=60000)
+        LOG.info = MagicMock(name='info')
+        timer.dump()
+        LOG.info.assert_not_called()
+
+        timer.record('parse', 1000)
+        timer.record('produce', 2000)
+        timer.record('parse', 3000)
+        self.assertEqual(['parse', 'produce'], list(timer.stages))
+        self.assertEqual(2, timer.stages['parse'].count)
+
+        timer.maybe_dump()
+        LOG.info.assert_not_called()
+
+        timer.interval = 0
+        timer.maybe_dump()
+        self.assertEqual(3, LOG.info.call_count)
+        self.assertIn('parse      n=2 avg=2.0us',
+                      LOG.info.call_args_list[1][0][0])
+        # histograms are reset
+        self.assertEqual({}, dict(timer.stages))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
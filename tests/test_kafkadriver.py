@@ -9,20 +9,31 @@ Tests for `syslogng_kafka` module.
 """
 
 import ast
+import json
+import os
+import shutil
 import sys
+import tempfile
+import time
 import unittest
 
+from confluent_kafka import KafkaError
 from confluent_kafka import KafkaException
 from mock import MagicMock
 from mock import ANY
+from mock import patch
 
 # noinspection PyUnresolvedReferences
 import monkey  # NOQA
 import syslogng_kafka
 from syslogng_kafka.kafkadriver import DEFAULT_BROKER_VERSION_FALLBACK
+from syslogng_kafka.kafkadriver import ERROR, QUEUED, SUCCESS
 from syslogng_kafka.kafkadriver import KafkaDestination
-from syslogng_kafka.kafkadriver import delivery_callback, stats_callback
+from syslogng_kafka.kafkadriver import stats_callback
 from syslogng_kafka.log import LOG
+from syslogng_kafka.partitioner import HashRing
+from syslogng_kafka.spill import SpillDrainer
+from syslogng_kafka.tuning import PROFILES
 
 
 class TestKafkaDestination(unittest.TestCase):
@@ -49,7 +60,7 @@ class TestKafkaDestination(unittest.TestCase):
              'bootstrap.servers': conf['hosts'],
              'broker.version.fallback': DEFAULT_BROKER_VERSION_FALLBACK,
              'delivery.report.only.error': True,
-             'on_delivery': delivery_callback,
+             'on_delivery': dest.delivery_reporter,
              'stats_cb': stats_callback
              })
 
@@ -127,7 +138,7 @@ class TestKafkaDestination(unittest.TestCase):
              'bootstrap.servers': conf['hosts'],
              'broker.version.fallback': DEFAULT_BROKER_VERSION_FALLBACK,
              'delivery.report.only.error': True,
-             'on_delivery': delivery_callback,
+             'on_delivery': dest.delivery_reporter,
              'stats_cb': stats_callback
              })
 
@@ -148,8 +159,7 @@ class TestKafkaDestination(unittest.TestCase):
              'bootstrap.servers': conf['hosts'],
              'broker.version.fallback': DEFAULT_BROKER_VERSION_FALLBACK,
              'delivery.report.only.error': True,
-             'on_delivery': delivery_callback,
-             'stats_cb': stats_callback
+             'on_delivery': dest.delivery_reporter
              })
 
         # multiple programs with space after coma.
@@ -169,8 +179,7 @@ class TestKafkaDestination(unittest.TestCase):
              'bootstrap.servers': conf['hosts'],
              'broker.version.fallback': DEFAULT_BROKER_VERSION_FALLBACK,
              'delivery.report.only.error': True,
-             'on_delivery': delivery_callback,
-             'stats_cb': stats_callback
+             'on_delivery': dest.delivery_reporter
              })
 
     def test_init_group_config(self):
@@ -192,7 +201,7 @@ class TestKafkaDestination(unittest.TestCase):
              'broker.version.fallback': DEFAULT_BROKER_VERSION_FALLBACK,
              'delivery.report.only.error': True,
              'group.id': conf['group_id'],
-             'on_delivery': delivery_callback,
+             'on_delivery': dest.delivery_reporter,
              'stats_cb': stats_callback
              })
 
@@ -341,6 +350,57 @@ class TestKafkaDestination(unittest.TestCase):
         dest._kafka_producer.produce.assert_not_called()
         dest._kafka_producer.flush.assert_not_called()
 
+    def test_send_filter_message_wildcards(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'programs': 'fire*, nat', 'exclude_programs': 'firewall-dbg'}
+        self.assertTrue(dest.init(conf))
+        self.assertEquals(dest.programs, ['fire*', 'nat'])
+        self.assertEquals(dest.exclude_programs, ['firewall-dbg'])
+        self.assertTrue(dest.open())
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        for program in (u'firewall-dbg', u'XXX', u'firewall-edge', u'nat'):
+            msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                   'HOST': u'10.11.12.102', 'PROGRAM': program,
+                   'DATE': None, 'MESSAGE': u'hello'}
+            dest.send(msg)
+
+        self.assertEquals(dest._kafka_producer.produce.call_count, 2)
+
+    def test_send_filter_log_message(self):
+        class LogMessage(object):
+            """ Read-only syslog-ng message counting the fetched fields. """
+
+            def __init__(self, program):
+                self.fetched = []
+                self.fields = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                               'HOST': u'10.11.12.102', 'PROGRAM': program,
+                               'DATE': None, 'MESSAGE': u'hello'}
+
+            def __getattr__(self, name):
+                self.fetched.append(name)
+                return self.fields[name]
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'programs': 'sshd'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        # nothing but PROGRAM fetched from the messages filtered out
+        msg = LogMessage(u'XXX')
+        self.assertTrue(dest.send(msg))
+        self.assertEqual(['PROGRAM'], msg.fetched)
+        dest._kafka_producer.produce.assert_not_called()
+
+        msg = LogMessage(u'sshd')
+        self.assertTrue(dest.send(msg))
+        dest._kafka_producer.produce.assert_called_once_with(
+            'my_topic', repr(msg.fields).encode('utf-8'))
+
     def test_send_message_key(self):
         dest = KafkaDestination()
         conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
@@ -405,23 +465,10 @@ class TestKafkaDestination(unittest.TestCase):
     def test_send_message_partition_bad(self):
         dest = KafkaDestination()
         conf = {'hosts': '192.168.0.1', 'topic': 'my_topic', 'partition': 'XXX'}
-        self.assertTrue(dest.init(conf))
-        self.assertTrue(dest.open())
-
-        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
-               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
-               'DATE': 'Jun 22 12:49:16', 'ttl': u'128', 'len': u'209',
-               'mark': u'0x1', 'src_ip': u'10.11.12.53', 'source_port': u'138',
-               'destination_port': u'138', 'out': u'', 'proc': u'0x00',
-               'id': u'13254', 'dest_ip': u'209.143.151.70'}
-
-        dest._kafka_producer.produce = MagicMock(name='produce')
-        LOG.warning = MagicMock(name='warning')
-
-        dest.send(msg)
-
-        LOG.warning.assert_called_once()
-        dest._kafka_producer.produce.assert_called_once_with(conf['topic'], ANY)
+        LOG.error = MagicMock(name='error')
+        # checked once at initialization time
+        self.assertFalse(dest.init(conf))
+        LOG.error.assert_called_once()
 
     def test_send_filter_message_firewall(self):
         dest = KafkaDestination()
@@ -453,6 +500,215 @@ class TestKafkaDestination(unittest.TestCase):
 
         dest._kafka_producer.flush.assert_not_called()
 
+    def test_send_batch(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': '3', 'batch_timeout': '60000'}
+        self.assertTrue(dest.init(conf))
+        self.assertEquals(dest.batch_lines, 3)
+        self.assertEquals(dest.batch_timeout, 60)
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'hello'}
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        self.assertEquals(dest.send(dict(msg)), QUEUED)
+        self.assertEquals(dest.send(dict(msg)), QUEUED)
+        dest._kafka_producer.produce.assert_not_called()
+
+        self.assertEquals(dest.flush(), SUCCESS)
+        self.assertEquals(dest._kafka_producer.produce.call_count, 2)
+        dest._kafka_producer.poll.assert_called_once_with(0)
+
+        # nothing left to flush
+        self.assertEquals(dest.flush(), SUCCESS)
+        self.assertEquals(dest._kafka_producer.produce.call_count, 2)
+
+        # syslog-ng < 3.18 does not call `flush()`: `batch_lines` triggers it.
+        for _ in range(3):
+            dest.send(dict(msg))
+        self.assertEquals(dest._kafka_producer.produce.call_count, 5)
+
+    def test_send_batch_fails(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': '10'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'hello'}
+
+        def produce(topic, msg, **kwargs):
+            raise KafkaException("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+        LOG.error = MagicMock(name='error')
+
+        self.assertEquals(dest.send(dict(msg)), QUEUED)
+        self.assertEquals(dest.flush(), ERROR)
+
+    def test_send_batch_queue_full(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': '50'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'hello'}
+        produced = []
+
+        def produce(topic, msg, **kwargs):
+            if produced:
+                raise BufferError("Fake exception.")
+            produced.append(msg)
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+        for _ in range(10):
+            self.assertEquals(dest.send(dict(msg)), QUEUED)
+
+        # a single wait, the rest of the batch held back
+        with patch('syslogng_kafka.kafkadriver.sleep') as sleep:
+            self.assertEquals(dest.flush(), SUCCESS)
+        sleep.assert_called_once_with(5)
+        self.assertEquals(1, len(produced))
+        self.assertEquals(9, len(dest._batch))
+        self.assertEquals(0, dest.backpressure_counters['dropped'])
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+        self.assertEquals(dest.flush(), SUCCESS)
+        self.assertEquals(9, dest._kafka_producer.produce.call_count)
+
+    def test_send_batch_held_old_syslogng(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': '2'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'hello'}
+
+        def produce(topic, msg, **kwargs):
+            raise BufferError("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        # syslog-ng < 3.18 never calls `flush()` and only checks the truth
+        # value: suspended, the message of `send()` being retried by it.
+        self.assertEquals(dest.send(dict(msg, MESSAGE=u'first')), QUEUED)
+        with patch('syslogng_kafka.kafkadriver.sleep'):
+            self.assertIs(dest.send(dict(msg, MESSAGE=u'second')), False)
+        self.assertEquals(1, len(dest._batch))
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+        self.assertEquals(dest.send(dict(msg, MESSAGE=u'second')), SUCCESS)
+        self.assertEquals([u'first', u'second'], [
+            ast.literal_eval(call[0][1].decode('utf-8'))['MESSAGE']
+            for call in dest._kafka_producer.produce.call_args_list])
+
+        # all failed
+        def produce(topic, msg, **kwargs):
+            raise KafkaException("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        LOG.error = MagicMock(name='error')
+        self.assertEquals(dest.send(dict(msg)), QUEUED)
+        self.assertIs(dest.send(dict(msg)), False)
+
+    def test_send_batch_held_flushed(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': '10'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'hello'}
+
+        def produce(topic, msg, **kwargs):
+            raise BufferError("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        # syslog-ng >= 3.18 retries the whole batch itself
+        self.assertEquals(dest.send(dict(msg)), QUEUED)
+        with patch('syslogng_kafka.kafkadriver.sleep'):
+            self.assertEquals(dest.flush(), ERROR)
+        self.assertEquals([], dest._batch)
+
+    def test_send_batch_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'batch_lines': 'XXX'}
+        self.assertFalse(dest.init(conf))
+
+    def test_send_serializer(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'serializer': 'json'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        dest.send(dict(msg))
+
+        dest._kafka_producer.produce.assert_called_once_with(
+            conf['topic'], ANY)
+        value = dest._kafka_producer.produce.call_args[0][1]
+        self.assertEquals(msg, json.loads(value.decode('utf-8')))
+
+    def test_send_serializer_unknown(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'serializer': 'nope'}
+        self.assertFalse(dest.init(conf))
+
+    def test_send_kv_parsers(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'serializer': 'json',
+                'kv_parsers': "{'kernel': {'fields': [('DPT', 'dpt', -1, "
+                              "'int')]}}"}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'kernel',
+               'DATE': None, 'MESSAGE': u'IN=eth0 DPT=22'}
+
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        dest.send(dict(msg))
+
+        value = dest._kafka_producer.produce.call_args[0][1]
+        self.assertEquals({'dpt': 22},
+                          json.loads(value.decode('utf-8'))['MESSAGE'])
+
+    def test_send_kv_parsers_bad(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'kv_parsers': "{'kernel': {'fields': 'DPT'}}"}
+        self.assertFalse(dest.init(conf))
+
     def test_produce_fails_kafka_exception(self):
         dest = KafkaDestination()
         conf = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
@@ -511,6 +767,310 @@ class TestKafkaDestination(unittest.TestCase):
         dest._kafka_producer._acked.assert_not_called()
         LOG.error.assert_called_once()
 
+    def test_metrics(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.prom')
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'metrics_port': '0', 'metrics_file': path}
+        self.assertTrue(dest.init(conf))
+        self.addCleanup(dest.deinit)
+        self.assertEquals(15000, dest._conf['statistics.interval.ms'])
+        self.assertEquals(dest._on_stats, dest._conf['stats_cb'])
+        self.assertTrue(dest._metrics_server.is_alive())
+
+        dest.backpressure_counters['queue_full'] += 1
+        dest._on_stats(json.dumps({'msg_cnt': 42, 'brokers': {}}))
+        self.assertEquals(42, dest.metrics.get('queue_messages'))
+        self.assertEquals(1, dest.metrics.get('backpressure_events_total',
+                                              event='queue_full'))
+        with open(path) as f:
+            self.assertIn('syslogng_kafka_queue_messages 42.0', f.read())
+
+        server = dest._metrics_server
+        dest.deinit()
+        self.assertFalse(server.is_alive())
+
+    def test_metrics_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'metrics_port': 'X'}
+        self.assertFalse(dest.init(conf))
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'stats_interval_ms': '1000'}
+        self.assertTrue(dest.init(conf))
+        self.assertEquals(1000, dest._conf['statistics.interval.ms'])
+        self.assertIsNone(dest.metrics)
+
+    def test_send_instrument(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'programs': 'firewall', 'instrument_sample': '2'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+               'DATE': 'Jun 22 12:49:16', 'MESSAGE': u'id=1 src_ip=1.2.3.4'}
+        dest._kafka_producer.produce = MagicMock(name='produce')
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        for _ in range(4):
+            self.assertTrue(dest.send(dict(msg)))
+        self.assertEquals(4, dest._kafka_producer.produce.call_count)
+        self.assertEquals(4, dest._kafka_producer.poll.call_count)
+        self.assertEquals(['message', 'filter', 'parse', 'date', 'serialize',
+                           'produce', 'poll', 'send'],
+                          list(dest._timer.stages))
+        self.assertEquals(2, dest._timer.stages['send'].count)
+
+        LOG.info = MagicMock(name='info')
+        dest._kafka_producer.flush = MagicMock(name='flush')
+        self.assertTrue(dest.close())
+        self.assertIn('Stage timings', LOG.info.call_args_list[-9][0][0])
+
+    def test_send_instrument_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'instrument_sample': 'X'}
+        self.assertFalse(dest.init(conf))
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'instrument_sample': '0'}
+        self.assertTrue(dest.init(conf))
+        self.assertIsNone(dest._timer)
+
+    def test_produce_backpressure_adaptive(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'backpressure': 'adaptive', 'backpressure_max_wait': '100'}
+        self.assertTrue(dest.init(conf))
+        self.assertEquals(dest.backpressure_max_wait, 0.1)
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+
+        calls = []
+
+        def produce(topic, msg, **kwargs):
+            calls.append(msg)
+            if len(calls) < 3:
+                raise BufferError("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        # the queue drains while polling
+        self.assertTrue(dest.send(dict(msg)))
+        self.assertEquals(3, len(calls))
+        self.assertEquals([((0.001,),), ((0.002,),), ((0,),)],
+                          dest._kafka_producer.poll.call_args_list)
+        self.assertEquals({'queue_full': 1, 'polls': 2, 'retried': 1},
+                          dict(dest.backpressure_counters))
+
+    def test_produce_backpressure_adaptive_full(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'backpressure': 'adaptive', 'backpressure_max_wait': '10'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+
+        def produce(topic, msg, **kwargs):
+            raise BufferError("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+        LOG.warning = MagicMock(name='warning')
+
+        # held back: syslog-ng suspends the destination and retries
+        self.assertFalse(dest.send(dict(msg)))
+        timeouts = [c[0][0] for c in dest._kafka_producer.poll.call_args_list]
+        self.assertAlmostEqual(0.01, sum(timeouts))
+        self.assertEquals(1, dest.backpressure_counters['held'])
+        self.assertIn('Holding messages back', LOG.warning.call_args[0][0])
+
+        # dropped as a last resort
+        dest.backpressure_drop = True
+        LOG.error = MagicMock(name='error')
+        self.assertTrue(dest.send(dict(msg)))
+        self.assertEquals(1, dest.backpressure_counters['dropped'])
+        LOG.error.assert_called_once()
+
+    def test_produce_backpressure_batch(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'backpressure': 'adaptive', 'backpressure_max_wait': '1',
+                'batch_lines': '10'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+
+        calls = []
+
+        def produce(topic, msg, **kwargs):
+            if len(calls) >= 2:
+                raise BufferError("Fake exception.")
+            calls.append(msg)
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+        LOG.warning = MagicMock(name='warning')
+
+        for _ in range(3):
+            dest.send(dict(msg))
+        # the last message is kept for the next flush
+        self.assertEquals(SUCCESS, dest.flush())
+        self.assertEquals(2, len(calls))
+        self.assertEquals(1, len(dest._batch))
+
+        # nothing can be produced: syslog-ng retries the batch
+        LOG.error = MagicMock(name='error')
+        self.assertEquals(ERROR, dest.flush())
+        self.assertEquals(0, len(dest._batch))
+
+    def test_produce_backpressure_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'backpressure': 'nope'}
+        self.assertFalse(dest.init(conf))
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'backpressure': 'adaptive', 'backpressure_max_wait': 'X'}
+        self.assertFalse(dest.init(conf))
+
+    def test_produce_spill(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'msg_key': 'src_ip', 'spill_dir': directory,
+                'spill_max_bytes': '4096', 'spill_segment_bytes': '1024'}
+        self.assertTrue(dest.init(conf))
+        # replayed messages are committed once delivered
+        self.assertNotIn('delivery.report.only.error', dest._conf)
+        self.assertTrue(dest.open())
+        self.assertIs(dest.delivery_reporter,
+                      dest._spill_drainer.on_delivery)
+        dest._spill_drainer.stop()
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello', 'src_ip': u'10.0.0.1'}
+
+        def produce(topic, msg, **kwargs):
+            raise BufferError("Fake exception.")
+
+        dest._kafka_producer.produce = produce
+        dest._kafka_producer.poll = MagicMock(name='poll')
+
+        # spilled to disk instead of sleeping
+        self.assertTrue(dest.send(dict(msg)))
+        self.assertEquals(1, dest.backpressure_counters['spilled'])
+        self.assertEquals(1, len(dest._spill_queue))
+        topic, value, key, partition = dest._spill_queue.peek(1)[0]
+        self.assertEquals(u'my_topic', topic)
+        self.assertEquals(b'10.0.0.1', key)
+        self.assertIsNone(partition)
+        self.assertEquals(u'hello', ast.literal_eval(
+            value.decode('utf-8'))['MESSAGE'])
+
+        # spilled if worth retrying only
+        for error, spilled in ((KafkaError._TRANSPORT, 2),
+                               (KafkaError.MSG_SIZE_TOO_LARGE, 2)):
+            def produce(topic, msg, **kwargs):
+                raise KafkaException(KafkaError(
+                    error, retriable=error == KafkaError._TRANSPORT))
+
+            dest._kafka_producer.produce = produce
+            with patch('syslogng_kafka.kafkadriver.sleep'):
+                self.assertTrue(dest.send(dict(msg)))
+            self.assertEquals(spilled, len(dest._spill_queue))
+        self.assertEquals(1, dest.backpressure_counters['dropped'])
+
+        dest.deinit()
+        self.assertIsNone(dest._spill_queue)
+
+    def test_delivery_spill(self):
+        class FakeMessage(object):
+            def topic(self):
+                return u'my_topic'
+
+            def key(self):
+                return b'10.0.0.1'
+
+            def value(self):
+                return b'hello'
+
+            def partition(self):
+                return 0
+
+        class FakeProducer(object):
+            def __init__(self):
+                self.produced = []
+                self._reports = []
+
+            def __len__(self):
+                return 0
+
+            def produce(self, topic, value, **kwargs):
+                self._reports.append(kwargs.pop('on_delivery'))
+                self.produced.append((topic, value, kwargs))
+
+            def poll(self, timeout):
+                reports, self._reports = self._reports, []
+                for on_delivery in reports:
+                    on_delivery(None, None)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'spill_dir': directory}
+        self.assertTrue(dest.init(conf))
+        delivery_callback = dest._conf['on_delivery']
+
+        # the brokers being down, the delivery times out
+        LOG.error = MagicMock(name='error')
+        delivery_callback(KafkaError(KafkaError._MSG_TIMED_OUT),
+                          FakeMessage())
+        delivery_callback(KafkaError(KafkaError.MSG_SIZE_TOO_LARGE),
+                          FakeMessage())
+        delivery_callback(None, FakeMessage())
+        self.assertEquals(2, dest.delivery_reporter._window['failed'])
+        self.assertEquals([(u'my_topic', b'hello', b'10.0.0.1', None)],
+                          dest._spill_queue.peek(10))
+
+        # and replayed
+        producer = FakeProducer()
+        drainer = SpillDrainer(dest._spill_queue, producer,
+                               on_delivery=dest.delivery_reporter)
+        self.assertEquals(1, drainer.drain())
+        self.assertEquals([(u'my_topic', b'hello', {'key': b'10.0.0.1'})],
+                          producer.produced)
+        self.assertEquals(0, len(dest._spill_queue))
+        dest.deinit()
+
+    def test_produce_spill_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'spill_dir': tempfile.gettempdir(),
+                'spill_max_bytes': '10', 'spill_segment_bytes': '1024'}
+        self.assertFalse(dest.init(conf))
+
     def test_produce_fails_unicodencodeerror(self):
         dest = KafkaDestination()
         conf = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
@@ -541,7 +1101,7 @@ class TestKafkaDestination(unittest.TestCase):
         dest._kafka_producer._acked.assert_not_called()
         LOG.error.assert_called_once()
 
-    def test_consumer_acked(self):
+    def test_produce_acked(self):
         class FakeMessage:
             def __init__(self, value):
                 self._value = value
@@ -557,6 +1117,9 @@ class TestKafkaDestination(unittest.TestCase):
                 return self._msg
 
         dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
+        self.assertTrue(dest.init(conf))
+        delivery_callback = dest._conf['on_delivery']
 
         LOG.error = MagicMock(name='error')
         LOG.debug = MagicMock(name='debug')
@@ -575,18 +1138,22 @@ class TestKafkaDestination(unittest.TestCase):
         LOG.error = MagicMock(name='error')
         LOG.debug = MagicMock(name='debug')
 
+        # payloads are not logged w/o verbose
         delivery_callback(None, FakeMessage("XXX"))
         LOG.error.assert_not_called()
-        LOG.debug.assert_called_once()
-
-        LOG.error = MagicMock(name='error')
-        LOG.debug = MagicMock(name='debug')
+        LOG.debug.assert_not_called()
 
-        dest.verbose = True
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'verbose': 'True', 'delivery_samples': '1'}
+        self.assertTrue(dest.init(conf))
+        delivery_callback = dest._conf['on_delivery']
 
         LOG.error = MagicMock(name='error')
         LOG.debug = MagicMock(name='debug')
 
+        # sampled
+        delivery_callback(None, FakeMessage("XXX"))
         delivery_callback(None, FakeMessage("XXX"))
         LOG.error.assert_not_called()
         LOG.debug.assert_called_once()
@@ -598,6 +1165,459 @@ class TestKafkaDestination(unittest.TestCase):
         LOG.error.assert_called_once()
         LOG.debug.assert_not_called()
 
+        LOG.warning = MagicMock(name='warning')
+        dest._kafka_producer = MagicMock(name='producer')
+        self.assertTrue(dest.close())
+        self.assertIn('Delivery report: 2 delivered (6 bytes), 1 failed',
+                      LOG.warning.call_args_list[0][0][0])
+        self.assertEquals(2, dest.delivery_reporter.counters['delivered'])
+
+    def test_produce_delivery_report_interval(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'delivery_report_interval': '0'}
+        self.assertTrue(dest.init(conf))
+        # successes are not reported by the producer w/o verbose
+        self.assertFalse(dest.delivery_reporter.successes)
+        self.assertTrue(dest.open())
+        dest._kafka_producer = MagicMock(name='producer')
+        dest.delivery_reporter._window['failed'] += 1
+        dest.delivery_reporter._window_errors['_MSG_TIMED_OUT'] += 1
+
+        # summaries on the interval, w/o waiting for a delivery report
+        LOG.warning = MagicMock(name='warning')
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+        self.assertTrue(dest.send(msg))
+        LOG.warning.assert_called_with(
+            "Delivery report: 1 failed (0 bytes) _MSG_TIMED_OUT=1")
+
+    def test_produce_delivery_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'delivery_samples': 'X', 'verbose': 'True'}
+        self.assertFalse(dest.init(conf))
+
+    def test_produce_routes(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'msg_key': 'src_ip',
+                'routes': "[('PROGRAM', 'firewall', 'fw_topic'), "
+                          "('HOST', 'edge-*', 'edge_topic')]"}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+        producer = dest._kafka_producer
+        producer.produce = MagicMock(name='produce')
+        producer.poll = MagicMock(name='poll')
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'edge-01', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello', 'src_ip': u'10.0.0.1'}
+        self.assertTrue(dest.send(dict(msg)))
+        producer.produce.assert_called_with('edge_topic', ANY,
+                                            key=u'10.0.0.1')
+        self.assertTrue(dest.send(dict(msg, PROGRAM=u'firewall',
+                                       MESSAGE=u'action=drop')))
+        producer.produce.assert_called_with('fw_topic', ANY,
+                                            key=u'10.0.0.1')
+        self.assertTrue(dest.send(dict(msg, HOST=u'core-01')))
+        producer.produce.assert_called_with('my_topic', ANY,
+                                            key=u'10.0.0.1')
+        # one producer for every topic
+        self.assertIs(producer, dest._kafka_producer)
+
+    def test_produce_routes_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'routes': "[('MESSAGE', 'hello', 'hello_topic')]"}
+        self.assertFalse(dest.init(conf))
+        conf['routes'] = "[('PROGRAM', 'firewall')]"
+        self.assertFalse(dest.init(conf))
+
+    def test_produce_partition_by(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'partition_by': 'HOST', 'partition_vnodes': '16'}
+        self.assertTrue(dest.init(conf))
+        dest._kafka_producer = MagicMock(name='producer')
+        dest._partitioner.update({'my_topic': 4})
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+        self.assertTrue(dest.send(dict(msg)))
+        dest._kafka_producer.produce.assert_called_once_with(
+            'my_topic', ANY, partition=HashRing(4, 16)(u'10.11.12.102'))
+
+    def test_produce_partition_by_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'partition_by': 'HOST', 'partition': '1'}
+        self.assertFalse(dest.init(conf))
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'partition_by': 'HOST', 'partition_vnodes': 'many'}
+        self.assertFalse(dest.init(conf))
+
+    def test_produce_autotune(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'autotune': 'latency:balanced', 'autotune_intervals': '1'}
+        self.assertTrue(dest.init(conf))
+        self.assertEqual(dest._on_stats, dest._conf['stats_cb'])
+        with patch('syslogng_kafka.kafkadriver.Producer') as producer_class:
+            producer_class.side_effect = lambda **_: MagicMock(
+                name='producer')
+            self.assertTrue(dest.open())
+            self.assertEqual('balanced', dest._tuner.profile)
+            self.assertEqual(PROFILES['balanced']['batch.num.messages'],
+                             producer_class.call_args[1]['batch.num.messages'])
+            previous = dest._kafka_producer
+            previous.flush.return_value = 0
+
+            stats = {'name': 'rdkafka#producer-1', 'ts': 1000000,
+                     'txmsgs': 0, 'msg_cnt': 0, 'msg_max': 100000}
+            dest._on_stats(json.dumps(stats))
+            stats['ts'] += 15000000
+            dest._on_stats(json.dumps(stats))
+            self.assertEqual('latency', dest._tuner.profile)
+            # replaced by the next send
+            self.assertIs(previous, dest._kafka_producer)
+
+            msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                   'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+                   'DATE': None, 'MESSAGE': u'hello'}
+            producer_class.reset_mock()
+            previous.__len__.return_value = 2
+            self.assertTrue(dest.send(msg))
+            previous.produce.assert_called_once()
+            self.assertIsNot(previous, dest._kafka_producer)
+            self.assertEqual(PROFILES['latency']['batch.num.messages'],
+                             producer_class.call_args[1]['batch.num.messages'])
+            # not waited for: polled over the next sends
+            previous.flush.assert_not_called()
+            self.assertEqual([(previous, 'rdkafka#producer-1')],
+                             [(producer, name)
+                              for producer, _, name in dest._retired])
+
+            # `ts` goes on over the producers: the statistics of the
+            # previous one are ignored while it drains
+            observed = []
+            observe = dest._tuner.observe
+            dest._tuner.observe = lambda stats: observed.append(
+                observe(stats)) or observed[-1]
+            for txmsgs in (1500, 3000, 4500):
+                stats['ts'] += 15000000
+                dest._on_stats(json.dumps(dict(
+                    stats, txmsgs=txmsgs * 100)))
+                dest._on_stats(json.dumps(dict(
+                    stats, name='rdkafka#producer-2', txmsgs=txmsgs)))
+            self.assertEqual([None, 100, 100],
+                             [o and o['rate'] for o in observed])
+            self.assertEqual('latency', dest._tuner.profile)
+            previous.poll.reset_mock()
+            self.assertTrue(dest.send(msg))
+            previous.poll.assert_called_once_with(0)
+            self.assertEqual(1, len(dest._retired))
+            previous.__len__.return_value = 0
+            self.assertTrue(dest.send(msg))
+            self.assertEqual([], dest._retired)
+
+            # forgotten past its deadline, flushed on close
+            dest._retired = [(previous, 0, None)]
+            previous.__len__.return_value = 2
+            self.assertTrue(dest.send(msg))
+            self.assertEqual([], dest._retired)
+            dest._retired = [(previous, time.time() + 10, None)]
+            self.assertTrue(dest.close())
+            previous.flush.assert_called_once()
+            self.assertLessEqual(previous.flush.call_args[0][0], 10)
+            self.assertEqual([], dest._retired)
+
+    def test_produce_autotune_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'autotune': 'throughput:latency'}
+        self.assertFalse(dest.init(conf))
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'autotune': 'balanced', 'autotune_intervals': 'few'}
+        self.assertFalse(dest.init(conf))
+
+    def test_init_conf_isolated(self):
+        dest = KafkaDestination()
+        self.assertTrue(dest.init({'hosts': '192.168.0.1',
+                                   'topic': 'my_topic',
+                                   'display_stats': 'True'}))
+        other = KafkaDestination()
+        self.assertTrue(other.init({'hosts': '192.168.0.2',
+                                    'topic': 'my_topic'}))
+        self.assertEquals('192.168.0.1', dest._conf['bootstrap.servers'])
+        self.assertEquals('192.168.0.2', other._conf['bootstrap.servers'])
+        self.assertNotIn('stats_cb', other._conf)
+
+    def test_produce_shared_producer(self):
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'shared_producer': 'True'}
+        dest, other = KafkaDestination(), KafkaDestination()
+        self.assertTrue(dest.init(dict(conf)))
+        self.assertTrue(other.init(dict(conf, topic='other_topic')))
+        self.assertNotIn('on_delivery', dest._conf)
+        with patch('syslogng_kafka.kafkadriver.Producer') as producer_class:
+            self.assertTrue(dest.open())
+            self.assertTrue(other.open())
+        producer_class.assert_called_once()
+        producer = dest._kafka_producer
+        self.assertIs(producer, other._kafka_producer)
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+        self.assertTrue(other.send(msg))
+        producer.produce.assert_called_once_with(
+            'other_topic', ANY, on_delivery=other.delivery_reporter)
+
+        # flushed by its last user only
+        self.assertTrue(dest.close())
+        self.assertFalse(dest.is_opened())
+        producer.flush.assert_not_called()
+        self.assertTrue(dest.deinit())
+        self.assertTrue(other.close())
+        producer.flush.assert_called_once_with(30)
+        self.assertTrue(other.deinit())
+
+    def test_produce_shared_producer_bad_config(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'shared_producer': 'True', 'autotune': 'balanced'}
+        self.assertFalse(dest.init(conf))
+
+    def test_send_workers(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'workers': '2', 'worker_ring_bytes': '65536'}
+        self.assertTrue(dest.init(conf))
+        self.assertEqual('192.168.0.1', dest.hosts)
+        self.assertEqual({'hosts': '192.168.0.1', 'topic': 'my_topic'},
+                         dest._worker_args)
+        with patch('syslogng_kafka.kafkadriver.WorkerPool') as pool_class:
+            self.assertTrue(dest.open())
+            pool_class.assert_called_once_with(
+                KafkaDestination, dest._worker_args, 2, 65536)
+            workers = pool_class.return_value
+            workers.start.assert_called_once_with()
+            self.assertTrue(dest.is_opened())
+            self.assertIsNone(dest._kafka_producer)
+
+            msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                   'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+                   'DATE': None, 'MESSAGE': u'hello'}
+            workers.put.return_value = True
+            self.assertTrue(dest.send(msg))
+            workers.put.assert_called_once_with(msg)
+            # rings full: held back
+            workers.put.return_value = False
+            self.assertFalse(dest.send(msg))
+
+            workers.counters = {'ring_full': 1}
+            self.assertTrue(dest.close())
+            workers.stop.assert_called_once_with()
+            self.assertFalse(dest.is_opened())
+            self.assertTrue(dest.deinit())
+
+    def test_send_workers_filter(self):
+        class LogMessage(object):
+            """ Read-only syslog-ng message counting the fetched fields. """
+
+            def __init__(self, program):
+                self.fetched = []
+                self.fields = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                               'HOST': u'10.11.12.102', 'PROGRAM': program,
+                               'DATE': None, 'MESSAGE': u'hello'}
+
+            def __getattr__(self, name):
+                self.fetched.append(name)
+                return self.fields[name]
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'workers': '1', 'programs': 'sshd'}
+        self.assertTrue(dest.init(conf))
+        with patch('syslogng_kafka.kafkadriver.WorkerPool') as pool_class:
+            self.assertTrue(dest.open())
+            workers = pool_class.return_value
+            # filtered out before being handed to a worker
+            msg = LogMessage(u'XXX')
+            self.assertTrue(dest.send(msg))
+            self.assertEqual(['PROGRAM'], msg.fetched)
+            workers.put.assert_not_called()
+            msg = LogMessage(u'sshd')
+            self.assertTrue(dest.send(msg))
+            workers.put.assert_called_once_with(msg.fields)
+            self.assertTrue(dest.close())
+
+    def test_send_message_decoded(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+        dest._kafka_producer.produce = MagicMock(name='produce')
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'XXX',
+               'DATE': None, 'MESSAGE': u'hello'}
+        # decoded by a worker: not `value-pairs`
+        with patch.object(LOG, 'warn') as warn:
+            self.assertTrue(dest.send_message(dict(msg)))
+        warn.assert_not_called()
+        dest._kafka_producer.produce.assert_called_once_with(
+            'my_topic', repr(msg).encode('utf-8'))
+
+    def test_send_workers_bad_config(self):
+        base = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
+        for conf in ({'workers': '0'}, {'workers': 'two'},
+                     {'workers': '1', 'worker_ring_bytes': 'big'},
+                     {'workers': '2', 'spill_dir': '/tmp'},
+                     {'workers': '2', 'metrics_port': '9000'},
+                     {'workers': '1', 'batch_lines': '100'},
+                     {'workers': '1', 'autotune': 'fast'}):
+            dest = KafkaDestination()
+            self.assertFalse(dest.init(dict(base, **conf)), conf)
+
+    def test_send_dedup(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'serializer': 'json', 'dedup_fields': 'src_ip, dest_ip',
+                'dedup_window': '60000'}
+        self.assertTrue(dest.init(conf))
+        self.assertEqual(['src_ip', 'dest_ip'], dest.dedup_fields)
+        self.assertEqual(frozenset(['firewall']), dest._dedup.programs)
+        self.assertEqual(60, dest._dedup.window)
+        self.assertTrue(dest.open())
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        f = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DROP_131073IN=vNic_0 ' \
+            'OUT= MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 ' \
+            'SRC=10.11.254.108 DST=10.11.12.181 LEN=84 TOS=0x00 PREC=0x00 ' \
+            'TTL=64 ID=54643 PROTO=ICMP TYPE=8 CODE=0 ID=65299 SEQ=10047 ' \
+            'MARK=0x1'
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+               'DATE': None, 'MESSAGE': f}
+        for _ in range(3):
+            self.assertTrue(dest.send(dict(msg)))
+        dest._kafka_producer.produce.assert_not_called()
+        self.assertTrue(dest.send(dict(msg, PROGRAM=u'sshd')))
+        dest._kafka_producer.produce.assert_called_once()
+
+        # produced once on close w/ its count
+        dest._kafka_producer.produce.reset_mock()
+        dest.close()
+        dest._kafka_producer.produce.assert_called_once()
+        produced = json.loads(
+            dest._kafka_producer.produce.call_args[0][1].decode('utf-8'))
+        self.assertEqual(3, produced['count'])
+        self.assertEqual(u'10.11.254.108', produced['MESSAGE']['src_ip'])
+        self.assertLessEqual(produced['first_seen'], produced['last_seen'])
+        self.assertEqual(2, dest._dedup.counters['suppressed'])
+
+    def test_send_dedup_flush(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'dedup_fields': 'src_ip', 'dedup_window': '1',
+                'batch_lines': '100'}
+        self.assertTrue(dest.init(conf))
+        self.assertTrue(dest.open())
+        dest._kafka_producer = MagicMock(name='producer')
+
+        f = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DROP_131073IN=vNic_0 ' \
+            'OUT= SRC=10.11.254.108 DST=10.11.12.181 PROTO=ICMP'
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice',
+               'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+               'DATE': None, 'MESSAGE': f}
+        for _ in range(2):
+            self.assertTrue(dest.send(dict(msg)))
+        self.assertEqual(SUCCESS, dest.flush())
+        dest._kafka_producer.produce.assert_not_called()
+
+        # the window ended w/o another message
+        time.sleep(0.01)
+        self.assertEqual(SUCCESS, dest.flush())
+        dest._kafka_producer.produce.assert_called_once()
+        self.assertEqual(0, len(dest._dedup))
+
+    def test_send_dedup_bad_config(self):
+        base = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
+        for conf in ({'dedup_fields': ''},
+                     {'dedup_fields': 'src_ip', 'dedup_window': '0'},
+                     {'dedup_fields': 'src_ip', 'dedup_window': 'long'},
+                     {'dedup_fields': 'src_ip', 'dedup_max_keys': '-1'},
+                     {'dedup_fields': 'src_ip', 'serializer': 'avro'}):
+            dest = KafkaDestination()
+            self.assertFalse(dest.init(dict(base, **conf)), conf)
+
+    def test_send_ratelimit(self):
+        class LogMessage(object):
+            """ Read-only syslog-ng message counting the fetched fields. """
+
+            def __init__(self, host):
+                self.fetched = []
+                self.fields = {'FACILITY': u'user', 'PRIORITY': u'notice',
+                               'HOST': host, 'PROGRAM': u'firewall',
+                               'DATE': None, 'MESSAGE': u'hello'}
+
+            def __getattr__(self, name):
+                self.fetched.append(name)
+                return self.fields[name]
+
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic',
+                'ratelimit_rate': '0.001', 'ratelimit_burst': '2',
+                'ratelimit_keys': 'HOST'}
+        self.assertTrue(dest.init(conf))
+        self.assertEqual(('HOST',), dest._rate_limiter.keys)
+        self.assertTrue(dest.open())
+        dest._kafka_producer.produce = MagicMock(name='produce')
+
+        for _ in range(2):
+            self.assertTrue(dest.send(LogMessage(u'noisy')))
+        # nothing but HOST fetched from the messages over the limit
+        msg = LogMessage(u'noisy')
+        self.assertTrue(dest.send(msg))
+        self.assertEqual(['HOST'], msg.fetched)
+        self.assertTrue(dest.send(LogMessage(u'quiet')))
+        self.assertEqual(3, dest._kafka_producer.produce.call_count)
+        self.assertEqual({'dropped': 1, 'sampled': 0},
+                         dest._rate_limiter.get(u'noisy'))
+
+    def test_send_ratelimit_workers(self):
+        dest = KafkaDestination()
+        conf = {'hosts': '192.168.0.1', 'topic': 'my_topic', 'workers': '2',
+                'ratelimit_rate': '0.001', 'ratelimit_keys': 'PROGRAM'}
+        self.assertTrue(dest.init(conf))
+        # applied before the messages are handed, not by every worker
+        self.assertEqual({'hosts': '192.168.0.1', 'topic': 'my_topic'},
+                         dest._worker_args)
+        with patch('syslogng_kafka.kafkadriver.WorkerPool') as pool_class:
+            self.assertTrue(dest.open())
+            msg = {'FACILITY': u'user', 'PRIORITY': u'notice', 'HOST': u'h',
+                   'PROGRAM': u'firewall', 'DATE': None, 'MESSAGE': u'hello'}
+            self.assertTrue(dest.send(msg))
+            self.assertTrue(dest.send(msg))
+            pool_class.return_value.put.assert_called_once_with(msg)
+            self.assertTrue(dest.close())
+
+    def test_send_ratelimit_bad_config(self):
+        base = {'hosts': '192.168.0.1', 'topic': 'my_topic'}
+        for conf in ({'ratelimit_rate': 'fast'},
+                     {'ratelimit_rate': '0'},
+                     {'ratelimit_rate': '10', 'ratelimit_burst': '0'},
+                     {'ratelimit_rate': '10', 'ratelimit_keys': 'FACILITY'},
+                     {'ratelimit_rate': '10', 'ratelimit_max_keys': '0'},
+                     {'ratelimit_rate': '10', 'ratelimit_sample': 'some'}):
+            dest = KafkaDestination()
+            self.assertFalse(dest.init(dict(base, **conf)), conf)
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.log` module.
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from syslogng_kafka import log
+from syslogng_kafka.log import AsyncHandler
+from syslogng_kafka.log import configure_logging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, gate=None):
+        super(ListHandler, self).__init__()
+        self.messages = []
+        self.gate = gate
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        self.messages.append((record.levelname, record.getMessage()))
+
+
+def record(msg, *args, **kwargs):
+    return logging.makeLogRecord(dict(msg=msg, args=args or None,
+                                      levelno=kwargs.get('level',
+                                                         logging.INFO),
+                                      levelname=logging.getLevelName(
+                                          kwargs.get('level',
+                                                     logging.INFO))))
+
+
+class TestAsyncHandler(unittest.TestCase):
+    def test_write(self):
+        target = ListHandler()
+        handler = AsyncHandler(target)
+        handler.handle(record("hello %s", "world"))
+        handler.handle(record("bye", level=logging.ERROR))
+        handler.flush()
+        self.assertEqual([('INFO', 'hello world'), ('ERROR', 'bye')],
+                         target.messages)
+        handler.close()
+        self.assertFalse(handler._thread.is_alive())
+
+    def test_repeats(self):
+        target = ListHandler()
+        handler = AsyncHandler(target)
+        for _ in range(4):
+            handler.handle(record("same"))
+        handler.handle(record("other"))
+        handler.handle(record("other"))
+        handler.close()
+        self.assertEqual([('INFO', 'same'),
+                          ('INFO', 'Last message repeated 3 times'),
+                          ('INFO', 'other'),
+                          ('INFO', 'Last message repeated 1 times')],
+                         target.messages)
+        self.assertEqual(4, handler.suppressed)
+
+    def test_queue_full(self):
+        gate = threading.Event()
+        target = ListHandler(gate)
+        handler = AsyncHandler(target, queue_size=2)
+        for i in range(10):
+            # never blocks
+            handler.handle(record("message %d" % i))
+        dropped = handler.dropped
+        self.assertIn(dropped, (7, 8))
+        gate.set()
+        handler.flush()
+        handler.handle(record("last"))
+        handler.close()
+        self.assertIn(('WARNING', '%d log records dropped: log queue full'
+                       % dropped), target.messages)
+        self.assertEqual(10 - dropped + 2, len(target.messages))
+        self.assertEqual(('INFO', 'last'), target.messages[-1])
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        configure_logging()
+        shutil.rmtree(self.directory)
+
+    def test_file(self):
+        path = os.path.join(self.directory, 'kafka.log')
+        configure_logging(level='info', target=path)
+        handler = log.ch
+        self.assertIsInstance(handler, AsyncHandler)
+        self.assertEqual([handler], log.LOG.handlers)
+        self.assertEqual(logging.INFO, log.LOG.level)
+
+        # other tests replace the level methods of LOG w/ mocks
+        log.LOG.log(logging.DEBUG, "not logged")
+        log.LOG.log(logging.INFO, "logged")
+        # same configuration: same handler
+        configure_logging(level='INFO', target=path)
+        self.assertIs(handler, log.ch)
+        handler.flush()
+        with open(path) as f:
+            lines = f.readlines()
+        self.assertEqual(1, len(lines))
+        self.assertTrue(lines[0].rstrip().endswith('logged'))
+
+        configure_logging(target=path, async_=False)
+        self.assertIsInstance(log.ch, logging.FileHandler)
+        self.assertFalse(handler._thread.is_alive())
+
+    def test_bad_config(self):
+        self.assertRaises(ValueError, configure_logging, level='LOUD')
+        self.assertRaises(IOError, configure_logging,
+                          target=os.path.join(self.directory, 'nope', 'log'))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.metrics` module.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:  # pragma: no cover
+    from urllib2 import urlopen, HTTPError
+
+from syslogng_kafka.metrics import CONTENT_TYPE
+from syslogng_kafka.metrics import MetricsRegistry
+from syslogng_kafka.metrics import MetricsServer
+
+STATS = {
+    'name': 'rdkafka#producer-1', 'type': 'producer', 'time': 1503504000,
+    'msg_cnt': 12, 'msg_size': 2400, 'msg_max': 100000,
+    'msg_size_max': 1048576000, 'tx': 30, 'txmsgs': 1000,
+    'txmsg_bytes': 200000,
+    'brokers': {
+        'kafka1:9092/1': {
+            'name': 'kafka1:9092/1', 'txerrs': 2, 'txretries': 3,
+            'outbuf_cnt': 1, 'waitresp_cnt': 4,
+            'rtt': {'min': 100, 'max': 9000, 'avg': 1500, 'p50': 1000,
+                    'p95': 5000, 'p99': 8000},
+            'int_latency': {'avg': 250, 'p50': 200, 'p95': 400,
+                            'p99': 600},
+            'throttle': {'avg': 0}},
+        'kafka2:9092/2': {
+            'name': 'kafka2:9092/2', 'txerrs': 1, 'txretries': 0,
+            'outbuf_cnt': 0, 'waitresp_cnt': 0,
+            'rtt': {}, 'int_latency': {}}},
+    'topics': {
+        'syslog': {
+            'topic': 'syslog',
+            'partitions': {
+                '0': {'partition': 0, 'msgq_cnt': 5, 'msgq_bytes': 1000,
+                      'xmit_msgq_cnt': 2, 'msgs_inflight': 3,
+                      'txmsgs': 600},
+                '-1': {'partition': -1, 'msgq_cnt': 7, 'msgq_bytes': 1400,
+                       'xmit_msgq_cnt': 0, 'msgs_inflight': 0,
+                       'txmsgs': 0}}}},
+}
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_update(self):
+        registry = MetricsRegistry()
+        self.assertIsNone(registry.get('queue_messages'))
+
+        registry.update(STATS, {'backpressure': {'queue_full': 4}})
+        self.assertEqual(12, registry.get('queue_messages'))
+        self.assertEqual(2400, registry.get('queue_bytes'))
+        self.assertEqual(1000, registry.get('tx_messages_total'))
+        self.assertEqual(3, registry.get('tx_errors_total'))
+        self.assertEqual(3, registry.get('tx_retries_total'))
+        self.assertEqual(2, registry.get('broker_tx_errors_total',
+                                         broker='kafka1:9092/1'))
+        self.assertEqual(0.008, registry.get('broker_rtt_seconds',
+                                             broker='kafka1:9092/1',
+                                             quantile='0.99'))
+        self.assertEqual(0.00025, registry.get(
+            'broker_int_latency_seconds_avg', broker='kafka1:9092/1'))
+        self.assertIsNone(registry.get('broker_rtt_seconds',
+                                       broker='kafka2:9092/2',
+                                       quantile='0.99'))
+        self.assertEqual(10, registry.get('partition_lag_messages',
+                                          topic='syslog', partition='0'))
+        # internal unassigned partition
+        self.assertIsNone(registry.get('partition_lag_messages',
+                                       topic='syslog', partition='-1'))
+        self.assertEqual(4, registry.get('backpressure_events_total',
+                                         event='queue_full'))
+
+        # metrics are replaced as a whole
+        registry.update({'msg_cnt': 0})
+        self.assertEqual(0, registry.get('queue_messages'))
+        self.assertIsNone(registry.get('queue_bytes'))
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        registry.update(STATS)
+        text = registry.render()
+        self.assertIn('# TYPE syslogng_kafka_queue_messages gauge\n'
+                      'syslogng_kafka_queue_messages 12.0\n', text)
+        self.assertIn('# TYPE syslogng_kafka_tx_messages_total counter\n',
+                      text)
+        self.assertIn('syslogng_kafka_broker_rtt_seconds{'
+                      'broker="kafka1:9092/1",quantile="0.5"} 0.001\n', text)
+        self.assertIn('syslogng_kafka_partition_lag_messages{'
+                      'topic="syslog",partition="0"} 10.0\n', text)
+
+        registry.update({'topics': {'a"b': {'partitions': {
+            '1': {'msgq_cnt': 1}}}}})
+        self.assertIn('{topic="a\\"b",partition="1"} 1.0\n',
+                      registry.render())
+
+    def test_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.prom')
+        registry = MetricsRegistry(path)
+        registry.update(STATS)
+        with open(path) as f:
+            self.assertEqual(registry.render(), f.read())
+        self.assertEqual(['metrics.prom'], os.listdir(directory))
+
+
+class TestMetricsServer(unittest.TestCase):
+    def test_serve(self):
+        registry = MetricsRegistry()
+        registry.update(STATS)
+        server = MetricsServer(registry, 0)
+        server.start()
+        try:
+            url = 'http://127.0.0.1:%d' % server.port
+            response = urlopen(url + '/metrics', timeout=5)
+            self.assertEqual(CONTENT_TYPE,
+                             response.headers['Content-Type'])
+            self.assertEqual(registry.render().encode('utf-8'),
+                             response.read())
+            with self.assertRaises(HTTPError):
+                urlopen(url + '/nope', timeout=5)
+        finally:
+            server.stop()
+        self.assertFalse(server.is_alive())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.parsers` module.
+"""
+
+import sys
+import unittest
+
+from mock import MagicMock
+from mock import patch
+
+from syslogng_kafka import parsers
+from syslogng_kafka.parsers import build_parsers
+from syslogng_kafka.parsers import kv_parser
+from syslogng_kafka.parsers import register_parser
+from syslogng_kafka.util import parse_firewall_event
+
+
+class TestParsers(unittest.TestCase):
+    def test_kv_parser(self):
+        parser = kv_parser({
+            'fields': [('SRC', 'src_ip', ''), ('DPT', 'dpt', -1, 'int'),
+                       ('MARK', 'mark', -1, 'hex'), ('RTT', 'rtt', 0.0,
+                                                     'float')],
+            'flags': [('DROP', 'action', 'drop')]})
+
+        self.assertEqual(
+            {'src_ip': '10.0.0.1', 'dpt': 443, 'mark': 16, 'rtt': 0.5,
+             'action': 'drop'},
+            parser('DROP SRC=10.0.0.1 DPT=443 MARK=0x10 RTT=0.5'))
+        # missing and bad values keep their default
+        self.assertEqual(
+            {'src_ip': '', 'dpt': -1, 'mark': -1, 'rtt': 0.0},
+            parser('DPT=https MARK='))
+
+    def test_kv_parser_invalid(self):
+        for config in ({}, {'fields': 'SRC'}, {'fields': [('SRC', 'src')]},
+                       {'fields': [('SRC', 'src', '', 'nope')]},
+                       {'fields': [], 'flags': [('DROP',)]}):
+            self.assertRaises(ValueError, kv_parser, config)
+
+    def test_build_parsers(self):
+        found = build_parsers()
+        self.assertIs(parse_firewall_event, found['firewall'])
+        self.assertIn('nat', found)
+
+        found = build_parsers({'firewall': {'fields': [('SRC', 'src', '')]}})
+        self.assertEqual({'src': 'x'}, found['firewall']('SRC=x'))
+
+    def test_register_parser(self):
+        try:
+            register_parser('kernel', len)
+            self.assertIs(len, build_parsers()['kernel'])
+        finally:
+            del parsers.PARSERS['kernel']
+
+    def test_entry_points(self):
+        good = MagicMock()
+        good.name = 'kernel'
+        good.load.return_value = len
+        bad = MagicMock()
+        bad.name = 'broken'
+        bad.load.side_effect = ImportError("nope")
+
+        with patch.object(parsers, '_iter_entry_points',
+                          return_value=[good, bad]):
+            found = build_parsers()
+        self.assertIs(len, found['kernel'])
+        self.assertNotIn('broken', found)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
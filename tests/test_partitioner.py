@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.partitioner` module.
+"""
+
+import sys
+import unittest
+
+from confluent_kafka import KafkaException
+
+from syslogng_kafka.partitioner import HashRing
+from syslogng_kafka.partitioner import PartitionRefresher
+from syslogng_kafka.partitioner import Partitioner
+from syslogng_kafka.util import parse_firewall_event
+
+
+class FakeTopic(object):
+    def __init__(self, partitions, error=None):
+        self.partitions = dict((i, None) for i in range(partitions))
+        self.error = error
+
+
+class FakeMetadata(object):
+    def __init__(self, topics):
+        self.topics = topics
+
+
+class FakeProducer(object):
+    def __init__(self, **partitions):
+        self.partitions = partitions
+        self.requests = []
+
+    def list_topics(self, topic=None, timeout=-1):
+        self.requests.append(topic)
+        if topic == 'down':
+            raise KafkaException("Fake exception.")
+        if topic not in self.partitions:
+            return FakeMetadata({topic: FakeTopic(0, 'UNKNOWN_TOPIC')})
+        return FakeMetadata({topic: FakeTopic(self.partitions[topic])})
+
+
+def message(host):
+    return {'HOST': host, 'PROGRAM': u'XXX', 'MESSAGE': u'hello'}
+
+
+class TestHashRing(unittest.TestCase):
+    def test_balance(self):
+        ring = HashRing(8)
+        counts = [0] * 8
+        for i in range(8000):
+            counts[ring(u'10.0.%d.%d' % (i // 256, i % 256))] += 1
+        self.assertTrue(min(counts) > 500, counts)
+        self.assertTrue(max(counts) < 1500, counts)
+        # bytes, text and others
+        self.assertEqual(ring(b'host'), ring(u'host'))
+        self.assertEqual(ring(12), ring('12'))
+
+    def test_consistency(self):
+        before, after = HashRing(8), HashRing(9)
+        values = [u'host-%d' % i for i in range(9000)]
+        moved = [v for v in values if before(v) != after(v)]
+        # only the values taken over by the new partition move
+        self.assertEqual(set([8]), set(after(v) for v in moved))
+        self.assertTrue(len(moved) < 2000, len(moved))
+
+
+class TestPartitioner(unittest.TestCase):
+    def test_partition(self):
+        partitioner = Partitioner('HOST', 'my_topic', vnodes=16)
+        self.assertIsNone(partitioner(message(u'host-1')))
+        self.assertTrue(partitioner.wanted.is_set())
+
+        self.assertEqual(['my_topic'], partitioner.update({'my_topic': 4}))
+        self.assertEqual([], partitioner.update({'my_topic': 4}))
+        partition = partitioner(message(u'host-1'))
+        self.assertEqual(HashRing(4, 16)(u'host-1'), partition)
+        self.assertEqual(partition,
+                         partitioner._partitions[('my_topic', u'host-1')])
+        # w/o the field
+        self.assertIsNone(partitioner({'PROGRAM': u'XXX'}))
+
+        # a routed topic is looked up by the refresher
+        partitioner.wanted.clear()
+        self.assertIsNone(partitioner(message(u'host-1'), 'other'))
+        self.assertEqual(set(['my_topic', 'other']), partitioner.topics)
+        self.assertTrue(partitioner.wanted.is_set())
+
+        # the cache is emptied when a partition count changes
+        partitioner.update({'my_topic': 5})
+        self.assertEqual({}, partitioner._partitions)
+        self.assertEqual(HashRing(5, 16)(u'host-1'),
+                         partitioner(message(u'host-1')))
+
+    def test_parsed_field(self):
+        partitioner = Partitioner('src_ip', 'my_topic', vnodes=16)
+        partitioner.update({'my_topic': 8})
+        expected = HashRing(8, 16)(u'10.11.254.108')
+        event = parse_firewall_event(
+            '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DROP_131073IN=vNic_0 '
+            'OUT= MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 '
+            'SRC=10.11.254.108 DST=10.11.12.181 LEN=84 TOS=0x00 PREC=0x00 '
+            'TTL=64 ID=54643 PROTO=ICMP TYPE=8 CODE=0 ID=65299 SEQ=10047 '
+            'MARK=0x1')
+        for parsed in (event, event.to_dict()):
+            msg = dict(message(u'host-1'), MESSAGE=parsed)
+            self.assertEqual(expected, partitioner(msg))
+        # not parsed
+        self.assertIsNone(partitioner(message(u'host-1')))
+
+
+class TestPartitionRefresher(unittest.TestCase):
+    def test_refresh(self):
+        partitioner = Partitioner('HOST', 'my_topic')
+        partitioner.topics.update(['missing', 'down'])
+        producer = FakeProducer(my_topic=3)
+        refresher = PartitionRefresher(partitioner, producer)
+        self.assertEqual({'my_topic': 3}, refresher.refresh())
+        self.assertEqual(3, partitioner._rings['my_topic'].partitions)
+        self.assertEqual(set(['my_topic', 'missing', 'down']),
+                         set(producer.requests))
+
+    def test_run(self):
+        partitioner = Partitioner('HOST', 'my_topic')
+        producer = FakeProducer(my_topic=3, other=2)
+        refresher = PartitionRefresher(partitioner, producer, interval=60)
+        refresher.start()
+        self.addCleanup(refresher.stop)
+        # the first refresh runs at once
+        for _ in range(100):
+            if 'my_topic' in partitioner._rings:
+                break
+            refresher._stopped.wait(0.01)
+        self.assertIsNotNone(partitioner(message(u'host-1')))
+
+        refresher.stop(5)
+        self.assertFalse(refresher.is_alive())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
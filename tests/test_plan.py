@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.plan` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka.dedup import Deduplicator
+from syslogng_kafka.partitioner import HashRing
+from syslogng_kafka.partitioner import Partitioner
+from syslogng_kafka.plan import compile_send_plan
+from syslogng_kafka.routing import Router
+
+
+def message(program=u'XXX', message=u'hello'):
+    return {'FACILITY': u'user', 'PRIORITY': u'notice',
+            'HOST': u'10.11.12.102', 'PROGRAM': program,
+            'DATE': None, 'MESSAGE': message, 'src_ip': u'10.11.12.53'}
+
+
+class TestSendPlan(unittest.TestCase):
+    def test_minimum(self):
+        plan = compile_send_plan(repr)
+        self.assertEqual(['date'], [name for name, _ in plan.steps])
+        msg = message()
+        self.assertEqual((repr(msg), {}), plan(dict(msg)))
+
+    def test_filter(self):
+        plan = compile_send_plan(repr, programs=['firewall', 'nat'])
+        self.assertIsNone(plan(message()))
+        self.assertIsNotNone(plan(message(u'nat')))
+        self.assertFalse(plan.program_filter(u'XXX'))
+        self.assertTrue(plan.program_filter(u'nat'))
+        self.assertIsNone(compile_send_plan(repr).program_filter)
+
+    def test_parse(self):
+        plan = compile_send_plan(lambda msg: msg,
+                                 parsers={'firewall': len})
+        self.assertEqual(5, plan(message(u'firewall'))[0]['MESSAGE'])
+        self.assertEqual(u'hello', plan(message(u'nat'))[0]['MESSAGE'])
+
+    def test_dedup(self):
+        plan = compile_send_plan(repr, parsers={'firewall': lambda m: {
+            'src_ip': m}}, msg_key='src_ip',
+            deduplicator=Deduplicator(('src_ip',)))
+        self.assertEqual(['parse', 'date', 'dedup'],
+                         [name for name, _ in plan.steps])
+        # held
+        self.assertIsNone(plan(message(u'firewall')))
+        self.assertIsNotNone(plan(message(u'nat')))
+
+        msg = dict(message(u'firewall'), count=2)
+        self.assertEqual((repr(msg), {'key': u'10.11.12.53'}),
+                         plan.finish(msg))
+
+    def test_kwargs(self):
+        plan = compile_send_plan(repr, msg_key='src_ip', partition=0)
+        self.assertEqual({'key': u'10.11.12.53', 'partition': 0},
+                         plan(message())[1])
+
+        plan = compile_send_plan(repr, msg_key='nope')
+        self.assertEqual({}, plan(message())[1])
+
+    def test_router(self):
+        plan = compile_send_plan(repr, msg_key='src_ip', router=Router(
+            [('PROGRAM', 'nat', 'nat_topic')], 'my_topic'))
+        self.assertEqual({'key': u'10.11.12.53', 'topic': 'my_topic'},
+                         plan(message())[1])
+        self.assertEqual({'key': u'10.11.12.53', 'topic': 'nat_topic'},
+                         plan(message(u'nat'))[1])
+        self.assertEqual({}, plan.kwargs)
+
+    def test_partitioner(self):
+        partitioner = Partitioner('HOST', 'my_topic')
+        partitioner.update({'my_topic': 4, 'nat_topic': 2})
+        plan = compile_send_plan(repr, partitioner=partitioner)
+        self.assertEqual({'partition': HashRing(4)(u'10.11.12.102')},
+                         plan(message())[1])
+        plan = compile_send_plan(repr, partitioner=partitioner, router=Router(
+            [('PROGRAM', 'nat', 'nat_topic')], 'my_topic'))
+        self.assertEqual({'partition': HashRing(2)(u'10.11.12.102'),
+                          'topic': 'nat_topic'}, plan(message(u'nat'))[1])
+        self.assertEqual({}, plan.kwargs)
+
+    def test_timed(self):
+        plan = compile_send_plan(repr, programs=['firewall'],
+                                 parsers={'firewall': len}, msg_key='src_ip')
+        timings = []
+
+        def record(stage, ns):
+            timings.append(stage)
+            self.assertTrue(ns >= 0)
+
+        msg = message(u'firewall')
+        self.assertEqual(plan(dict(msg)), plan.timed(dict(msg), record))
+        self.assertEqual(['filter', 'parse', 'date', 'serialize'], timings)
+
+        del timings[:]
+        self.assertIsNone(plan.timed(message(), record))
+        self.assertEqual(['filter'], timings)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
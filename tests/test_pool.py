@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.pool` module.
+"""
+
+import sys
+import unittest
+
+from mock import MagicMock
+
+from syslogng_kafka.pool import ProducerPool
+from syslogng_kafka.pool import config_key
+
+
+def factory(**conf):
+    producer = MagicMock(name='producer')
+    producer.conf = conf
+    return producer
+
+
+class TestConfigKey(unittest.TestCase):
+    def test_key(self):
+        conf = {'bootstrap.servers': 'kafka:9092',
+                'default.topic.config': {'acks': 1, 'message.timeout.ms': 5},
+                'stats_cb': len}
+        self.assertEqual(config_key(conf), config_key(
+            {'default.topic.config': {'message.timeout.ms': 5, 'acks': 1},
+             'bootstrap.servers': 'kafka:9092'}))
+        self.assertNotEqual(config_key(conf), config_key(
+            {'bootstrap.servers': 'kafka:9092'}))
+        hash(config_key(conf))
+
+
+class TestProducerPool(unittest.TestCase):
+    def test_share(self):
+        pool = ProducerPool()
+        conf = {'bootstrap.servers': 'kafka:9092'}
+        producer = pool.acquire(dict(conf), factory=factory)
+        self.assertIs(producer, pool.acquire(dict(conf), factory=factory))
+        other = pool.acquire({'bootstrap.servers': 'other:9092'},
+                             factory=factory)
+        self.assertIsNot(producer, other)
+        self.assertEqual(2, len(pool))
+
+        # flushed by the last user only
+        self.assertFalse(pool.release(producer))
+        producer.flush.assert_not_called()
+        self.assertTrue(pool.release(producer, timeout=5))
+        producer.flush.assert_called_once_with(5)
+        self.assertEqual(1, len(pool))
+        self.assertRaises(KeyError, pool.release, producer)
+
+        # a new producer once released
+        self.assertIsNot(producer, pool.acquire(dict(conf), factory=factory))
+
+    def test_stats(self):
+        pool = ProducerPool()
+        first, second = MagicMock(name='first'), MagicMock(name='second')
+        conf = {'bootstrap.servers': 'kafka:9092',
+                'statistics.interval.ms': 1000}
+        producer = pool.acquire(dict(conf, stats_cb=first), factory=factory)
+        pool.acquire(dict(conf, stats_cb=second), factory=factory)
+        producer.conf['stats_cb']('{}')
+        first.assert_called_once_with('{}')
+        second.assert_called_once_with('{}')
+
+        pool.release(producer, stats_cb=first)
+        producer.conf['stats_cb']('{}')
+        self.assertEqual(1, first.call_count)
+        self.assertEqual(2, second.call_count)
+
+    def test_on_delivery(self):
+        pool = ProducerPool()
+        self.assertRaises(ValueError, pool.acquire,
+                          {'bootstrap.servers': 'kafka:9092',
+                           'on_delivery': len}, factory=factory)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.ratelimit` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka.ratelimit import RateLimiter
+
+
+class LogMessage(object):
+    """ Read-only syslog-ng message w/ a PROGRAM and a HOST. """
+
+    def __init__(self, program, host):
+        self.PROGRAM = program
+        self.HOST = host
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, RateLimiter, 0)
+        self.assertRaises(ValueError, RateLimiter, 10, burst=0.5)
+        self.assertRaises(ValueError, RateLimiter, 10, keys=())
+        self.assertRaises(ValueError, RateLimiter, 10, keys=('FACILITY',))
+        self.assertRaises(ValueError, RateLimiter, 10, max_keys=0)
+        self.assertRaises(ValueError, RateLimiter, 10, sample=-1)
+
+    def test_bucket(self):
+        limiter = RateLimiter(2, burst=3, keys=('HOST',))
+        self.assertEqual([True, True, True, False, False],
+                         [limiter.allow(u'h1', now=10.0) for _ in range(5)])
+        # other keys have their own bucket
+        self.assertTrue(limiter.allow(u'h2', now=10.0))
+        # refilled at 2 tokens per second
+        self.assertTrue(limiter.allow(u'h1', now=10.5))
+        self.assertFalse(limiter.allow(u'h1', now=10.5))
+        self.assertEqual({'dropped': 3, 'sampled': 0}, limiter.get(u'h1'))
+        self.assertEqual({'dropped': 0, 'sampled': 0}, limiter.get(u'h2'))
+        self.assertIsNone(limiter.get(u'h3'))
+        # never more than the burst
+        self.assertEqual([True, True, True, False],
+                         [limiter.allow(u'h1', now=100) for _ in range(4)])
+
+    def test_sample(self):
+        limiter = RateLimiter(1, keys=('PROGRAM',), sample=3)
+        allowed = [limiter.allow(u'firewall', now=10.0) for _ in range(8)]
+        self.assertEqual([True, True, False, False, True, False, False, True],
+                         allowed)
+        self.assertEqual({'dropped': 4, 'sampled': 3},
+                         limiter.get(u'firewall'))
+        self.assertEqual({'dropped': 4, 'sampled': 3}, dict(limiter.counters))
+
+    def test_messages(self):
+        limiter = RateLimiter(1)
+        msg = LogMessage(u'firewall', u'fw1')
+        self.assertTrue(limiter(msg, now=10.0))
+        self.assertFalse(limiter(msg, now=10.0))
+        self.assertTrue(limiter(LogMessage(u'firewall', u'fw2'), now=10.0))
+        self.assertFalse(limiter({'PROGRAM': u'firewall', 'HOST': u'fw1'},
+                                 now=10.0))
+        # w/o the fields: not limited
+        self.assertTrue(limiter({'PROGRAM': u'firewall'}, now=10.0))
+        self.assertTrue(limiter({'PROGRAM': u'firewall'}, now=10.0))
+        self.assertEqual([((u'firewall', u'fw1'),
+                           {'dropped': 2, 'sampled': 0})], limiter.top())
+
+    def test_max_keys(self):
+        limiter = RateLimiter(1, keys=('HOST',), max_keys=2)
+        for host in (u'h1', u'h2', u'h1', u'h3'):
+            limiter.allow(host, now=10.0)
+        self.assertEqual(2, len(limiter))
+        # least recently seen first
+        self.assertIsNone(limiter.get(u'h2'))
+        self.assertIsNotNone(limiter.get(u'h1'))
+        self.assertEqual(1, limiter.counters['evicted'])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
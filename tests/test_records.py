@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.records` module.
+"""
+
+import ast
+import sys
+import unittest
+
+from syslogng_kafka.records import Record
+from syslogng_kafka.records import record_type
+
+Event = record_type('Event', ('action', 'src_ip', 'len'))
+
+
+class TestRecords(unittest.TestCase):
+    def test_record_type(self):
+        self.assertTrue(issubclass(Event, Record))
+        self.assertEqual('Event', Event.__name__)
+        self.assertEqual(('action', 'src_ip', 'len'), Event.fields)
+        self.assertRaises(ValueError, Event, ('drop', u'10.0.0.1'))
+        self.assertRaises(AttributeError, setattr, Event(('a', 'b', 'c')),
+                          'other', 1)
+
+    def test_mapping(self):
+        event = Event(('drop', u'10.0.0.1', -1))
+        self.assertEqual(u'10.0.0.1', event['src_ip'])
+        self.assertRaises(KeyError, event.__getitem__, 'dest_ip')
+        self.assertEqual(-1, event.get('len'))
+        self.assertIsNone(event.get('dest_ip'))
+        self.assertEqual(0, event.get('dest_ip', 0))
+        self.assertIn('action', event)
+        self.assertNotIn('dest_ip', event)
+        self.assertEqual(3, len(event))
+        self.assertEqual(['action', 'src_ip', 'len'], list(event))
+        self.assertEqual(['action', 'src_ip', 'len'], event.keys())
+        self.assertEqual(['drop', u'10.0.0.1', -1], event.values())
+        self.assertEqual([('action', 'drop'), ('src_ip', u'10.0.0.1'),
+                          ('len', -1)], event.items())
+
+    def test_dict(self):
+        event = Event(('drop', u'10.0.0.1', -1))
+        d = {'action': 'drop', 'src_ip': u'10.0.0.1', 'len': -1}
+        self.assertEqual(d, event.to_dict())
+        self.assertEqual(d, ast.literal_eval(repr(event)))
+        self.assertTrue(event == d)
+        self.assertTrue(d == event)
+        self.assertFalse(event != d)
+        self.assertNotEqual(event, dict(d, len=1))
+        self.assertEqual(event, Event(('drop', u'10.0.0.1', -1)))
+        self.assertNotEqual(event, record_type('Other', Event.fields)(
+            ('drop', u'10.0.0.1', 1)))
+        self.assertNotEqual(event, ('drop', u'10.0.0.1', -1))
+        self.assertRaises(TypeError, hash, event)
+
+    def test_repr_escaping(self):
+        event = record_type('Odd', ('100%', "it's"))((u'%s', None))
+        self.assertEqual({'100%': u'%s', "it's": None},
+                         ast.literal_eval(repr(event)))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.routing` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka import routing
+from syslogng_kafka.routing import Router
+
+
+def message(program=u'XXX', host=u'10.11.12.102', facility=u'user',
+            priority=u'notice'):
+    return {'FACILITY': facility, 'PRIORITY': priority, 'HOST': host,
+            'PROGRAM': program, 'DATE': None, 'MESSAGE': u'hello'}
+
+
+class TestRouter(unittest.TestCase):
+    def test_exact(self):
+        router = Router([('PROGRAM', 'firewall', 'fw'),
+                         ('PROGRAM', 'nat', 'nat')], 'default')
+        self.assertEqual(('PROGRAM',), router.fields)
+        self.assertEqual('fw', router(message(u'firewall')))
+        self.assertEqual('nat', router(message(u'nat')))
+        self.assertEqual('default', router(message()))
+
+    def test_patterns(self):
+        router = Router([('HOST', 'edge-*', 'edge'),
+                         ('PROGRAM', 'kernel/?', 'kernel')], 'default')
+        self.assertEqual(('PROGRAM', 'HOST'), router.fields)
+        self.assertEqual('edge', router(message(host=u'edge-01')))
+        self.assertEqual('kernel', router(message(u'kernel/1')))
+        self.assertEqual('default', router(message(u'kernel/12')))
+
+    def test_order(self):
+        # the first matching route wins, exact or not
+        router = Router([('FACILITY', 'auth', 'auth'),
+                         ('PROGRAM', 'fire*', 'fw'),
+                         ('PROGRAM', 'firewall', 'never'),
+                         ('PRIORITY', 'err', 'errors')], 'default')
+        self.assertEqual('auth', router(message(u'firewall',
+                                                facility=u'auth')))
+        self.assertEqual('fw', router(message(u'firewall')))
+        self.assertEqual('fw', router(message(u'firewall', priority=u'err')))
+        self.assertEqual('errors', router(message(priority=u'err')))
+        self.assertEqual('default', router(message()))
+
+    def test_missing_fields(self):
+        router = Router([('FACILITY', 'auth', 'auth'),
+                         ('PRIORITY', 'e*', 'errors'),
+                         ('PROGRAM', 'firewall', 'fw')], 'default')
+        # `value-pairs` dictionary w/o FACILITY and PRIORITY
+        msg = {'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+               'MESSAGE': u'hello'}
+        self.assertEqual('fw', router(msg))
+        self.assertEqual('default', router({'MESSAGE': u'hello'}))
+
+    def test_cache(self):
+        router = Router([('HOST', 'edge-*', 'edge')], 'default')
+        for i in range(routing.ROUTE_CACHE_SIZE + 1):
+            router(message(host=u'host-%d' % i))
+        self.assertEqual(1, len(router._topics))
+        self.assertEqual('edge', router(message(host=u'edge-01')))
+        self.assertEqual('edge', router._topics[(u'edge-01',)])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Router,
+                          [('MESSAGE', 'hello', 'hello')], 'default')
+        self.assertRaises(ValueError, Router, [('HOST', 'edge', '')],
+                          'default')
+        self.assertRaises(ValueError, Router, [('HOST', 'edge')], 'default')
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.serializers` module.
+"""
+
+import ast
+import json
+import sys
+import unittest
+from collections import OrderedDict
+from io import BytesIO
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+
+from syslogng_kafka.serializers import SERIALIZERS
+from syslogng_kafka.serializers import avro_schema
+from syslogng_kafka.serializers import get_serializer
+from syslogng_kafka.util import parse_firewall_event
+from syslogng_kafka.util import parse_firewall_msg
+
+FIREWALL_MSG = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DROP_131073IN=vNic_0 ' \
+               'OUT= MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 ' \
+               'SRC=10.11.254.108 DST=10.11.12.181 LEN=84 TOS=0x00 ' \
+               'PREC=0x00 TTL=64 ID=54643 PROTO=ICMP TYPE=8 CODE=0 ' \
+               'ID=65299 SEQ=10047 MARK=0x1'
+
+
+def message():
+    return {'FACILITY': u'user', 'PRIORITY': u'notice',
+            'HOST': u'10.11.12.102', 'PROGRAM': u'firewall',
+            'DATE': '1498135756',
+            'MESSAGE': parse_firewall_msg(FIREWALL_MSG)}
+
+
+class TestSerializers(unittest.TestCase):
+    def test_records(self):
+        # records are encoded like the dictionaries they replace
+        event = message()
+        event['MESSAGE'] = parse_firewall_event(FIREWALL_MSG)
+        for name in SERIALIZERS:
+            try:
+                encode = get_serializer(name)
+            except ImportError:
+                continue
+            self.assertEqual(encode(message()), encode(event), name)
+            event['PROGRAM'] = u'other'
+            self.assertEqual(encode(dict(message(), PROGRAM=u'other')),
+                             encode(event), name)
+            event['PROGRAM'] = u'firewall'
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_serializer, 'nope')
+
+    def test_bytes(self):
+        for name in SERIALIZERS:
+            try:
+                encode = get_serializer(name)
+            except ImportError:
+                continue
+            self.assertIsInstance(encode(message()), bytes, name)
+
+    def test_repr(self):
+        encode = get_serializer('repr')
+        self.assertEqual(message(),
+                         ast.literal_eval(encode(message()).decode('utf-8')))
+
+    def test_json(self):
+        for name in ('json', 'fastjson'):
+            encode = get_serializer(name)
+            self.assertEqual(message(),
+                             json.loads(encode(message()).decode('utf-8')))
+
+    def test_logfmt(self):
+        encode = get_serializer('logfmt')
+        msg = OrderedDict([('HOST', u'h'), ('PROGRAM', u'p'),
+                           ('MESSAGE', u'a "quoted" msg'), ('DATE', None)])
+        self.assertEqual(u'HOST=h PROGRAM=p MESSAGE="a \\"quoted\\" msg" '
+                         u'DATE=None', encode(msg).decode('utf-8'))
+
+        line = encode(message()).decode('utf-8')
+        self.assertIn(u'src_ip=10.11.254.108', line)
+        self.assertIn(u'out=""', line)
+        self.assertNotIn(u'MESSAGE', line)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        encode = get_serializer('msgpack')
+        msg = msgpack.unpackb(encode(message()), raw=False)
+        self.assertEqual(1498135756, msg['DATE'])
+        self.assertEqual(u'firewall', msg['PROGRAM'])
+        event = msg['MESSAGE']
+        self.assertEqual(64, event['ttl'])
+        self.assertEqual(1, event['mark'])
+        self.assertEqual(-1, event['source_port'])
+        self.assertEqual(u'10.11.254.108', event['src_ip'])
+
+        msg = msgpack.unpackb(encode(
+            {'FACILITY': u'user', 'PRIORITY': u'notice', 'HOST': u'h',
+             'PROGRAM': u'p', 'DATE': None, 'MESSAGE': u'hello'}), raw=False)
+        self.assertEqual(None, msg['DATE'])
+        self.assertEqual(u'hello', msg['MESSAGE'])
+        self.assertNotIn('count', msg)
+
+        # aggregated by the deduplicator
+        msg = msgpack.unpackb(encode(dict(
+            message(), count=3, first_seen=1498135756000,
+            last_seen=1498135757000)), raw=False)
+        self.assertEqual(3, msg['count'])
+        self.assertEqual(1498135757000, msg['last_seen'])
+
+    @unittest.skipIf(fastavro is None, "fastavro is not installed")
+    def test_avro(self):
+        encode = get_serializer('avro')
+        schema = fastavro.parse_schema(avro_schema())
+        msg = fastavro.schemaless_reader(BytesIO(encode(message())), schema)
+        self.assertEqual(1498135756, msg['DATE'])
+        event = msg['MESSAGE']
+        self.assertEqual(65299, event['id'])
+        self.assertEqual(u'drop', event['action'])
+        self.assertEqual(u'', event['out'])
+
+        msg = {'FACILITY': u'user', 'PRIORITY': u'notice', 'HOST': u'h',
+               'PROGRAM': u'p', 'DATE': None, 'MESSAGE': u'hello'}
+        self.assertEqual(msg, fastavro.schemaless_reader(
+            BytesIO(encode(msg)), schema))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
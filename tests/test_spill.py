@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.spill` module.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from confluent_kafka import KafkaError
+from confluent_kafka import KafkaException
+
+from syslogng_kafka.spill import HEADER
+from syslogng_kafka.spill import SpillDrainer
+from syslogng_kafka.spill import SpillQueue
+
+
+class FakeProducer(object):
+    """ Producer reporting the deliveries on `poll()`, failed w/ `error`
+    if set.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.produced = []
+        self.error = None
+        self._reports = []
+
+    def __len__(self):
+        return 0
+
+    def produce(self, topic, value, **kwargs):
+        if self.capacity is not None and len(self.produced) >= self.capacity:
+            raise BufferError("Fake exception.")
+        if len(value) > 100:
+            raise KafkaException(KafkaError(KafkaError.MSG_SIZE_TOO_LARGE))
+        self._reports.append(kwargs.pop('on_delivery'))
+        self.produced.append((topic, value, kwargs))
+
+    def poll(self, timeout):
+        reports, self._reports = self._reports, []
+        for on_delivery in reports:
+            on_delivery(self.error, None)
+        return len(reports)
+
+
+class TestSpillQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_peek_commit(self):
+        queue = SpillQueue(self.directory, max_bytes=4096,
+                           segment_bytes=1024)
+        queue.append(u'topic', b'one')
+        queue.append(u'topic', u'two', key=u'k', partition=3)
+        self.assertEqual(2, len(queue))
+
+        records = queue.peek(10)
+        self.assertEqual([(u'topic', b'one', None, None),
+                          (u'topic', b'two', b'k', 3)], records)
+        # peek does not consume
+        self.assertEqual(records, queue.peek(10))
+
+        queue.commit(1)
+        self.assertEqual(1, len(queue))
+        self.assertEqual([(u'topic', b'two', b'k', 3)], queue.peek(10))
+        queue.commit(1)
+        self.assertEqual(0, len(queue))
+        self.assertEqual([], queue.peek(10))
+        self.assertEqual({'spilled': 2, 'replayed': 2}, queue.counters)
+        queue.close()
+
+    def test_rotation(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=256)
+        for i in range(20):
+            queue.append(u'topic', b'x' * 50 + str(i).encode('ascii'))
+        segments = [n for n in os.listdir(self.directory) if
+                    n.endswith('.log')]
+        self.assertTrue(len(segments) > 1)
+
+        values = [r[1] for r in queue.peek(100)]
+        self.assertEqual([b'x' * 50 + str(i).encode('ascii')
+                          for i in range(20)], values)
+        queue.commit(20)
+        # consumed segments are removed
+        segments = [n for n in os.listdir(self.directory) if
+                    n.endswith('.log')]
+        self.assertEqual(1, len(segments))
+        queue.close()
+
+    def test_record_bigger_than_segment(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=128)
+        queue.append(u'topic', b'small')
+        queue.append(u'topic', b'x' * 1000)
+        queue.append(u'topic', b'small again')
+        self.assertEqual([b'small', b'x' * 1000, b'small again'],
+                         [r[1] for r in queue.peek(10)])
+        queue.close()
+
+    def test_eviction(self):
+        queue = SpillQueue(self.directory, max_bytes=512, segment_bytes=256)
+        record_size = HEADER.size + len(u'topic') + 100
+        per_segment = (256 - HEADER.size) // record_size
+        for i in range(per_segment * 3):
+            queue.append(u'topic', str(i).encode('ascii') * 100)
+        self.assertEqual(per_segment, queue.counters['evicted'])
+        self.assertEqual(per_segment * 2, len(queue))
+        # the oldest messages are gone
+        self.assertEqual(str(per_segment).encode('ascii') * 100,
+                         queue.peek(1)[0][1])
+        queue.close()
+
+    def test_recovery(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=256)
+        for i in range(10):
+            queue.append(u'topic', str(i).encode('ascii'))
+        queue.peek(4)
+        queue.commit(4)
+        queue.peek(2)
+        # crash w/o commit of the last peek
+        queue.close()
+
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=256)
+        self.assertEqual(6, len(queue))
+        self.assertEqual([str(i).encode('ascii') for i in range(4, 10)],
+                         [r[1] for r in queue.peek(100)])
+        queue.append(u'topic', b'10')
+        self.assertEqual(7, len(queue))
+        queue.close()
+
+    def test_recovery_torn_record(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=1024)
+        queue.append(u'topic', b'one')
+        queue.append(u'topic', b'two')
+        position = queue.write_pos
+        queue.append(u'topic', b'three')
+        # corrupt the last record as if the process died while writing it
+        segment = queue._segments[queue.write_seq]
+        segment.map[position + HEADER.size + 6] = 0 if sys.version_info[
+            0] > 2 else b'\0'
+        queue.close()
+
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=1024)
+        self.assertEqual([b'one', b'two'], [r[1] for r in queue.peek(10)])
+        queue.append(u'topic', b'four')
+        self.assertEqual([b'one', b'two', b'four'],
+                         [r[1] for r in queue.peek(10)])
+        queue.close()
+
+    def test_drainer(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=256)
+        for i in range(10):
+            queue.append(u'topic', str(i).encode('ascii'), key=u'k',
+                         partition=1)
+
+        producer = FakeProducer(capacity=6)
+        drainer = SpillDrainer(queue, producer, batch=4)
+        # stops once the producer is full
+        self.assertEqual(6, drainer.drain())
+        self.assertEqual(4, len(queue))
+        self.assertEqual((u'topic', b'0', {'key': b'k', 'partition': 1}),
+                         producer.produced[0])
+
+        producer.capacity = None
+        self.assertEqual(4, drainer.drain())
+        self.assertEqual(0, len(queue))
+        self.assertEqual([str(i).encode('ascii') for i in range(10)],
+                         [p[1] for p in producer.produced])
+
+        drainer.start()
+        drainer.stop(5)
+        self.assertFalse(drainer.is_alive())
+        queue.close()
+
+    def test_drainer_rejected(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=1024)
+        for value in (b'0', b'x' * 500, b'1'):
+            queue.append(u'topic', value)
+
+        producer = FakeProducer()
+        drainer = SpillDrainer(queue, producer)
+        # too large: dropped instead of blocking the records behind it
+        self.assertEqual(2, drainer.drain())
+        self.assertEqual(0, len(queue))
+        self.assertEqual([b'0', b'1'], [p[1] for p in producer.produced])
+        self.assertEqual({'replayed': 2, 'rejected': 1, 'spilled': 3},
+                         dict(queue.counters))
+        queue.close()
+
+    def test_drainer_delivery(self):
+        queue = SpillQueue(self.directory, max_bytes=10240,
+                           segment_bytes=1024)
+        for i in range(5):
+            queue.append(u'topic', str(i).encode('ascii'))
+
+        producer = FakeProducer()
+        producer.error = KafkaError(KafkaError._MSG_TIMED_OUT)
+        reports = []
+        drainer = SpillDrainer(queue, producer, batch=2,
+                               on_delivery=lambda err, msg: reports.append(
+                                   err))
+        # brokers down: a single record probed, kept on disk
+        self.assertEqual(0, drainer.drain())
+        self.assertEqual(0, drainer.drain())
+        self.assertEqual([b'0', b'0'], [p[1] for p in producer.produced])
+        self.assertEqual(5, len(queue))
+        self.assertEqual(2, queue.counters['replay_failed'])
+        self.assertEqual([producer.error] * 2, reports)
+
+        # back: probed, then replayed in batches
+        producer.error = None
+        self.assertEqual(5, drainer.drain())
+        self.assertEqual(0, len(queue))
+        self.assertEqual([b'0', b'0', b'0', b'1', b'2', b'3', b'4'],
+                         [p[1] for p in producer.produced])
+
+        # rejected for good by the brokers: dropped
+        queue.append(u'topic', b'5')
+        producer.error = KafkaError(KafkaError.MSG_SIZE_TOO_LARGE)
+        self.assertEqual(0, drainer.drain())
+        self.assertEqual(0, len(queue))
+        self.assertEqual(1, queue.counters['rejected'])
+        queue.close()
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
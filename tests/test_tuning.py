@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.tuning` module.
+"""
+
+import sys
+import unittest
+
+from syslogng_kafka.tuning import AutoTuner
+from syslogng_kafka.tuning import PROFILES
+from syslogng_kafka.tuning import parse_bounds
+
+
+class Stats(object):
+    """ Statistics of a producer transmitting `rate` messages per second.
+    """
+
+    def __init__(self, name='rdkafka#producer-1', ts=0):
+        self.name = name
+        self.ts = ts
+        self.txmsgs = 0
+
+    def __call__(self, rate, msg_cnt=0, rtt=20000):
+        self.ts += 15 * 1000000
+        self.txmsgs += rate * 15
+        return {'name': self.name, 'ts': self.ts, 'txmsgs': self.txmsgs,
+                'msg_cnt': msg_cnt, 'msg_max': 100000,
+                'topics': {'my_topic': {'batchcnt': {'avg': 42, 'cnt': 3}}},
+                'brokers': {'b1': {'rtt': {'p99': rtt, 'cnt': 10}},
+                            'b2': {'rtt': {'p99': 0, 'cnt': 0}}}}
+
+
+class TestParseBounds(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(('latency', 'throughput'),
+                         parse_bounds('latency:throughput'))
+        self.assertEqual(('balanced', 'balanced'), parse_bounds('balanced'))
+        self.assertRaises(ValueError, parse_bounds, 'fast')
+        self.assertRaises(ValueError, parse_bounds, 'throughput:latency')
+
+
+class TestAutoTuner(unittest.TestCase):
+    def test_observe(self):
+        tuner = AutoTuner()
+        stats = Stats()
+        self.assertIsNone(tuner.observe(stats(100)))
+        self.assertEqual({'rate': 100, 'fill': 0.25, 'batch': 42,
+                          'rtt': 20}, tuner.observe(stats(100, 25000)))
+        # new producer: `ts` goes on, `txmsgs` starts over
+        self.assertIsNone(tuner.observe(
+            Stats('rdkafka#producer-2', stats.ts)(100)))
+
+    def test_replaced(self):
+        tuner = AutoTuner(intervals=1)
+        previous = Stats()
+        tuner(previous(50000))
+        self.assertEqual('throughput', tuner(previous(50000)))
+        tuner.reset()
+        # statistics of both producers while the previous one drains
+        current = Stats('rdkafka#producer-2', previous.ts)
+        rates = []
+        for _ in range(3):
+            for stats in (current(100), previous(200000)):
+                observed = tuner.observe(stats)
+                if observed is not None:
+                    rates.append(observed['rate'])
+        self.assertEqual([], rates)
+        self.assertIsNone(tuner.observe(current(100)))
+        self.assertEqual(100, tuner.observe(current(100))['rate'])
+
+    def test_step_up(self):
+        tuner = AutoTuner(intervals=2)
+        self.assertEqual('balanced', tuner.profile)
+        self.assertEqual(PROFILES['balanced'], tuner.settings)
+        stats = Stats()
+        tuner(stats(100))
+        self.assertIsNone(tuner(stats(50000)))
+        # a burst is not enough
+        self.assertIsNone(tuner(stats(15000)))
+        self.assertIsNone(tuner(stats(50000)))
+        self.assertEqual('throughput', tuner(stats(5000, msg_cnt=60000)))
+        self.assertEqual('throughput', tuner.profile)
+        # highest profile allowed
+        for _ in range(3):
+            self.assertIsNone(tuner(stats(50000)))
+
+    def test_step_down(self):
+        tuner = AutoTuner(intervals=1)
+        stats = Stats()
+        tuner(stats(100))
+        # slow brokers: keep the larger batches
+        self.assertIsNone(tuner(stats(100, rtt=500000)))
+        self.assertEqual('latency', tuner(stats(100)))
+        self.assertIsNone(tuner(stats(100)))
+        self.assertEqual('balanced', tuner(stats(2000)))
+
+    def test_bounds(self):
+        tuner = AutoTuner('throughput', 'throughput', intervals=1)
+        self.assertEqual('throughput', tuner.profile)
+        stats = Stats()
+        tuner(stats(100))
+        self.assertIsNone(tuner(stats(0)))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
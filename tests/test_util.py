@@ -5,11 +5,20 @@
 """
 
 import ast
+import datetime
 import sys
+import time
 import unittest
 
+from syslogng_kafka import util
+from syslogng_kafka.records import record_type
+from syslogng_kafka.util import FirewallEvent
+from syslogng_kafka.util import KeyValueParser
+from syslogng_kafka.util import NatEvent
 from syslogng_kafka.util import date_str_to_timestamp
+from syslogng_kafka.util import parse_firewall_event
 from syslogng_kafka.util import parse_firewall_msg
+from syslogng_kafka.util import parse_nat_event
 from syslogng_kafka.util import parse_nat_msg
 from syslogng_kafka.util import parse_str_list
 
@@ -129,12 +138,111 @@ class TestUtil(unittest.TestCase):
         d1 = ast.literal_eval(str(expected))
         self.assertDictEqual(d1, msg_s)
 
+    def test_parse_events(self):
+        firewall = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: ' \
+                   'DROP_131073IN=vNic_0 OUT= SRC=10.11.12.53 ' \
+                   'DST=10.11.12.255 TOS=0x00 PROTO=UDP SPT=138 DPT=138'
+        nat = '[69e9c2b7-ee9f-4a3e-80f0-8ffc66aac147]: DNAT_IN=vNic_0 ' \
+              'OUT= SRC=173.8.227.70 DST=209.143.151.73 PROTO=TCP SPT=54740'
+        for parse_event, parse_msg, record, msg in (
+                (parse_firewall_event, parse_firewall_msg, FirewallEvent,
+                 firewall),
+                (parse_nat_event, parse_nat_msg, NatEvent, nat)):
+            event = parse_event(msg)
+            self.assertIsInstance(event, record)
+            expected = parse_msg(msg)
+            self.assertEqual(expected, event)
+            self.assertEqual(sorted(expected.items()), sorted(event.items()))
+            self.assertEqual(expected, ast.literal_eval(repr(event)))
+
+    def test_key_value_parser(self):
+        parser = KeyValueParser(
+            fields=((None, 'action', 'allow'), ('SRC', 'src', -1),
+                    ('OUT', 'out', '')),
+            flags=(('DROP', 'action', 'drop'),))
+
+        self.assertEqual(dict(parser('')),
+                         {'action': 'allow', 'src': -1, 'out': ''})
+
+        # only the value up to a second `=` is kept, tokens without `=` and
+        # unknown keys are ignored.
+        d = parser('SRC=a=b OUT SRCX=c DROP_SRC=d')
+        self.assertEqual(d, {'action': 'drop', 'src': 'a', 'out': ''})
+
+        d = parser('OUT= SRC=10.0.0.1')
+        self.assertEqual(d, {'action': 'allow', 'src': '10.0.0.1', 'out': ''})
+
+    def test_key_value_parser_record(self):
+        fields = ((None, 'action', 'allow'), ('SRC', 'src', -1))
+        parser = KeyValueParser(fields, flags=(('DROP', 'action', 'drop'),),
+                                record=record_type('Event', ('action', 'src')))
+        event = parser('DROP SRC=a=b')
+        self.assertEqual(('action', 'src'), event.fields)
+        self.assertEqual({'action': 'drop', 'src': 'a'}, event)
+        self.assertEqual({'action': 'allow', 'src': -1}, parser(''))
+
+        self.assertRaises(ValueError, KeyValueParser, fields,
+                          record=record_type('Event', ('src', 'action')))
+
     def test_date_str_to_ts(self):
         date_str = 'Jun 22 12:49:16'
-        date_str_to_timestamp(date_str)
-        # FIXME will break next year
-        # expected_ts = '1498135756'
-        # self.assertEqual(expected_ts, ts)
+        ts = date_str_to_timestamp(date_str)
+        # cached
+        self.assertIn(date_str, util._date_cache)
+        self.assertEqual(ts, date_str_to_timestamp(date_str))
+        self.assertEqual(ts, util._date_str_to_timestamp(date_str))
+
+        # cached, uncached and `strptime` conversions match
+        now = datetime.datetime.now()
+        for date_str in ('Jun 22 12:49:16', 'Jun  2 02:09:06',
+                         'Jan 31 00:00:00', 'Dec  1 23:59:59'):
+            self.assertEqual(util._date_str_to_timestamp(date_str),
+                             date_str_to_timestamp(date_str))
+            msg = datetime.datetime.strptime(date_str, '%b %d %H:%M:%S')
+            msg = msg.replace(year=now.year)
+            self.assertEqual(msg.strftime('%s'), util._date_str_to_timestamp(
+                date_str, msg.timetuple()))
+
+        # unusual formats fall back on `strptime`
+        self.assertEqual(util._date_str_to_timestamp('jun 22 12:49:16'),
+                         util._date_str_to_timestamp('Jun 22 12:49:16'))
+        self.assertRaises(ValueError, date_str_to_timestamp, 'Jun 31 1:2:3')
+        self.assertRaises(ValueError, date_str_to_timestamp, 'XXX')
+
+    def test_date_str_to_ts_new_year(self):
+        def ts(year, month, day, hour, minute, second):
+            return str(int(time.mktime(
+                (year, month, day, hour, minute, second, 0, 0, -1))))
+
+        new_year = time.localtime(time.mktime(
+            (2018, 1, 1, 0, 0, 5, 0, 0, -1)))
+        self.assertEqual(
+            ts(2017, 12, 31, 23, 59, 59),
+            util._date_str_to_timestamp('Dec 31 23:59:59', new_year))
+        self.assertEqual(
+            ts(2018, 1, 1, 0, 0, 1),
+            util._date_str_to_timestamp('Jan  1 00:00:01', new_year))
+
+        new_year_eve = time.localtime(time.mktime(
+            (2017, 12, 31, 23, 59, 55, 0, 0, -1)))
+        self.assertEqual(
+            ts(2018, 1, 1, 0, 0, 1),
+            util._date_str_to_timestamp('Jan  1 00:00:01', new_year_eve))
+        self.assertEqual(
+            ts(2017, 12, 31, 23, 59, 50),
+            util._date_str_to_timestamp('Dec 31 23:59:50', new_year_eve))
+
+    def test_date_str_to_ts_cache_eviction(self):
+        util._date_cache.clear()
+        size = util.DATE_CACHE_SIZE
+        util.DATE_CACHE_SIZE = 3
+        try:
+            for second in range(5):
+                date_str_to_timestamp('Jun 22 12:49:0%d' % second)
+            self.assertEqual(['Jun 22 12:49:02', 'Jun 22 12:49:03',
+                              'Jun 22 12:49:04'], list(util._date_cache))
+        finally:
+            util.DATE_CACHE_SIZE = size
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for `syslogng_kafka.worker` module.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from syslogng_kafka.worker import RingBuffer
+from syslogng_kafka.worker import WorkerPool
+from syslogng_kafka.worker import decode_message
+from syslogng_kafka.worker import encode_message
+
+
+class FileDestination(object):
+    """ Destination of the workers appending the messages to a file.
+    """
+
+    def init(self, args):
+        self.path = os.path.join(args['directory'], str(os.getpid()))
+        return True
+
+    def open(self):
+        return True
+
+    def send_message(self, msg):
+        if msg['MESSAGE'] == u'crash':
+            os._exit(3)
+        with open(self.path, 'a') as f:
+            f.write(msg['MESSAGE'] + '\n')
+        return True
+
+    def close(self):
+        return True
+
+    def deinit(self):
+        return True
+
+
+def message(text):
+    return {'FACILITY': u'user', 'PRIORITY': u'notice', 'HOST': b'host',
+            'PROGRAM': u'XXX', 'DATE': None, 'MESSAGE': text}
+
+
+class TestEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        msg = message(u'h\xe9llo')
+        self.assertEqual(msg, decode_message(encode_message(msg)))
+        self.assertEqual({}, decode_message(encode_message({})))
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_put_get(self):
+        ring = RingBuffer(64)
+        self.assertIsNone(ring.get())
+        self.assertTrue(ring.put(b'hello'))
+        self.assertTrue(ring.put(b''))
+        self.assertEqual(24, len(ring))
+        self.assertEqual(b'hello', ring.get())
+        self.assertEqual(b'', ring.get())
+        self.assertIsNone(ring.get())
+        self.assertEqual(0, len(ring))
+        ring.close()
+
+    def test_wrap(self):
+        ring = RingBuffer(64)
+        for i in range(20):
+            self.assertTrue(ring.put(b'%d' % i * 9))
+            self.assertTrue(ring.put(b'x' * 12))
+            self.assertEqual(b'%d' % i * 9, ring.get())
+            self.assertEqual(b'x' * 12, ring.get())
+        self.assertIsNone(ring.get())
+
+    def test_full(self):
+        ring = RingBuffer(64)
+        self.assertTrue(ring.put(b'a' * 28))
+        self.assertTrue(ring.put(b'b' * 28))
+        self.assertFalse(ring.put(b'c'))
+        self.assertEqual(b'a' * 28, ring.get())
+        self.assertTrue(ring.put(b'c'))
+        self.assertRaises(ValueError, ring.put, b'd' * 40)
+        self.assertRaises(ValueError, RingBuffer, 16)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def received(self):
+        lines = []
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name)) as f:
+                lines.extend(f.read().split())
+        return lines
+
+    def test_workers(self):
+        pool = WorkerPool(FileDestination, {'directory': self.directory},
+                          workers=2, ring_bytes=4096)
+        pool.start()
+        for i in range(200):
+            while not pool.put(message(u'%d' % i)):
+                pass
+        pool.stop(timeout=10)
+        self.assertEqual(set(u'%d' % i for i in range(200)),
+                         set(self.received()))
+        self.assertEqual(2, len(os.listdir(self.directory)))
+        self.assertEqual([0, 0], [p.exitcode for p in pool.processes])
+
+    def test_restart(self):
+        pool = WorkerPool(FileDestination, {'directory': self.directory},
+                          workers=1, interval=0.05)
+        pool.start()
+        first = pool.processes[0]
+        pool.put(message(u'crash'))
+        pool.put(message(u'after'))
+        first.join(10)
+        self.assertEqual(3, first.exitcode)
+        pool.stop(timeout=10)
+        self.assertEqual(1, pool.counters['restarts'])
+        self.assertIsNot(first, pool.processes[0])
+        self.assertEqual([u'after'], self.received())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Syslog load generator of randomized firewall and nat traffic.
+
+Worker processes each reuse a single UDP or TCP socket and send their share
+of a target rate following a profile:
+
+    constant          --rate messages per second
+    ramp              from --start-rate to --rate over --ramp-seconds
+    steps:R1,R2,...   each rate for --step-seconds, then the last one
+
+A --rate of 0 sends as fast as possible. Messages use the RFC3164 or RFC5424
+format, framed on TCP w/ a trailing newline or an octet count (RFC6587).
+The achieved rate is summarized every --interval seconds.
+
+    $ python tools/syslog_loadgen.py --rate 50000 --processes 4 --duration 60
+    $ python tools/syslog_loadgen.py --proto tcp --format rfc5424 \\
+        --profile steps:10000,50000,100000 --step-seconds 30
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import random
+import signal
+import socket
+import sys
+import time
+
+FIREWALL_TEMPLATE = '[%(uuid)s]: %(action)s_131073IN=vNic_0 OUT= ' \
+                    'MAC=00:50:56:01:43:50:00:1f:6c:3d:d7:f7:08:00 ' \
+                    'SRC=%(src)s DST=%(dst)s LEN=%(len)d TOS=0x00 ' \
+                    'PREC=0x00 TTL=%(ttl)d ID=%(id)d PROTO=%(proto)s ' \
+                    'SPT=%(spt)d DPT=%(dpt)d WINDOW=29200 RES=0x00 SYN ' \
+                    'URGP=0 MARK=0x1'
+
+NAT_TEMPLATE = '[%(uuid)s]: DNAT_IN=vNic_0 OUT= ' \
+               'MAC=00:50:56:01:35:27:00:a7:42:53:c5:c2:08:00 SRC=%(src)s ' \
+               'DST=%(dst)s LEN=%(len)d TOS=0x00 PREC=0x00 TTL=%(ttl)d ' \
+               'ID=%(id)d DF PROTO=%(proto)s SPT=%(spt)d DPT=%(dpt)d ' \
+               'WINDOW=8192 RES=0x00 SYN URGP=0'
+
+TEMPLATES = {'firewall': FIREWALL_TEMPLATE, 'nat': NAT_TEMPLATE}
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+          'Oct', 'Nov', 'Dec')
+
+# local0.info
+DEFAULT_PRI = 134
+
+# distinct messages generated by each worker and sent in turn
+POOL_SIZE = 4096
+
+# seconds between two rate adjustments of a worker
+TICK = 0.005
+
+# messages sent between two clock checks at full speed
+BURST = 256
+
+
+def random_fields(rnd):
+    return {'uuid': '%08x-%04x-4%03x-8%03x-%012x' % (
+        rnd.getrandbits(32), rnd.getrandbits(16), rnd.getrandbits(12),
+        rnd.getrandbits(12), rnd.getrandbits(48)),
+        'action': rnd.choice(('DROP', 'ACCEPT')),
+        'src': '10.%d.%d.%d' % (rnd.randint(0, 255), rnd.randint(0, 255),
+                                rnd.randint(1, 254)),
+        'dst': '209.143.%d.%d' % (rnd.randint(0, 255), rnd.randint(1, 254)),
+        'len': rnd.randint(40, 1500), 'ttl': rnd.choice((64, 122, 128)),
+        'id': rnd.randint(1, 65535),
+        'proto': rnd.choice(('TCP', 'UDP', 'ICMP')),
+        'spt': rnd.randint(1024, 65535),
+        'dpt': rnd.choice((22, 53, 80, 138, 443, 3389))}
+
+
+def parse_mix(mix):
+    """ 'firewall=3,nat=1' to [('firewall', 3), ('nat', 1)]. """
+    weights = []
+    for item in mix.split(','):
+        program, _, weight = item.partition('=')
+        if program not in TEMPLATES:
+            raise ValueError("Unknown program %r, use one of %s"
+                             % (program, ', '.join(sorted(TEMPLATES))))
+        weights.append((program, int(weight or 1)))
+    return weights
+
+
+class Profile(object):
+    """ Target rate in messages per second over time.
+    """
+
+    def __init__(self, spec, rate, start_rate=0.0, ramp_seconds=60.0,
+                 step_seconds=60.0):
+        self.rate = rate
+        self.start_rate = start_rate
+        self.ramp_seconds = ramp_seconds
+        self.step_seconds = step_seconds
+        self.steps = None
+        self.kind = spec
+        if spec.startswith('steps:'):
+            self.kind = 'steps'
+            self.steps = [float(r) for r in spec[6:].split(',')]
+        elif spec not in ('constant', 'ramp'):
+            raise ValueError("Unknown profile %r" % spec)
+
+    def __call__(self, elapsed):
+        """ Rate at `elapsed` seconds, 0 for as fast as possible. """
+        if self.kind == 'ramp' and elapsed < self.ramp_seconds:
+            return self.start_rate + (self.rate - self.start_rate) * \
+                elapsed / self.ramp_seconds
+        if self.kind == 'steps':
+            return self.steps[min(int(elapsed // self.step_seconds),
+                                  len(self.steps) - 1)]
+        return self.rate
+
+
+class Formatter(object):
+    """ Syslog lines w/ a header rendered once per second and program.
+    """
+
+    def __init__(self, fmt, framing, hostname, pri=DEFAULT_PRI):
+        self.fmt = fmt
+        self.framing = framing
+        self.hostname = hostname
+        self.pri = pri
+        self._second = None
+        self._headers = {}
+
+    def header(self, program, now):
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._headers = {}
+        try:
+            return self._headers[program]
+        except KeyError:
+            pass
+        pid = 1000 + len(program)
+        if self.fmt == 'rfc5424':
+            header = '<%d>1 %s %s %s %d - - ' % (
+                self.pri, time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                        time.gmtime(second)),
+                self.hostname, program, pid)
+        else:
+            t = time.localtime(second)
+            header = '<%d>%s %2d %s %s %s[%d]: ' % (
+                self.pri, MONTHS[t.tm_mon - 1], t.tm_mday,
+                time.strftime('%H:%M:%S', t), self.hostname, program, pid)
+        header = header.encode('utf-8')
+        self._headers[program] = header
+        return header
+
+    def __call__(self, program, body, now):
+        line = self.header(program, now) + body
+        if self.framing == 'octet':
+            return ('%d ' % len(line)).encode('ascii') + line
+        if self.framing == 'newline':
+            return line + b'\n'
+        return line
+
+
+def connect(args):
+    if args.proto == 'tcp':
+        sock = socket.create_connection((args.host, args.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, sock.sendall
+    family = socket.getaddrinfo(args.host, args.port, 0,
+                                socket.SOCK_DGRAM)[0][0]
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.connect((args.host, args.port))
+    return sock, sock.send
+
+
+def worker(index, args, sent, sent_bytes, errors, stop):
+    """ Send this worker's share of the target rate until `stop` is set.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rnd = random.Random(args.seed + index)
+    programs = [p for p, weight in parse_mix(args.mix) for _ in range(weight)]
+    pool = []
+    for _ in range(POOL_SIZE):
+        program = rnd.choice(programs)
+        pool.append((program, (TEMPLATES[program] % random_fields(
+            rnd)).encode('utf-8')))
+    profile = Profile(args.profile, args.rate, args.start_rate,
+                      args.ramp_seconds, args.step_seconds)
+    formatter = Formatter(args.format, args.framing, args.hostname)
+    limit = 0
+    if args.count:
+        limit = args.count // args.processes + (
+            index < args.count % args.processes)
+    try:
+        sock, send = connect(args)
+    except (IOError, OSError) as e:
+        print("Worker %d cannot connect to %s:%s: %s"
+              % (index, args.host, args.port, e), file=sys.stderr)
+        errors[index] = 1
+        return
+
+    start = last = time.time()
+    budget = 0.0
+    i = count = size = failed = 0
+    while not stop.is_set():
+        now = time.time()
+        rate = profile(now - start) / args.processes
+        if rate > 0:
+            budget = min(budget + rate * (now - last), rate)
+            todo = int(budget)
+            budget -= todo
+        else:
+            todo = BURST
+        if limit:
+            if count + failed >= limit:
+                break
+            todo = min(todo, limit - count - failed)
+        last = now
+        for _ in range(todo):
+            program, body = pool[i]
+            i = (i + 1) % POOL_SIZE
+            line = formatter(program, body, now)
+            try:
+                send(line)
+                count += 1
+                size += len(line)
+            except (IOError, OSError):
+                failed += 1
+                if args.proto == 'tcp':
+                    sock.close()
+                    time.sleep(0.1)
+                    try:
+                        sock, send = connect(args)
+                    except (IOError, OSError):
+                        pass
+                    break
+        sent[index], sent_bytes[index], errors[index] = count, size, failed
+        if rate > 0:
+            time.sleep(max(TICK - (time.time() - now), 0))
+    sock.close()
+
+
+def summarize(args, workers, sent, sent_bytes, errors, stop):
+    """ Print the achieved rate every interval until the duration or count is
+    reached or the workers are gone.
+
+    :return: (messages, bytes, errors, seconds, peak rate)
+    """
+    profile = Profile(args.profile, args.rate, args.start_rate,
+                      args.ramp_seconds, args.step_seconds)
+    start = last = time.time()
+    last_count = last_bytes = 0
+    peak = 0.0
+    try:
+        while True:
+            time.sleep(min(args.interval, 0.1) if args.count else
+                       args.interval)
+            now = time.time()
+            count, size = sum(sent), sum(sent_bytes)
+            done = (args.duration and now - start >= args.duration) or (
+                args.count and count + sum(errors) >= args.count) or not any(
+                w.is_alive() for w in workers)
+            if now - last >= args.interval or done:
+                rate = (count - last_count) / (now - last)
+                peak = max(peak, rate)
+                target = profile(now - start)
+                print("%7.1fs  %10.0f msg/s  target %10s  total %12d  "
+                      "%8.2f MB/s  errors %d"
+                      % (now - start, rate,
+                         '%.0f' % target if target else 'max', count,
+                         (size - last_bytes) / (now - last) / 1e6,
+                         sum(errors)))
+                sys.stdout.flush()
+                last, last_count, last_bytes = now, count, size
+            if done:
+                break
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    return sum(sent), sum(sent_bytes), sum(errors), time.time() - start, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n'.join(__doc__.split('\n')[2:]))
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=514)
+    parser.add_argument('--proto', choices=('udp', 'tcp'), default='udp')
+    parser.add_argument('--format', choices=('rfc3164', 'rfc5424'),
+                        default='rfc3164')
+    parser.add_argument('--framing', choices=('none', 'newline', 'octet'),
+                        help='message framing, by default none on UDP, '
+                             'newline on TCP w/ RFC3164 and octet counting '
+                             'w/ RFC5424')
+    parser.add_argument('--hostname', default=socket.gethostname())
+    parser.add_argument('--mix', default='firewall=1,nat=1',
+                        help='programs and weights (default %(default)s)')
+    parser.add_argument('--rate', type=float, default=1000,
+                        help='target messages per second, 0 for max')
+    parser.add_argument('--profile', default='constant',
+                        help='constant, ramp or steps:R1,R2,...')
+    parser.add_argument('--start-rate', type=float, default=0,
+                        help='first rate of the ramp profile')
+    parser.add_argument('--ramp-seconds', type=float, default=60)
+    parser.add_argument('--step-seconds', type=float, default=60)
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--duration', type=float, default=0,
+                        help='seconds to run, 0 until interrupted')
+    parser.add_argument('--count', type=int, default=0,
+                        help='messages to send, 0 for no limit')
+    parser.add_argument('--interval', type=float, default=5,
+                        help='seconds between two summaries')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.framing is None:
+        args.framing = 'none' if args.proto == 'udp' else (
+            'octet' if args.format == 'rfc5424' else 'newline')
+    try:
+        parse_mix(args.mix)
+        Profile(args.profile, args.rate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    sent = multiprocessing.Array('L', args.processes, lock=False)
+    sent_bytes = multiprocessing.Array('L', args.processes, lock=False)
+    errors = multiprocessing.Array('L', args.processes, lock=False)
+    stop = multiprocessing.Event()
+    workers = [multiprocessing.Process(
+        target=worker, args=(i, args, sent, sent_bytes, errors, stop))
+        for i in range(args.processes)]
+    for w in workers:
+        w.daemon = True
+        w.start()
+
+    count, size, failed, elapsed, peak = summarize(args, workers, sent,
+                                                   sent_bytes, errors, stop)
+    for w in workers:
+        w.join(5)
+    count, size, failed = sum(sent), sum(sent_bytes), sum(errors)
+    print("Sent %d messages (%.1f MB) in %.1fs: %.0f msg/s on average, "
+          "%.0f msg/s peak, %d errors"
+          % (count, size / 1e6, elapsed, count / elapsed, peak, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())